@@ -4,6 +4,7 @@ current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentfra
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 import main
+import sweep
 import optparse
 import random
 
@@ -17,22 +18,29 @@ from sumolib import checkBinary  # noqa
 import traci  # noqa
 import randomTrips  # noqa
 
-def generate_trips(seed):
+# Writes the random trips for one simulation into its output folder, returning the route files to load
+def generate_trips(seed, outputDir):
+    routeFile = os.path.join(outputDir, 'randroutes.rou.xml')
+
     randomTrips.main(randomTrips.get_options([
         '-n', 'data/EVGrid.net.xml',
-        '--route-file', 'data/randroutes.rou.xml',
+        '--route-file', routeFile,
+        '-o', os.path.join(outputDir, 'trips.trips.xml'),
         '--prefix', 'V',
         '-e', '400',
         '-p', '100',
         '--flows', '100',
         '--random',
         '--binomial', '4',
-        '--seed', str(x)
+        '--seed', str(seed)
     ]))
 
+    return 'data/electricvehicles.rou.xml,' + routeFile
+
 # Script entry point
 if __name__ == "__main__":
     options = main.get_options()
+    main.configureLogging(options)
 
     # Define starting batterys wish EVs to have in simulation
     batterys = [500, 1250, 2250]
@@ -45,23 +53,15 @@ if __name__ == "__main__":
     else:
         sumoBinary = checkBinary('sumo-gui')
 
-    main.clearOutput()
     main.add_ev_vtype()
 
-    for p in paramTypes:
-        for b in batterys:
-            print('Evaluating for battery capacity: ', str(b))
-            for x in range(options.c):
-                # Generates electric vehicle route and random trips
-                generate_trips(x)
-
-                # this is the normal way of using traci. sumo is started as a
-                # subprocess and then the python script connects and runs
-                traci.start([sumoBinary, "-c", "data/EVGrid.sumocfg",
-                                         "--tripinfo-output", "data/tripinfo.xml", "--additional-files", "data/EVGrid_additionals.add.xml",
-                                         "--chargingstations-output", "data/EVGrid_chargingstations.xml", "--no-warnings",
-                                         "--seed", str(x)])
+    # Each weighting, battery and seed combination runs as its own simulation, options.jobs at a time
+    config = {
+        'sumoBinary': sumoBinary,
+        'sumocfg': 'data/EVGrid.sumocfg',
+        'netFile': 'data/EVGrid.net.xml',
+        'additionalFile': 'data/EVGrid_additionals.add.xml',
+        'generateTrips': generate_trips
+    }
 
-                main.run(netFile='data/EVGrid.net.xml',
-                         additionalFile='data/EVGrid_additionals.add.xml',
-                         options=options, batteryCapacity=b, paramType=p, seed=x)
+    sweep.runSweep(config, options, paramTypes, batterys)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci
+
+# Battery state of one EV, read once before its route is planned so the searches never have to
+# go back to TraCI for it
+class BatteryProfile:
+    def __init__(self, batteryCapacity, maxBatteryCapacity):
+        self.BatteryCapacity = batteryCapacity
+        self.MaxBatteryCapacity = maxBatteryCapacity
+
+    @classmethod
+    def fromVehicle(cls, vehicleID):
+        return cls(float(traci.vehicle.getParameter(vehicleID, 'device.battery.actualBatteryCapacity')),
+                   float(traci.vehicle.getParameter(vehicleID, 'device.battery.maximumBatteryCapacity')))
+
+    # Profile for an EV not yet in the simulation, with the maximum capacity of its vType
+    @classmethod
+    def fromVehicleType(cls, typeID, batteryCapacity):
+        return cls(float(batteryCapacity), float(traci.vehicletype.getParameter(typeID, 'maximumBatteryCapacity')))
@@ -15,6 +15,7 @@ class ChargingStation:
         self.DistanceFromStart = 0
         self.DistanceFromDivider = 0
         self.Score = 0
+        self.ProfilePicks = None
 
     def __str__(self):
         return '[' + (str(self.id) + ", " + str(self.Lane)
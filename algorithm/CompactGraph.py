@@ -0,0 +1,221 @@
+import sys
+import numpy as np
+from collections.abc import Mapping
+
+# Array backed copy of the evehicle road graph the searches run on
+# Nodes and edges are mapped to integer indices, adjacency is stored in CSR form where the
+# outgoing edges of node i are Targets[Offsets[i]:Offsets[i + 1]], in the same order as the
+# dict based Graph.NodeNeighbours. Junction lengths are keyed by the from and to edge indices
+# as fromEdge * EdgeCount + toEdge
+class CompactGraph:
+    def __init__(self, nodeIDs, nodeCoords, nodeNeighbours, connectionLengths):
+        self.NodeIDs = list(nodeIDs)
+        self.NodeIndex = {id: i for i, id in enumerate(self.NodeIDs)}
+        self.NodeCount = len(self.NodeIDs)
+
+        self.NodeX = np.array([coords[0] for coords in nodeCoords], dtype=np.float64)
+        self.NodeY = np.array([coords[1] for coords in nodeCoords], dtype=np.float64)
+
+        offsets = [0]
+        targets = []
+        lengths = []
+        edgeIDs = []
+
+        for id in self.NodeIDs:
+            for connection in nodeNeighbours.get(id) or []:
+                targets.append(self.NodeIndex[connection['Neighbour']])
+                lengths.append(connection['Length'])
+                edgeIDs.append(connection['ConnectingEdge'])
+
+            offsets.append(len(targets))
+
+        self.Offsets = np.array(offsets, dtype=np.int32)
+        self.Targets = np.array(targets, dtype=np.int32)
+        self.Sources = np.repeat(np.arange(self.NodeCount, dtype=np.int32), np.diff(self.Offsets))
+        self.Lengths = np.array(lengths, dtype=np.float64)
+        self.EdgeIDs = edgeIDs
+        self.EdgeIndex = {id: i for i, id in enumerate(edgeIDs)}
+        self.EdgeCount = len(edgeIDs)
+        self.SpeedIndex = None
+
+        # List copies for fast scalar reads in the search loops
+        self.OffsetList = offsets
+        self.TargetList = targets
+        self.SourceList = self.Sources.tolist()
+        self.LengthList = lengths
+        self.NodeXList = self.NodeX.tolist()
+        self.NodeYList = self.NodeY.tolist()
+
+        # Node pair to edge index, keeps the first edge like Graph.getNodeEdge did
+        self.PairEdge = {}
+
+        for i in range(self.EdgeCount):
+            self.PairEdge.setdefault(self.SourceList[i] * self.NodeCount + targets[i], i)
+
+        self.ConnectionLengths = {}
+
+        for (fromEdge, toEdge), length in connectionLengths.items():
+            fromIndex = self.EdgeIndex.get(fromEdge)
+            toIndex = self.EdgeIndex.get(toEdge)
+
+            if fromIndex != None and toIndex != None:
+                self.ConnectionLengths[fromIndex * self.EdgeCount + toIndex] = length
+
+    # Builds the compact graph from a dict based Graph
+    @classmethod
+    def fromGraph(cls, graph):
+        return cls(graph.NodeIDs, [graph.NodeCoords[node] for node in graph.NodeIDs], graph.NodeNeighbours, graph.ConnectionLengths)
+
+    # Outgoing edge indices of a node index
+    def outgoing(self, node):
+        return range(self.OffsetList[node], self.OffsetList[node + 1])
+
+    # Index of the edge between two node indices, None if not connected
+    def getEdgeIndex(self, fromNode, toNode):
+        return self.PairEdge.get(fromNode * self.NodeCount + toNode)
+
+    # Same result as Graph.getNodeEdge, looked up in constant time
+    def getNodeEdge(self, fromNode, toNode):
+        edge = self.getEdgeIndex(self.NodeIndex[fromNode], self.NodeIndex[toNode])
+        return self.connection(edge) if edge != None else None
+
+    # Length of the internal lane joining two edge indices, None if they are not connected
+    def getConnectionLength(self, fromEdge, toEdge):
+        return self.ConnectionLengths.get(fromEdge * self.EdgeCount + toEdge)
+
+    # Dict for an edge index in the form used by Graph.NodeNeighbours
+    def connection(self, edge):
+        return {
+            'Neighbour': self.NodeIDs[self.TargetList[edge]],
+            'ConnectingEdge': self.EdgeIDs[edge],
+            'Length': self.LengthList[edge]
+        }
+
+    # Position of every edge in a list of edge IDs, None if one of the edges is not in it
+    def getEdgePositions(self, edgeIndex):
+        positions = [edgeIndex.get(edge) for edge in self.EdgeIDs]
+
+        return None if None in positions else positions
+
+    # Travel time of every edge from an edge speed snapshot, a stopped edge costs nothing like
+    # in the A* search
+    def getTravelTimes(self, speeds):
+        if self.SpeedIndex is None:
+            self.SpeedIndex = np.array([speeds.EdgeIndex[edge] for edge in self.EdgeIDs], dtype=np.int64)
+
+        edgeSpeeds = speeds.Speeds[self.SpeedIndex]
+
+        return np.divide(self.Lengths, edgeSpeeds, out=np.zeros_like(self.Lengths), where=edgeSpeeds != 0)
+
+    def getCoord(self, node):
+        return (self.NodeXList[node], self.NodeYList[node])
+
+    # Bytes held by the array buffers and index dicts
+    # Bytes held by the arrays, lists and dicts with the ints and floats in them. The id strings
+    # are shared with the Graph and are not counted
+    def memoryUsage(self):
+        arrays = self.NodeX.nbytes + self.NodeY.nbytes + self.Offsets.nbytes + self.Targets.nbytes \
+            + self.Sources.nbytes + self.Lengths.nbytes
+
+        lists = [self.NodeIDs, self.EdgeIDs, self.OffsetList, self.TargetList, self.SourceList, self.LengthList,
+                 self.NodeXList, self.NodeYList]
+        dicts = [self.NodeIndex, self.EdgeIndex, self.PairEdge, self.ConnectionLengths]
+        numbers = {}
+
+        for values in lists + [d.keys() for d in dicts] + [d.values() for d in dicts]:
+            for value in values:
+                if not isinstance(value, str):
+                    numbers[id(value)] = sys.getsizeof(value)
+
+        return arrays + sum(sys.getsizeof(container) for container in lists + dicts) + sum(numbers.values())
+
+    def neighbourView(self):
+        return NeighbourView(self)
+
+    def coordView(self):
+        return CoordView(self)
+
+    def connectionView(self):
+        return ConnectionView(self)
+
+# Read only mapping with the same shape as Graph.NodeNeighbours, the per node lists of
+# dicts are built on access from the compact arrays
+class NeighbourView(Mapping):
+    def __init__(self, compactGraph):
+        self.Compact = compactGraph
+
+    def __getitem__(self, id):
+        node = self.Compact.NodeIndex[id]
+
+        if self.Compact.OffsetList[node] == self.Compact.OffsetList[node + 1]:
+            raise KeyError(id)
+
+        return [self.Compact.connection(edge) for edge in self.Compact.outgoing(node)]
+
+    def __iter__(self):
+        degrees = np.diff(self.Compact.Offsets)
+        return (self.Compact.NodeIDs[node] for node in np.flatnonzero(degrees))
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.Compact.Offsets)))
+
+# Read only mapping of node IDs to (x, y) like Graph.NodeCoords
+class CoordView(Mapping):
+    def __init__(self, compactGraph):
+        self.Compact = compactGraph
+
+    def __getitem__(self, id):
+        return self.Compact.getCoord(self.Compact.NodeIndex[id])
+
+    def __iter__(self):
+        return iter(self.Compact.NodeIDs)
+
+    def __len__(self):
+        return self.Compact.NodeCount
+
+# Read only mapping of (fromEdge, toEdge) to junction length like Graph.ConnectionLengths,
+# covering the connections between evehicle edges
+class ConnectionView(Mapping):
+    def __init__(self, compactGraph):
+        self.Compact = compactGraph
+
+    def __getitem__(self, edges):
+        fromEdge = self.Compact.EdgeIndex.get(edges[0])
+        toEdge = self.Compact.EdgeIndex.get(edges[1])
+
+        if fromEdge == None or toEdge == None or fromEdge * self.Compact.EdgeCount + toEdge not in self.Compact.ConnectionLengths:
+            raise KeyError(edges)
+
+        return self.Compact.ConnectionLengths[fromEdge * self.Compact.EdgeCount + toEdge]
+
+    def __iter__(self):
+        edgeIDs = self.Compact.EdgeIDs
+        edgeCount = self.Compact.EdgeCount
+
+        return ((edgeIDs[key // edgeCount], edgeIDs[key % edgeCount]) for key in self.Compact.ConnectionLengths)
+
+    def __len__(self):
+        return len(self.Compact.ConnectionLengths)
+
+# Read only mapping of edge IDs to a value per edge like Graph.EdgeFrom, EdgeTo and EdgeLengths
+# Values are read from an array by the edge's position in the index, and looked up in labels
+# when given, so node indices come back as node IDs
+class EdgeView(Mapping):
+    def __init__(self, edgeIndex, values, labels=None):
+        self.EdgeIndex = edgeIndex
+        self.Values = values
+        self.Labels = labels
+
+    def __getitem__(self, id):
+        value = self.Values[self.EdgeIndex[id]]
+
+        if self.Labels != None:
+            return self.Labels[value]
+
+        return float(value)
+
+    def __iter__(self):
+        return iter(self.EdgeIndex)
+
+    def __len__(self):
+        return len(self.EdgeIndex)
@@ -0,0 +1,501 @@
+import heapq
+import threading
+import numpy as np
+
+# Parts of the road graph with at most this many nodes are not split any further
+LEAF_SIZE = 16
+
+# Directions a part's nodes are split in half along, the one with the smallest separator is used
+SPLIT_DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+# Customizable contraction hierarchy over the compact evehicle graph
+# Preprocessing only depends on the road layout. Nodes are ordered by nested dissection on their
+# co-ordinates: each connected part of the graph is split in half along the direction that puts
+# the fewest nodes on the cut, and those separator nodes are ranked above both halves. Nodes are
+# contracted in that order, adding a shortcut arc between every pair of a node's higher ranked
+# neighbours. Every arc joins a lower to a higher ranked node and carries an up weight (low to
+# high) and a down weight (high to low). The order, arcs and lower triangles are integer arrays
+# kept in a cache file next to the graph cache.
+# Customization fills the arc weights from edge travel times. Triangles are grouped into levels
+# that never write an arc another triangle of the same level reads, so each level is one
+# vectorised pass. A customization is swapped in whole, so queries on other threads each run on
+# one set of weights, and is run again at most every interval steps as the speeds change.
+# Queries are a bidirectional Dijkstra over upward arcs only
+class ContractionHierarchy:
+    def __init__(self, graph, compactGraph, interval=1):
+        self.Graph = graph
+        self.Compact = compactGraph
+        self.Interval = max(1, interval)
+
+        topology = graph.readCache('hierarchycache')
+
+        if topology == None or len(topology['Rank']) != compactGraph.NodeCount:
+            topology = self.buildTopology()
+            graph.writeCache('hierarchycache', topology)
+
+        self.setTopology(topology)
+
+        self.Version = None
+        self.RefreshStep = None
+        self.Customizations = 0
+        self.Queries = 0
+        self.Settled = 0
+        self.Lock = threading.Lock()
+
+        # Free flow travel times until the first speed snapshot arrives
+        self.customize(compactGraph.Lengths / graph.MaxSpeed)
+
+    # Order, arcs and triangles of the hierarchy as integer arrays, all that is cached
+    def buildTopology(self):
+        compact = self.Compact
+        keep = compact.Sources != compact.Targets
+        pairs = np.unique(np.sort(np.stack((compact.Sources[keep], compact.Targets[keep]), axis=1), axis=1), axis=0)
+
+        rank = self.orderNodes(pairs)
+        upNeighbours, levels = self.contract(rank, pairs)
+
+        # Arcs grouped by their low node, each node's arcs in rank order of their high node
+        arcOffsets = np.zeros(compact.NodeCount + 1, dtype=np.int64)
+        arcOffsets[1:] = np.cumsum([len(neighbours) for neighbours in upNeighbours])
+        arcHigh = np.fromiter((neighbour for neighbours in upNeighbours for neighbour in sorted(neighbours, key=rank.__getitem__)),
+                              dtype=np.int32, count=int(arcOffsets[-1]))
+        arcLow = np.repeat(np.arange(compact.NodeCount, dtype=np.int32), np.diff(arcOffsets))
+        arcKeys = arcLow.astype(np.int64) * compact.NodeCount + arcHigh
+        keyOrder = np.argsort(arcKeys)
+
+        def findArcs(low, high):
+            return keyOrder[np.searchsorted(arcKeys, low.astype(np.int64) * compact.NodeCount + high, sorter=keyOrder)]
+
+        # Original edges by the arc they lie on and whether they run up or down it
+        sources = compact.Sources
+        targets = compact.Targets
+        edgeUp = rank[sources] < rank[targets]
+        edgeArcs = np.full(compact.EdgeCount, -1, dtype=np.int64)
+        edgeArcs[keep] = findArcs(np.where(edgeUp, sources, targets)[keep], np.where(edgeUp, targets, sources)[keep])
+
+        # Lower triangles, each as the arcs from its lowest node to the two higher ones and the arc
+        # between them, built for all nodes with the same number of arcs at once
+        degrees = np.diff(arcOffsets)
+        lowerArcs = [np.zeros(0, dtype=np.int32)]
+        higherArcs = [np.zeros(0, dtype=np.int32)]
+        topArcs = [np.zeros(0, dtype=np.int32)]
+
+        for degree in np.unique(degrees[degrees >= 2]).tolist():
+            nodeArcs = (arcOffsets[:-1][degrees == degree][:, None] + np.arange(degree)).astype(np.int32)
+            lower, higher = np.triu_indices(degree, 1)
+            lowerArcs.append(nodeArcs[:, lower].ravel())
+            higherArcs.append(nodeArcs[:, higher].ravel())
+            topArcs.append(findArcs(arcHigh[lowerArcs[-1]], arcHigh[higherArcs[-1]]).astype(np.int32))
+
+        lowerArcs = np.concatenate(lowerArcs)
+        higherArcs = np.concatenate(higherArcs)
+        topArcs = np.concatenate(topArcs)
+
+        # Triangles in level order of their lowest node
+        triangleLevels = levels.astype(np.int32)[arcLow[lowerArcs]]
+        order = np.argsort(triangleLevels, kind='stable')
+
+        return {
+            'Rank': rank,
+            'ArcOffsets': arcOffsets,
+            'ArcHigh': arcHigh,
+            'EdgeArcs': edgeArcs,
+            'EdgeUp': edgeUp & keep,
+            'TriangleLower': lowerArcs[order],
+            'TriangleHigher': higherArcs[order],
+            'TriangleTop': topArcs[order],
+            'LevelOffsets': np.searchsorted(triangleLevels[order], np.arange(int(levels.max()) + 2) if len(levels) > 0 else [0])
+        }
+
+    def setTopology(self, topology):
+        self.Rank = topology['Rank']
+        self.ArcOffsets = topology['ArcOffsets']
+        self.ArcHigh = topology['ArcHigh']
+        self.ArcLow = np.repeat(np.arange(self.Compact.NodeCount, dtype=np.int32), np.diff(self.ArcOffsets))
+        self.ArcCount = len(self.ArcHigh)
+        self.EdgeArcs = topology['EdgeArcs']
+        self.EdgeUp = topology['EdgeUp']
+        self.TriangleLower = topology['TriangleLower']
+        self.TriangleHigher = topology['TriangleHigher']
+        self.TriangleTop = topology['TriangleTop']
+        self.LevelOffsets = topology['LevelOffsets'].tolist()
+
+        # List copies for fast scalar reads in the queries
+        self.ArcOffsetList = self.ArcOffsets.tolist()
+        self.ArcHighList = self.ArcHigh.tolist()
+        self.ArcLowList = self.ArcLow.tolist()
+
+    # Nested dissection order over the undirected road graph, given as (low, high) node pairs
+    # Parts are taken off a stack and their separators given the highest ranks left, so every
+    # separator ranks above the parts it splits. Parts in more than one piece are split into their
+    # connected pieces without a separator, small parts are ranked by their degree
+    def orderNodes(self, pairs):
+        nodeCount = self.Compact.NodeCount
+        rank = np.zeros(nodeCount, dtype=np.int64)
+        scratch = np.zeros(nodeCount, dtype=np.int64)
+        nextRank = nodeCount
+        parts = [(np.arange(nodeCount), pairs[:, 0], pairs[:, 1])]
+
+        while len(parts) > 0:
+            nodes, low, high = parts.pop()
+            scratch[nodes] = np.arange(len(nodes))
+            low = scratch[low]
+            high = scratch[high]
+
+            if len(nodes) <= LEAF_SIZE:
+                degrees = np.bincount(np.concatenate((low, high)), minlength=len(nodes))
+                separator = np.argsort(degrees, kind='stable')
+                labels = np.full(len(nodes), -1)
+            else:
+                labels, count = self.getComponents(len(nodes), low, high)
+                separator = np.zeros(0, dtype=np.int64)
+
+                if count == 1:
+                    separator, labels = self.bisect(nodes, low, high)
+
+            rank[nodes[separator]] = np.arange(nextRank - len(separator), nextRank)
+            nextRank -= len(separator)
+            parts += self.splitPart(nodes, low, high, labels)
+
+        return rank
+
+    # Connected piece of each node of a part, with nodes and pairs given as local indices
+    def getComponents(self, nodeCount, low, high):
+        ends = np.concatenate((low, high))
+        others = np.concatenate((high, low))
+        order = np.argsort(ends, kind='stable')
+        offsets = np.searchsorted(ends[order], np.arange(nodeCount + 1)).tolist()
+        neighbours = others[order].tolist()
+        labels = [-1] * nodeCount
+        count = 0
+
+        for node in range(nodeCount):
+            if labels[node] != -1:
+                continue
+
+            labels[node] = count
+            stack = [node]
+
+            while len(stack) > 0:
+                current = stack.pop()
+
+                for neighbour in neighbours[offsets[current]:offsets[current + 1]]:
+                    if labels[neighbour] == -1:
+                        labels[neighbour] = count
+                        stack.append(neighbour)
+
+            count += 1
+
+        return np.array(labels), count
+
+    # Splits a connected part at the median of its nodes along each of SPLIT_DIRECTIONS, and
+    # keeps the split whose smaller side of nodes with a neighbour across the cut is smallest
+    # Returns the separator and each node's half, -1 for the separator
+    def bisect(self, nodes, low, high):
+        projectionX = self.Compact.NodeX[nodes]
+        projectionY = self.Compact.NodeY[nodes]
+        best = None
+
+        for directionX, directionY in SPLIT_DIRECTIONS:
+            order = np.argsort(projectionX * directionX + projectionY * directionY, kind='stable')
+            side = np.zeros(len(nodes), dtype=np.int64)
+            side[order[len(nodes) // 2:]] = 1
+
+            cut = side[low] != side[high]
+            ends = np.concatenate((low[cut], high[cut]))
+            first = np.unique(ends[side[ends] == 0])
+            second = np.unique(ends[side[ends] == 1])
+            separator = first if len(first) <= len(second) else second
+
+            if best == None or len(separator) < len(best[0]):
+                best = (separator, side)
+
+        separator, labels = best
+        labels[separator] = -1
+
+        return separator, labels
+
+    # Parts for each label of a part's nodes, with the pairs inside each, nodes labelled -1 are
+    # left out. Pairs come in and go out with global node indices
+    def splitPart(self, nodes, low, high, labels):
+        if len(labels) == 0 or labels.max() < 0:
+            return []
+
+        count = int(labels.max()) + 1
+        lowLabels = labels[low]
+        keep = (lowLabels == labels[high]) & (lowLabels >= 0)
+        pairLabels = lowLabels[keep]
+        low = nodes[low[keep]]
+        high = nodes[high[keep]]
+
+        nodeOrder = np.argsort(labels, kind='stable')
+        pairOrder = np.argsort(pairLabels, kind='stable')
+        nodeBounds = np.searchsorted(labels[nodeOrder], np.arange(count + 1))
+        pairBounds = np.searchsorted(pairLabels[pairOrder], np.arange(count + 1))
+
+        return [(nodes[nodeOrder[nodeBounds[i]:nodeBounds[i + 1]]], low[pairOrder[pairBounds[i]:pairBounds[i + 1]]],
+                 high[pairOrder[pairBounds[i]:pairBounds[i + 1]]]) for i in range(count)]
+
+    # Higher ranked neighbours of each node once the nodes below it are contracted, and the
+    # customization level of each node
+    # A contracted node's higher neighbours are joined into a clique, which only needs them added
+    # to its lowest higher neighbour as the rest follows when that one is contracted. A node's
+    # level is one above the highest level of the nodes below it, so a node's arcs are final once
+    # every level below it is customized
+    def contract(self, rank, pairs):
+        nodeCount = self.Compact.NodeCount
+        rankList = rank.tolist()
+        upNeighbours = [set() for node in range(nodeCount)]
+
+        for low, high in pairs.tolist():
+            if rankList[low] < rankList[high]:
+                upNeighbours[low].add(high)
+            else:
+                upNeighbours[high].add(low)
+
+        levels = [0] * nodeCount
+
+        for node in np.argsort(rank).tolist():
+            neighbours = upNeighbours[node]
+
+            if len(neighbours) == 0:
+                continue
+
+            level = levels[node] + 1
+
+            for neighbour in neighbours:
+                if levels[neighbour] < level:
+                    levels[neighbour] = level
+
+            parent = min(neighbours, key=rankList.__getitem__)
+            upNeighbours[parent].update(neighbour for neighbour in neighbours if neighbour != parent)
+
+        return upNeighbours, np.array(levels, dtype=np.int64)
+
+    # Sets the arc weights from per edge travel times
+    # Arcs start at the cheapest original edge along them, then each level of triangles lowers
+    # the arcs between their two higher nodes. A shortcut keeps the first triangle of the level
+    # that gave its weight, the route it stands for is read back through it
+    def customize(self, weights):
+        up = np.full(self.ArcCount, np.inf)
+        down = np.full(self.ArcCount, np.inf)
+        np.minimum.at(up, self.EdgeArcs[self.EdgeUp], weights[self.EdgeUp])
+        downEdges = (~self.EdgeUp) & (self.EdgeArcs >= 0)
+        np.minimum.at(down, self.EdgeArcs[downEdges], weights[downEdges])
+
+        upEdge = self.getArcEdges(up, self.EdgeUp, weights)
+        downEdge = self.getArcEdges(down, downEdges, weights)
+        upVia = np.full(self.ArcCount, -1, dtype=np.int64)
+        downVia = np.full(self.ArcCount, -1, dtype=np.int64)
+
+        for level in range(len(self.LevelOffsets) - 1):
+            first = self.LevelOffsets[level]
+            last = self.LevelOffsets[level + 1]
+
+            if first == last:
+                continue
+
+            lower = self.TriangleLower[first:last]
+            higher = self.TriangleHigher[first:last]
+            top = self.TriangleTop[first:last]
+
+            # Lower to higher end of the top arc through the triangle's lowest node, and back
+            upWeights = down[lower] + up[higher]
+            downWeights = down[higher] + up[lower]
+
+            self.relax(up, upVia, top, upWeights, first)
+            self.relax(down, downVia, top, downWeights, first)
+
+        self.TravelTimes = weights
+        self.Customized = Customization(up.tolist(), down.tolist(), upVia, downVia, upEdge, downEdge)
+        self.Customizations += 1
+
+    # Lowers arc weights to the weights through a level's triangles, keeping the first triangle
+    # to improve each arc
+    def relax(self, arcWeights, arcVia, arcs, candidates, first):
+        previous = arcWeights[arcs]
+        np.minimum.at(arcWeights, arcs, candidates)
+
+        improved = np.flatnonzero((candidates < previous) & (candidates == arcWeights[arcs]))
+        improvedArcs, firstImproved = np.unique(arcs[improved], return_index=True)
+        arcVia[improvedArcs] = first + improved[firstImproved]
+
+    # First edge index with the cheapest weight along each arc, -1 where there is none
+    def getArcEdges(self, arcWeights, mask, weights):
+        arcEdges = np.full(self.ArcCount, -1, dtype=np.int64)
+        edges = np.flatnonzero(mask)
+        edges = edges[weights[edges] == arcWeights[self.EdgeArcs[edges]]]
+        arcs, first = np.unique(self.EdgeArcs[edges], return_index=True)
+        arcEdges[arcs] = edges[first]
+
+        return arcEdges
+
+    # Customizes again when the speed snapshot has refreshed since the last customization, at most
+    # once every Interval steps and only when some travel time changed
+    def refresh(self, speeds):
+        if speeds.Version == self.Version:
+            return
+
+        if self.RefreshStep != None and abs(speeds.RefreshStep - self.RefreshStep) < self.Interval:
+            return
+
+        self.Version = speeds.Version
+        self.RefreshStep = speeds.RefreshStep
+        weights = self.Compact.getTravelTimes(speeds)
+
+        if not np.array_equal(weights, self.TravelTimes):
+            self.customize(weights)
+
+    # Fastest route between two nodes as edge IDs with its length including junctions, in the
+    # form reconstructRoutePath gives, or None, 0 when the end cannot be reached, and the number
+    # of nodes the query settled
+    def query(self, start, end):
+        startNode = self.Compact.NodeIndex[start]
+        endNode = self.Compact.NodeIndex[end]
+        customization = self.Customized
+
+        if startNode == endNode:
+            self.recordQuery(0)
+            return [], 0, 0
+
+        # Forward search runs up arcs with their up weights, backward search runs up arcs with
+        # their down weights as it follows routes into the end node in reverse
+        arcOffsets = self.ArcOffsetList
+        arcHigh = self.ArcHighList
+        costs = ({startNode: 0}, {endNode: 0})
+        parents = ({}, {})
+        settled = (set(), set())
+        heaps = ([(0, startNode)], [(0, endNode)])
+        weights = (customization.Up, customization.Down)
+        best = np.inf
+        meeting = None
+        settledCount = 0
+
+        while True:
+            side = self.getNextSide(heaps)
+
+            if side == None or heaps[side][0][0] >= best:
+                break
+
+            cost, node = heapq.heappop(heaps[side])
+
+            if node in settled[side]:
+                continue
+
+            settled[side].add(node)
+            settledCount += 1
+
+            otherCost = costs[1 - side].get(node)
+
+            if otherCost != None and cost + otherCost < best:
+                best = cost + otherCost
+                meeting = node
+
+            sideCosts = costs[side]
+            sideWeights = weights[side]
+
+            for arc in range(arcOffsets[node], arcOffsets[node + 1]):
+                high = arcHigh[arc]
+                newCost = cost + sideWeights[arc]
+
+                if newCost < sideCosts.get(high, np.inf):
+                    sideCosts[high] = newCost
+                    parents[side][high] = arc
+                    heapq.heappush(heaps[side], (newCost, high))
+
+        self.recordQuery(settledCount)
+
+        if meeting == None:
+            return None, 0, settledCount
+
+        route = self.unpackSearch(customization, parents[0], meeting, True)
+        route += self.unpackSearch(customization, parents[1], meeting, False)
+
+        return route, self.Graph.getRouteLength(route), settledCount
+
+    def recordQuery(self, settled):
+        with self.Lock:
+            self.Queries += 1
+            self.Settled += settled
+
+    # Side with the cheapest next entry, None when both searches have run out
+    def getNextSide(self, heaps):
+        if len(heaps[0]) == 0:
+            return None if len(heaps[1]) == 0 else 1
+
+        if len(heaps[1]) == 0 or heaps[0][0][0] <= heaps[1][0][0]:
+            return 0
+
+        return 1
+
+    # Edge IDs along one search's parent arcs between where it started and the meeting node, in
+    # driving order. The forward search drove its arcs up, the backward search down
+    def unpackSearch(self, customization, parents, node, forward):
+        arcs = []
+
+        while node in parents:
+            arc = parents[node]
+            arcs.append(arc)
+            node = self.ArcLowList[arc]
+
+        if forward:
+            arcs.reverse()
+
+        route = []
+
+        for arc in arcs:
+            route += self.unpackArc(customization, arc, forward)
+
+        return route
+
+    # Edge IDs of the route an arc stands for, driven up from its low to its high node or down
+    # Shortcuts are split through the triangle that gave their weight: going up from x to y
+    # through lowest node v drives down the arc (v, x) then up the arc (v, y), and the reverse
+    # going down
+    def unpackArc(self, customization, arc, up):
+        edges = []
+        stack = [(arc, up)]
+
+        while len(stack) > 0:
+            arc, up = stack.pop()
+            via = customization.UpVia[arc] if up else customization.DownVia[arc]
+
+            if via == -1:
+                edges.append(self.Compact.EdgeIDs[customization.UpEdge[arc] if up else customization.DownEdge[arc]])
+            elif up:
+                stack.append((self.TriangleHigher[via], True))
+                stack.append((self.TriangleLower[via], False))
+            else:
+                stack.append((self.TriangleLower[via], True))
+                stack.append((self.TriangleHigher[via], False))
+
+        return edges
+
+    # Bytes held by the order, arc and triangle arrays
+    def memoryUsage(self):
+        return self.Rank.nbytes + self.ArcOffsets.nbytes + self.ArcHigh.nbytes + self.ArcLow.nbytes + self.EdgeArcs.nbytes \
+            + self.EdgeUp.nbytes + self.TriangleLower.nbytes + self.TriangleHigher.nbytes + self.TriangleTop.nbytes
+
+    def getStats(self):
+        return {
+            'Nodes': self.Compact.NodeCount,
+            'Edges': self.Compact.EdgeCount,
+            'Arcs': self.ArcCount,
+            'Triangles': len(self.TriangleTop),
+            'Levels': len(self.LevelOffsets) - 1,
+            'TopologyBytes': self.memoryUsage(),
+            'Customizations': self.Customizations,
+            'Queries': self.Queries,
+            'MeanSettled': self.Settled / self.Queries if self.Queries > 0 else 0
+        }
+
+# Arc weights of one customization with the triangle each shortcut's weight came through and the
+# original edge of each arc, -1 where there is none
+class Customization:
+    def __init__(self, up, down, upVia, downVia, upEdge, downEdge):
+        self.Up = up
+        self.Down = down
+        self.UpVia = upVia
+        self.DownVia = downVia
+        self.UpEdge = upEdge
+        self.DownEdge = downEdge
@@ -0,0 +1,259 @@
+import heapq
+import numpy as np
+from multiprocessing import Pool
+from algorithm.EnergyModel import EnergyModel
+
+# Roots each worker process gets on average, more balance the load at a little overhead
+CHUNKS_PER_JOB = 4
+
+# Arrays of the search direction a worker process runs, set up once by initSearch
+worker = {}
+
+# Travel time, distance and energy from many nodes to many nodes over the compact evehicle graph
+# One Dijkstra on travel time is run from each node of the smaller side, forwards from sources or
+# backwards over incoming edges from targets, and stops once every node of the other side is
+# settled. Distance and energy from the energy model are summed along the quickest route, over
+# edges only like the station trees. Searches are split over worker processes when there are jobs to spare. Weights
+# are free flow travel times until the first refresh with a speed snapshot
+class CostMatrix:
+    def __init__(self, graph, energy=None, jobs=1):
+        self.Graph = graph
+        self.Compact = graph.Compact
+        self.Energy = energy if energy != None else EnergyModel(graph)
+        self.Jobs = max(1, jobs)
+
+        compact = self.Compact
+
+        # Incoming edges of node i are IncomingEdges[IncomingOffsets[i]:IncomingOffsets[i + 1]]
+        self.IncomingEdges = np.argsort(compact.Targets, kind='stable').astype(np.int32)
+        self.IncomingOffsets = np.concatenate(([0], np.cumsum(np.bincount(compact.Targets, minlength=compact.NodeCount))))
+
+        self.Weights = compact.Lengths / graph.MaxSpeed
+        self.EdgeEnergy = self.getEdgeEnergy()
+        self.Version = None
+
+        # Statistics
+        self.Queries = 0
+        self.Searches = 0
+        self.Settled = 0
+
+    # Energy of every compact edge from the energy model
+    def getEdgeEnergy(self):
+        return self.Energy.Energy[[self.Energy.EdgeIndex[edge] for edge in self.Compact.EdgeIDs]]
+
+    def refresh(self, speeds):
+        if speeds.Version == self.Version:
+            return
+
+        self.Weights = self.Compact.getTravelTimes(speeds)
+        self.Energy.update(speeds)
+        self.EdgeEnergy = self.getEdgeEnergy()
+
+        self.Version = speeds.Version
+
+    # Matrices from source nodes to target nodes by node ID, rows are sources and columns targets
+    # Returns travel time in s, distance in m and energy in Wh, inf where a target is unreachable
+    def getMatrices(self, sourceNodes, targetNodes):
+        compact = self.Compact
+        sources = [compact.NodeIndex.get(node, -1) for node in sourceNodes]
+        targets = [compact.NodeIndex.get(node, -1) for node in targetNodes]
+        forward = len(sources) <= len(targets)
+
+        if forward:
+            roots, ends = sources, targets
+            arrays = (compact.Offsets.tolist(), list(range(compact.EdgeCount)), compact.Targets.tolist())
+        else:
+            roots, ends = targets, sources
+            arrays = (self.IncomingOffsets.tolist(), self.IncomingEdges.tolist(), compact.Sources.tolist())
+
+        arrays += (self.Weights.tolist(), compact.Lengths.tolist(), self.EdgeEnergy.tolist(), ends)
+        chunks = splitChunks(roots, self.Jobs * CHUNKS_PER_JOB)
+
+        if self.Jobs > 1 and len(chunks) > 1:
+            with Pool(self.Jobs, initializer=initSearch, initargs=arrays) as pool:
+                results = pool.map(searchChunk, chunks)
+        else:
+            initSearch(*arrays)
+            results = [searchChunk(chunk) for chunk in chunks]
+
+        times = np.full((len(roots), len(ends)), np.inf)
+        distances = np.full((len(roots), len(ends)), np.inf)
+        energies = np.full((len(roots), len(ends)), np.inf)
+        row = 0
+
+        for chunk in results:
+            for rowTimes, rowDistances, rowEnergies, settled in chunk:
+                times[row] = rowTimes
+                distances[row] = rowDistances
+                energies[row] = rowEnergies
+                self.Settled += settled
+                row += 1
+
+        self.Queries += 1
+        self.Searches += len(roots)
+
+        if not forward:
+            return times.T, distances.T, energies.T
+
+        return times, distances, energies
+
+    # Quickest routes between root nodes and the end nodes grouped with each, by node ID, from one
+    # Dijkstra on travel time per root that stops once the root's ends are settled. Groups are
+    # (rootNode, endNodes), forwards the routes run from the root to each end, backwards from each
+    # end to the root. Returns the routes of each group as lists of edge IDs, None where there is
+    # no route
+    def getRoutes(self, groups, forward=True):
+        compact = self.Compact
+        weights = self.Weights.tolist()
+
+        if forward:
+            offsets, edges, edgeEnds, edgeStarts = compact.OffsetList, None, compact.TargetList, compact.SourceList
+        else:
+            offsets, edges, edgeEnds, edgeStarts = self.IncomingOffsets.tolist(), self.IncomingEdges.tolist(), compact.SourceList, compact.TargetList
+
+        results = []
+
+        for rootNode, endNodes in groups:
+            root = compact.NodeIndex.get(rootNode, -1)
+            ends = [compact.NodeIndex.get(node, -1) for node in endNodes]
+            parents, settled = searchTree(offsets, edges, edgeEnds, weights, root, ends)
+            routes = []
+
+            for end in ends:
+                if end < 0 or root < 0 or (end != root and end not in parents):
+                    routes.append(None)
+                    continue
+
+                route = []
+                node = end
+
+                while node != root:
+                    edge = parents[node]
+                    route.append(compact.EdgeIDs[edge])
+                    node = edgeStarts[edge]
+
+                if forward:
+                    route.reverse()
+
+                routes.append(route)
+
+            results.append(routes)
+            self.Settled += settled
+
+        self.Queries += 1
+        self.Searches += len(groups)
+
+        return results
+
+    # Matrices from source nodes to every charging station, column s belongs to
+    # Graph.ChargingStations[s] and is routed to the from node of the station's edge
+    # Stations on edges without evehicle access are never reachable
+    def getStationMatrices(self, sourceNodes):
+        graph = self.Graph
+        edgeIndex = self.Compact.EdgeIndex
+
+        return self.getMatrices(sourceNodes, [graph.getEdgeFromNode(cs.Lane) if cs.Lane in edgeIndex else None for cs in graph.ChargingStations])
+
+    def getStats(self):
+        return {
+            'Nodes': self.Compact.NodeCount,
+            'Jobs': self.Jobs,
+            'Queries': self.Queries,
+            'Searches': self.Searches,
+            'Settled': self.Settled
+        }
+
+def splitChunks(roots, chunks):
+    size = max(1, -(-len(roots) // chunks))
+
+    return [roots[i:i + size] for i in range(0, len(roots), size)]
+
+def initSearch(offsets, edges, edgeEnds, weights, lengths, energies, ends):
+    worker['Offsets'] = offsets
+    worker['Edges'] = edges
+    worker['EdgeEnds'] = edgeEnds
+    worker['Weights'] = weights
+    worker['Lengths'] = lengths
+    worker['Energies'] = energies
+    worker['Ends'] = ends
+
+def searchChunk(roots):
+    return [search(root) for root in roots]
+
+# Dijkstra from one root over the worker's arrays, returning the time, distance and energy to each
+# end node with the number of nodes settled
+def search(root):
+    offsets = worker['Offsets']
+    edges = worker['Edges']
+    edgeEnds = worker['EdgeEnds']
+    weights = worker['Weights']
+    lengths = worker['Lengths']
+    energies = worker['Energies']
+    ends = worker['Ends']
+
+    time = {}
+    distance = {}
+    energy = {}
+
+    if root >= 0:
+        time[root] = 0
+        distance[root] = 0
+        energy[root] = 0
+
+    remaining = set(end for end in ends if end >= 0)
+    closed = set()
+    openHeap = [(0, root)] if root >= 0 else []
+
+    while len(openHeap) > 0 and len(remaining) > 0:
+        nodeTime, node = heapq.heappop(openHeap)
+
+        if node in closed:
+            continue
+
+        closed.add(node)
+        remaining.discard(node)
+
+        for edge in edges[offsets[node]:offsets[node + 1]]:
+            nextNode = edgeEnds[edge]
+            newTime = nodeTime + weights[edge]
+
+            if nextNode not in closed and newTime < time.get(nextNode, np.inf):
+                time[nextNode] = newTime
+                distance[nextNode] = distance[node] + lengths[edge]
+                energy[nextNode] = energy[node] + energies[edge]
+                heapq.heappush(openHeap, (newTime, nextNode))
+
+    return ([time.get(end, np.inf) if end in closed else np.inf for end in ends],
+            [distance.get(end, np.inf) if end in closed else np.inf for end in ends],
+            [energy.get(end, np.inf) if end in closed else np.inf for end in ends],
+            len(closed))
+
+# Dijkstra from a root over edges given by offsets into edges, or edge indices themselves when
+# edges is None, keeping the edge each node was reached by until every end is settled
+# Returns the edges by node with the number of nodes settled
+def searchTree(offsets, edges, edgeEnds, weights, root, ends):
+    time = {root: 0}
+    parents = {}
+    remaining = set(end for end in ends if end >= 0)
+    closed = set()
+    openHeap = [(0, root)] if root >= 0 else []
+
+    while len(openHeap) > 0 and len(remaining) > 0:
+        nodeTime, node = heapq.heappop(openHeap)
+
+        if node in closed:
+            continue
+
+        closed.add(node)
+        remaining.discard(node)
+
+        for edge in (range(offsets[node], offsets[node + 1]) if edges == None else edges[offsets[node]:offsets[node + 1]]):
+            nextNode = edgeEnds[edge]
+            newTime = nodeTime + weights[edge]
+
+            if nextNode not in closed and newTime < time.get(nextNode, np.inf):
+                time[nextNode] = newTime
+                parents[nextNode] = edge
+                heapq.heappush(openHeap, (newTime, nextNode))
+
+    return {node: parents[node] for node in closed if node in parents}, len(closed)
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci
+import traci.constants as tc
+
+# Mean speeds of every evehicle edge, fetched once per refresh through a TraCI variable
+# subscription instead of a getLastStepMeanSpeed round trip per edge expansion
+class EdgeSpeedSnapshot:
+    def __init__(self, graph, refreshInterval=1):
+        self.EdgeIDs = [edge for edge in graph.EdgeIDs if graph.allowsEV(edge)]
+        self.EdgeIndex = {edge: i for i, edge in enumerate(self.EdgeIDs)}
+        self.RefreshInterval = max(1, refreshInterval)
+
+        # Array for vectorised readers, list copy for fast scalar reads in the search loop
+        self.Speeds = np.zeros(len(self.EdgeIDs), dtype=np.float64)
+        self.SpeedList = self.Speeds.tolist()
+
+        self.Version = 0
+        self.Step = None
+        self.RefreshStep = None
+
+        # Statistics, uses are recorded by the threads planning routes
+        self.Refreshes = 0
+        self.FetchTime = 0
+        self.Uses = 0
+        self.StalenessTotal = 0
+        self.MaxStaleness = 0
+        self.Lock = threading.Lock()
+
+        for edge in self.EdgeIDs:
+            traci.edge.subscribe(edge, [tc.LAST_STEP_MEAN_SPEED])
+
+    # Called once every simulation step, refetches when the refresh interval has passed
+    def update(self, step):
+        self.Step = step
+
+        if self.RefreshStep == None or step - self.RefreshStep >= self.RefreshInterval:
+            self.refresh(step)
+
+    def refresh(self, step):
+        start_time = time.perf_counter()
+
+        for edge, results in traci.edge.getAllSubscriptionResults().items():
+            i = self.EdgeIndex.get(edge)
+
+            if i != None:
+                self.Speeds[i] = results[tc.LAST_STEP_MEAN_SPEED]
+
+        self.SpeedList = self.Speeds.tolist()
+        self.RefreshStep = step
+        self.Version += 1
+        self.Refreshes += 1
+        self.FetchTime += time.perf_counter() - start_time
+
+    def getSpeed(self, edge):
+        i = self.EdgeIndex.get(edge)
+
+        if i == None:
+            return traci.edge.getLastStepMeanSpeed(edge)
+
+        return self.SpeedList[i]
+
+    # Steps since the speeds were last fetched
+    def getAge(self):
+        return self.Step - self.RefreshStep
+
+    # Records the age of the speeds used by one reroute
+    def recordUse(self):
+        age = self.getAge()
+
+        with self.Lock:
+            self.Uses += 1
+            self.StalenessTotal += age
+            self.MaxStaleness = max(self.MaxStaleness, age)
+
+    def getStats(self):
+        return {
+            'Edges': len(self.EdgeIDs),
+            'RefreshInterval': self.RefreshInterval,
+            'Refreshes': self.Refreshes,
+            'FetchTime': self.FetchTime,
+            'MeanFetchTime': self.FetchTime / self.Refreshes if self.Refreshes > 0 else 0,
+            'Uses': self.Uses,
+            'MeanStaleness': self.StalenessTotal / self.Uses if self.Uses > 0 else 0,
+            'MaxStaleness': self.MaxStaleness
+        }
@@ -0,0 +1,156 @@
+import os
+import sys
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci
+
+# Width in m/s of the speed bands consumption is given for, the last band takes every speed above it
+SPEED_BAND_WIDTH = 5
+SPEED_BANDS = 8
+
+# Meters an EV drives on one Wh, from the mean of every time step of a previous simulation
+METERS_PER_WATT = 3.3101451138736278
+
+AIR_DENSITY = 1.2041
+GRAVITY = 9.81
+
+# Energy in Wh an EV uses driving each evehicle edge
+# An edge's energy is its length times the consumption in Wh per meter of the speed band its mean
+# speed is in. Consumption is given per band for every edge, or per edge and band as calibrate.py
+# writes it. Energies are worked out for every edge at once into an array, refreshed when the
+# speed source moves on, with list copies in the graph's compact edge order for fast scalar reads
+# in the search loops. Without
+# consumption every speed uses the fixed METERS_PER_WATT, and without a speed source every edge
+# is in the band of the network's max speed
+class EnergyModel:
+    def __init__(self, graph, consumption=None):
+        self.Graph = graph
+        self.EdgeIDs = [edge for edge in graph.EdgeIDs if graph.allowsEV(edge)]
+        self.EdgeIndex = {edge: i for i, edge in enumerate(self.EdgeIDs)}
+        self.Lengths = np.array([graph.getEdgeLength(edge) for edge in self.EdgeIDs], dtype=np.float64)
+        self.CompactOrder = np.array([self.EdgeIndex[edge] for edge in graph.Compact.EdgeIDs], dtype=np.intp)
+
+        if consumption is None:
+            consumption = [1 / METERS_PER_WATT] * SPEED_BANDS
+
+        self.Refreshes = 0
+        self.setConsumption(consumption)
+
+    # Consumption per band of SUMO's electric model for a vehicle type driving at the middle of
+    # the band, on the flat and without accelerating, from the vType's battery device parameters
+    @classmethod
+    def fromVehicleType(cls, graph, typeID):
+        def param(key):
+            return float(traci.vehicletype.getParameter(typeID, key))
+
+        mass = param('vehicleMass')
+        frontSurfaceArea = param('frontSurfaceArea')
+        airDragCoefficient = param('airDragCoefficient')
+        rollDragCoefficient = param('rollDragCoefficient')
+        constantPowerIntake = param('constantPowerIntake')
+        propulsionEfficiency = param('propulsionEfficiency')
+
+        speeds = (np.arange(SPEED_BANDS) + 0.5) * SPEED_BAND_WIDTH
+
+        # Forces in N are J per meter, the constant power intake is spread over the meters driven each second
+        joulesPerMeter = mass * GRAVITY * rollDragCoefficient + 0.5 * AIR_DENSITY * frontSurfaceArea * airDragCoefficient * speeds ** 2 \
+            + constantPowerIntake / speeds
+
+        return cls(graph, (joulesPerMeter / propulsionEfficiency / 3600).tolist())
+
+    # Consumption per edge and band from a calibrate.py npz, rows are matched to the edges by ID
+    # when the npz was calibrated on a net with other edges, and edges it lacks get the fixed rate
+    @classmethod
+    def fromCalibration(cls, graph, calibrationFile):
+        with np.load(calibrationFile) as calibration:
+            if int(calibration['BandWidth']) != SPEED_BAND_WIDTH or calibration['Consumption'].shape[1] != SPEED_BANDS:
+                sys.exit('Energy calibration has other speed bands: ' + calibrationFile)
+
+            edgeIDs = calibration['EdgeIDs'].tolist()
+            consumption = calibration['Consumption']
+
+        model = cls(graph)
+
+        if edgeIDs != model.EdgeIDs:
+            rows = {edge: i for i, edge in enumerate(edgeIDs)}
+            calibrated = np.array(model.Consumption)
+
+            for i, edge in enumerate(model.EdgeIDs):
+                if edge in rows:
+                    calibrated[i] = consumption[rows[edge]]
+
+            consumption = calibrated
+
+        model.setConsumption(consumption)
+
+        return model
+
+    # Consumption of every band for all edges, or of every edge and band as a row per edge
+    def setConsumption(self, consumption):
+        self.Consumption = np.broadcast_to(np.asarray(consumption, dtype=np.float64), (len(self.EdgeIDs), SPEED_BANDS))
+        self.SpeedDependent = bool(np.any(self.Consumption != self.Consumption[:, :1]))
+        self.SpeedVersion = None
+
+        self.setSpeeds(np.full(len(self.EdgeIDs), self.Graph.MaxSpeed))
+
+    # Speed band of each speed, speeds are in m/s
+    def getBands(self, speeds):
+        return np.minimum(np.asarray(speeds) // SPEED_BAND_WIDTH, SPEED_BANDS - 1).astype(np.intp)
+
+    # Refreshes the edge energies when the speed source has new speeds, the speeds are expected
+    # in the same edge order as the model, as the snapshot and trace keep them
+    def update(self, speeds):
+        if speeds == None or not self.SpeedDependent or speeds.Version == self.SpeedVersion:
+            return
+
+        self.SpeedVersion = speeds.Version
+
+        if len(speeds.EdgeIDs) == len(self.EdgeIDs):
+            self.setSpeeds(speeds.Speeds)
+        else:
+            self.setSpeeds(np.array([speeds.getSpeed(edge) for edge in self.EdgeIDs], dtype=np.float64))
+
+    # Lists are swapped in whole so searches running on other threads see old or new energies
+    def setSpeeds(self, speeds):
+        rates = self.Consumption[np.arange(len(self.EdgeIDs)), self.getBands(speeds)]
+        self.Rates = rates
+        self.Energy = self.Lengths * rates
+        self.EdgeRate = rates[self.CompactOrder].tolist()
+        self.EdgeEnergy = self.Energy[self.CompactOrder].tolist()
+        self.Refreshes += 1
+
+    def getEdgeEnergy(self, edge):
+        return self.EdgeEnergy[self.Graph.Compact.EdgeIndex[edge]]
+
+    # Energy of an edge route including the internal lanes of its junctions, each used at the
+    # rate of the edge it leads onto
+    def getRouteEnergy(self, route):
+        compact = self.Graph.Compact
+        edgeEnergy = self.EdgeEnergy
+        edgeRate = self.EdgeRate
+        energy = 0
+        previous = None
+
+        for edge in route:
+            i = compact.EdgeIndex[edge]
+
+            if previous != None:
+                energy += (compact.getConnectionLength(previous, i) or 0) * edgeRate[i]
+
+            energy += edgeEnergy[i]
+            previous = i
+
+        return energy
+
+    def getStats(self):
+        return {
+            'Edges': len(self.EdgeIDs),
+            'Refreshes': self.Refreshes,
+            'MeanConsumption': self.Consumption.mean(axis=0).tolist()
+        }
@@ -1,7 +1,17 @@
 import os
 import sys
+import glob
+import pickle
+import hashlib
+import tempfile
+import logging
+import numpy as np
 import xml.etree.ElementTree as ET
 from algorithm.ChargingStation import ChargingStation
+from algorithm.CompactGraph import CompactGraph, EdgeView
+from algorithm.SpatialIndex import ChargingStationIndex
+from algorithm.StationTrees import StationTrees
+from algorithm.ContractionHierarchy import ContractionHierarchy
 
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
@@ -10,91 +20,354 @@ else:
     sys.exit("please declare environment variable 'SUMO_HOME'")
 
 import sumolib
+from sumolib.net import convertShape
+from sumolib.net.lane import get_allowed
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached attributes or the hierarchy's preprocessing change so old cache files are ignored
+CACHE_VERSION = 2
+
+# Attributes written to and read from the graph cache
+CACHED_ATTRIBUTES = ['NodeIDs', 'NodeCoords', 'EdgeIDs', 'EdgeFrom', 'EdgeTo', 'EdgeLengths', 'EVEdges',
+                     'NodeNeighbours', 'ChargingStations', 'MaxSpeed', 'Connections']
 
 class Graph:
-    def __init__(self, netFile, additionalFile):
-        self.Net = sumolib.net.readNet(netFile)
-        self.Edges = self.Net.getEdges()
-        self.Nodes = self.Net.getNodes()
-        self.NodeNeighbours = self.getNodeNeighbours()
-        self.ChargingStations = self.getChargingStations(additionalFile)
-        self.MaxSpeed = self.getMaxSpeed(netFile)
-        self.Connections = self.getConnections(netFile)
+    def __init__(self, netFile, additionalFile, compact=False, cache=True, stationTrees=False, hierarchy=False, hierarchyInterval=1):
+        self.NetFile = netFile
+        self.AdditionalFile = additionalFile
+        self.SumoNet = None
+        self.Compact = None
+        self.StationTrees = None
+        self.Hierarchy = None
+        self.CacheDigest = self.getCacheDigest() if cache else None
+
+        if not (cache and self.loadCache()):
+            self.loadNetwork(netFile, additionalFile)
+
+            if cache:
+                self.saveCache()
+
+        self.CSIndex = ChargingStationIndex(self.ChargingStations)
+        self.buildConnectionIndexes()
+
+        # Integer indexed copy of the evehicle graph the searches run on
+        self.Compact = CompactGraph.fromGraph(self)
+
+        # Swap the dicts for read only views of arrays so only the compact graph stays in memory
+        if compact:
+            self.useCompactViews()
+
+        # Reverse shortest path trees from each charging station, kept up to date by the caller
+        # through StationTrees.refresh as edge speeds change
+        if stationTrees:
+            self.StationTrees = StationTrees(self.Compact, self.ChargingStations, self.MaxSpeed)
+
+        # Contraction hierarchy for route queries, customized by the caller through
+        # ContractionHierarchy.refresh as edge speeds change, at most every hierarchyInterval steps
+        if hierarchy:
+            self.Hierarchy = ContractionHierarchy(self, self.Compact, hierarchyInterval)
+
+    # Full sumolib net, only read when something outside the router needs it
+    @property
+    def Net(self):
+        if self.SumoNet == None:
+            self.SumoNet = sumolib.net.readNet(self.NetFile)
+
+        return self.SumoNet
+
+    @property
+    def Edges(self):
+        return self.Net.getEdges()
+
+    @property
+    def Nodes(self):
+        return self.Net.getNodes()
 
     def neighbors(self, id):
         return self.NodeNeighbours.get(id)
 
-    # Get the edge and length between two nodes
+    def getEdgeFromNode(self, edge):
+        return self.EdgeFrom[edge]
+
+    def getEdgeToNode(self, edge):
+        return self.EdgeTo[edge]
+
+    def getEdgeLength(self, edge):
+        return self.EdgeLengths[edge]
+
+    def getNodeCoord(self, node):
+        return self.NodeCoords[node]
+
+    def allowsEV(self, edge):
+        return edge in self.EVEdges
+
+    # Get the edge and length between two nodes, None if no edge joins them
     def getNodeEdge(self, fromNode, toNode):
-        nodesNeighbours = self.NodeNeighbours.get(fromNode)
-        return next(edge for edge in nodesNeighbours if edge['Neighbour'] == toNode)
+        return self.Compact.getNodeEdge(fromNode, toNode)
 
-    def getNodeNeighbours(self):
-        netNodes = self.Net.getNodes()
-        nodes = {}
+    # Length of the internal lane joining two edges, None if they are not connected
+    def getConnectionLength(self, fromEdge, toEdge):
+        return self.ConnectionLengths.get((fromEdge, toEdge))
+
+    # Length of an edge route including the internal lanes of the junctions between edges
+    def getRouteLength(self, route):
+        length = 0
+
+        for i, edge in enumerate(route):
+            if i > 0:
+                connectionLength = self.ConnectionLengths.get((route[i - 1], edge))
+
+                if connectionLength == None:
+                    logger.warning('No interal lane match for %s / %s', route[i - 1], edge)
+                else:
+                    length += connectionLength
+
+            length += self.EdgeLengths[edge]
+
+        return length
+
+    # Hash index built at load time so routes need no scans of an edge's connections:
+    # (fromEdge, toEdge) to the junction's internal lane length
+    def buildConnectionIndexes(self):
+        self.ConnectionLengths = {}
+
+        for fromEdge, connections in self.Connections.items():
+            for connection in connections:
+                self.ConnectionLengths.setdefault((fromEdge, connection['to']), connection['length'])
+
+    # Replaces the node and edge dicts with views over arrays and the compact graph, which keep
+    # the same lookups. Junction lengths are only kept between evehicle edges, the edges routes use
+    def useCompactViews(self):
+        edgeIndex = {edge: i for i, edge in enumerate(self.EdgeIDs)}
+        nodeIndex = self.Compact.NodeIndex
+
+        edgeFrom = np.array([nodeIndex[self.EdgeFrom[edge]] for edge in self.EdgeIDs], dtype=np.int32)
+        edgeTo = np.array([nodeIndex[self.EdgeTo[edge]] for edge in self.EdgeIDs], dtype=np.int32)
+        edgeLengths = np.array([self.EdgeLengths[edge] for edge in self.EdgeIDs], dtype=np.float64)
+
+        self.EdgeFrom = EdgeView(edgeIndex, edgeFrom, self.Compact.NodeIDs)
+        self.EdgeTo = EdgeView(edgeIndex, edgeTo, self.Compact.NodeIDs)
+        self.EdgeLengths = EdgeView(edgeIndex, edgeLengths)
+        self.NodeCoords = self.Compact.coordView()
+        self.NodeNeighbours = self.Compact.neighbourView()
+        self.ConnectionLengths = self.Compact.connectionView()
+        self.Connections = None
+
+    # Builds the graph from one streamed pass over the net file
+    # Charging stations are read first so only the shapes of their edges are kept
+    def loadNetwork(self, netFile, additionalFile):
+        csElements = self.getChargingStationElements(additionalFile)
+        csEdges = set(element.get('lane').split('_')[0] for element in csElements)
+
+        self.NodeIDs = []
+        self.NodeCoords = {}
+        self.EdgeIDs = []
+        self.EdgeFrom = {}
+        self.EdgeTo = {}
+        self.EdgeLengths = {}
+        self.EVEdges = set()
+        self.MaxSpeed = 0
+        self.Connections = {}
+
+        knownNodes = set()
+        outgoing = {}
+        edgeShapes = {}
+        internalLanes = {}
+        depth = 0
+        root = None
+
+        for event, element in ET.iterparse(netFile, events=('start', 'end')):
+            if event == 'start':
+                if root == None:
+                    root = element
+
+                depth += 1
+                continue
+
+            depth -= 1
+
+            if element.tag == 'edge':
+                function = element.get('function', '')
+                lanes = element.findall('lane')
+
+                # Max speed covers every lane, internal ones included
+                for lane in lanes:
+                    self.MaxSpeed = max(float(lane.get('speed')), self.MaxSpeed)
+
+                if function == '':
+                    id = element.get('id')
 
-        for i in netNodes:
-            nodeConnections = []
+                    # Node order follows sumolib, nodes are added as edges first reference them
+                    for node in (element.get('from'), element.get('to')):
+                        if node not in knownNodes:
+                            knownNodes.add(node)
+                            self.NodeIDs.append(node)
 
-            for j in self.Net.getNode(i.getID()).getOutgoing():
-                # Make sure only gets lanes with evehicle access
-                if j.getToNode().getID() and j.allows('evehicle'):
-                    nodeConnections.append({
-                        'Neighbour': j.getToNode().getID(),
-                        'ConnectingEdge': j.getID(),
-                        'Length': j.getLength()
+                    self.EdgeIDs.append(id)
+                    self.EdgeFrom[id] = element.get('from')
+                    self.EdgeTo[id] = element.get('to')
+                    self.EdgeLengths[id] = float(lanes[0].get('length'))
+                    outgoing.setdefault(element.get('from'), []).append(id)
+
+                    if any('evehicle' in get_allowed(lane.get('allow'), lane.get('disallow')) for lane in lanes):
+                        self.EVEdges.add(id)
+
+                    if id in csEdges:
+                        edgeShapes[id] = self.getEdgeShape([convertShape(lane.get('shape', '')) for lane in lanes])
+
+                elif function in ['internal', 'crossing', 'walkingarea']:
+                    for lane in lanes:
+                        internalLanes[lane.get('id')] = (float(lane.get('length')),
+                                                         'evehicle' in get_allowed(lane.get('allow'), lane.get('disallow')))
+
+            elif element.tag == 'junction' and depth == 1:
+                id = element.get('id')
+
+                if id[0] != ':':
+                    self.NodeCoords[id] = (float(element.get('x')), float(element.get('y')))
+
+                    if id not in knownNodes:
+                        knownNodes.add(id)
+                        self.NodeIDs.append(id)
+
+            # Workaround due to .getConnections broken in SUMO, internal lane lengths taken from the via lane
+            elif element.tag == 'connection' and depth == 1:
+                via = element.get('via')
+
+                if via != None and via in internalLanes and internalLanes[via][1]:
+                    self.Connections.setdefault(element.get('from'), []).append({
+                        'to': element.get('to'),
+                        'via': via,
+                        'length': internalLanes[via][0]
                     })
 
-                    nodes.update([(i.getID(), nodeConnections)])
+            # Drop finished top level elements so memory stays flat on large nets
+            if depth == 1:
+                root.clear()
+
+        self.NodeNeighbours = self.getNodeNeighbours(outgoing)
+        self.ChargingStations = self.getChargingStations(csElements, edgeShapes)
+
+    # Make sure only gets lanes with evehicle access
+    def getNodeNeighbours(self, outgoing):
+        nodes = {}
+
+        for node in self.NodeIDs:
+            nodeConnections = [{
+                'Neighbour': self.EdgeTo[edge],
+                'ConnectingEdge': edge,
+                'Length': self.EdgeLengths[edge]
+            } for edge in outgoing.get(node, []) if edge in self.EVEdges]
+
+            if len(nodeConnections) > 0:
+                nodes[node] = nodeConnections
 
         return nodes
 
-    # Gets all charging stations and attributes in the sumo simulation net
-    def getChargingStations(self, additionalFile):
-        chargingStations = []
+    # Edge shape as sumolib builds it, the middle lane or the average of the lanes
+    def getEdgeShape(self, laneShapes):
+        numLanes = len(laneShapes)
+
+        if numLanes % 2 == 1:
+            return [(x, y) for x, y, z in laneShapes[int(numLanes / 2)]]
+
+        minLen = min(len(shape) for shape in laneShapes)
+
+        return [(sum(shape[i][0] for shape in laneShapes) / float(numLanes),
+                 sum(shape[i][1] for shape in laneShapes) / float(numLanes)) for i in range(minLen)]
+
+    def getChargingStationElements(self, additionalFile):
         xmlTree = ET.parse(additionalFile)
         root = xmlTree.getroot()
 
-        for element in root.findall('chargingStation'):
-            x, y = sumolib.geomhelper.positionAtShapeOffset(self.Net.getEdge(element.get('lane').split('_')[0]).getShape(), float(element.get('startPos')))
+        return root.findall('chargingStation')
+
+    # Gets all charging stations and attributes in the sumo simulation net
+    def getChargingStations(self, csElements, edgeShapes):
+        chargingStations = []
+
+        for element in csElements:
+            x, y = sumolib.geomhelper.positionAtShapeOffset(edgeShapes[element.get('lane').split('_')[0]], float(element.get('startPos')))
             cs = ChargingStation(element.get('id'), element.get('lane'), x, y, float(element.get('startPos')), float(element.get('endPos')), float(element.get('power')), float(element.get('efficiency')))
 
             chargingStations.append(cs)
 
         return chargingStations
 
-    # Gets the max speed in the sumo simulation net
-    def getMaxSpeed(self, netFile):
-        xmlTree = ET.parse(netFile)
-        root = xmlTree.getroot()
-        maxSpeed = 0
+    # Hash of the net and additional files the cache files are named by
+    def getCacheDigest(self):
+        digest = hashlib.sha1(str(CACHE_VERSION).encode())
 
-        for lane in root.findall('.//edge/lane'):
-            laneSpeed = float(lane.get('speed'))
-            maxSpeed = max(laneSpeed, maxSpeed)
+        for file in (self.NetFile, self.AdditionalFile):
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
 
-        return maxSpeed
+        return digest.hexdigest()[:16]
 
-    # Workaround function due to .getConnections broken in SUMO
-    def getConnections(self, netFile):
-        connections = {}
-        xmlTree = ET.parse(netFile)
-        root = xmlTree.getroot()
-        internalLanes = sumolib.net.readNet(netFile, withInternal=True)
+    # Cache file of a kind next to the net file
+    def getCachePath(self, kind):
+        return self.NetFile + '.' + self.CacheDigest + '.' + kind
+
+    def loadCache(self):
+        cached = self.readCache('graphcache')
+
+        if cached == None:
+            return False
+
+        for attribute in CACHED_ATTRIBUTES:
+            setattr(self, attribute, cached[attribute])
+
+        return True
+
+    def saveCache(self):
+        self.writeCache('graphcache', {attribute: getattr(self, attribute) for attribute in CACHED_ATTRIBUTES})
+
+    # Data of a cache file, None when caching is off or there is no readable cache
+    def readCache(self, kind):
+        if self.CacheDigest == None:
+            return None
+
+        cachePath = self.getCachePath(kind)
+
+        if not os.path.exists(cachePath):
+            return None
+
+        try:
+            with open(cachePath, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            logger.warning('Unreadable %s, rebuilding: %s', kind, cachePath)
+            return None
+
+    # Writes a cache file and removes caches of its kind left from older versions of the net file
+    # Several processes may build the same graph at once, so each writes its own temporary file
+    # and swaps it in whole, and old caches another process removed first are skipped
+    def writeCache(self, kind, data):
+        if self.CacheDigest == None:
+            return
+
+        cachePath = self.getCachePath(kind)
+
+        for oldCache in glob.glob(glob.escape(self.NetFile) + '.*.' + kind):
+            if oldCache != cachePath:
+                try:
+                    os.remove(oldCache)
+                except FileNotFoundError:
+                    pass
+
+        tmpPath = None
 
-        for con in root.findall('connection'):
-            if con.get('via') != None and internalLanes.getLane(con.get('via')).allows('evehicle'):
-                connectionObj = {
-                    'to': con.get('to'),
-                    'via': con.get('via'),
-                    'length': internalLanes.getLane(con.get('via')).getLength()
-                }
-                allConnections = connections.get(con.get('from'))
+        try:
+            fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(cachePath) or '.', suffix='.tmp')
 
-                if allConnections == None:
-                    allConnections = []
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-                allConnections.append(connectionObj)
-                connections.update([(con.get('from'), allConnections)])
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            logger.warning('Could not write %s: %s', kind, cachePath)
 
-        return connections
+            if tmpPath != None and os.path.exists(tmpPath):
+                os.remove(tmpPath)
@@ -0,0 +1,203 @@
+import csv
+import time
+import threading
+import functools
+
+# Router phases that are timed, each time includes the phases it calls
+PHASES = ['route', 'searchRoute', 'aStarSearch', 'labelSettingSearch', 'hierarchyQuery', 'routeToCS', 'routeViaCS',
+          'getNeighbouringCS', 'getBestCS', 'reconstructRoutePath']
+
+COUNTERS = ['Expansions', 'HierarchySettled', 'CacheHits', 'CacheMisses']
+
+# TraCI domains whose calls are counted and timed
+TRACI_DOMAINS = ['edge', 'chargingstation', 'vehicle', 'vehicletype', 'simulation']
+
+# Per EV timers and counters for the router
+# Each EV's planning is recorded between beginEV and endEV on the thread planning it, and the
+# finished records are written one row per EV. When disabled, timers are a shared object that
+# does nothing and every other call returns straight away
+class Instrumentation:
+    def __init__(self, enabled=False):
+        self.Enabled = enabled
+        self.Records = []
+        self.Local = threading.local()
+        self.Lock = threading.Lock()
+
+        # TraCI calls over the whole run, in or out of planning, by name as [calls, seconds]
+        self.TraCICalls = {}
+
+    def beginEV(self, evName):
+        if not self.Enabled:
+            return
+
+        self.Local.Record = {
+            'EV': evName,
+            'Times': dict.fromkeys(PHASES, 0),
+            'Calls': dict.fromkeys(PHASES, 0),
+            'Counts': dict.fromkeys(COUNTERS, 0),
+            'TraCICalls': 0,
+            'TraCITime': 0
+        }
+
+    def endEV(self):
+        record = self.getRecord()
+
+        if record == None:
+            return
+
+        with self.Lock:
+            self.Records.append(record)
+
+        self.Local.Record = None
+
+    # Record of the EV being planned on this thread, None outside of planning
+    def getRecord(self):
+        return getattr(self.Local, 'Record', None)
+
+    def timer(self, phase):
+        if not self.Enabled:
+            return NULL_TIMER
+
+        return PhaseTimer(self, phase)
+
+    def addTime(self, phase, seconds):
+        record = self.getRecord()
+
+        if record != None:
+            record['Times'][phase] += seconds
+            record['Calls'][phase] += 1
+
+    def count(self, counter, n=1):
+        if not self.Enabled:
+            return
+
+        record = self.getRecord()
+
+        if record != None:
+            record['Counts'][counter] += n
+
+    def addTraCICall(self, name, seconds):
+        with self.Lock:
+            calls = self.TraCICalls.setdefault(name, [0, 0])
+            calls[0] += 1
+            calls[1] += seconds
+
+        record = self.getRecord()
+
+        if record != None:
+            record['TraCICalls'] += 1
+            record['TraCITime'] += seconds
+
+    # Points the traci name of each module at a wrapper counting and timing its calls for this
+    # instrumentation, or back at traci itself when disabled
+    def traceTraCI(self, modules):
+        for module in modules:
+            traciModule = module.traci.Module if isinstance(module.traci, TracedTraCI) else module.traci
+            module.traci = TracedTraCI(traciModule, self) if self.Enabled else traciModule
+
+    # Writes one row per planned EV, columns are the phases, counters and TraCI totals
+    def write(self, outputFile):
+        header = ['EV'] + [phase + ' (s)' for phase in PHASES] + [phase + ' Calls' for phase in PHASES] + COUNTERS \
+            + ['Cache Hit Rate', 'TraCI Calls', 'TraCI Time (s)']
+
+        with open(outputFile, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+
+            for record in self.Records:
+                counts = record['Counts']
+                lookups = counts['CacheHits'] + counts['CacheMisses']
+
+                writer.writerow([record['EV']] + [record['Times'][phase] for phase in PHASES] + [record['Calls'][phase] for phase in PHASES]
+                                + [counts[counter] for counter in COUNTERS]
+                                + [counts['CacheHits'] / lookups if lookups > 0 else '', record['TraCICalls'], record['TraCITime']])
+
+    def getStats(self):
+        stats = {'EVs': len(self.Records)}
+
+        for phase in PHASES:
+            stats[phase] = sum(record['Times'][phase] for record in self.Records)
+
+        for counter in COUNTERS:
+            stats[counter] = sum(record['Counts'][counter] for record in self.Records)
+
+        stats['TraCICalls'] = {name: calls[0] for name, calls in self.TraCICalls.items()}
+        stats['TraCITime'] = sum(calls[1] for calls in self.TraCICalls.values())
+
+        return stats
+
+class PhaseTimer:
+    def __init__(self, instrumentation, phase):
+        self.Instrumentation = instrumentation
+        self.Phase = phase
+
+    def __enter__(self):
+        self.Start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.Instrumentation.addTime(self.Phase, time.perf_counter() - self.Start)
+
+class NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_TIMER = NullTimer()
+
+# Times every call of a method under a phase, through the Instrumentation of the object
+def timed(phase):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.Instrumentation.Enabled:
+                return method(self, *args, **kwargs)
+
+            start = time.perf_counter()
+
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.Instrumentation.addTime(phase, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+# Stands in for the traci module, calls to the domains in TRACI_DOMAINS are counted and timed
+class TracedTraCI:
+    def __init__(self, traciModule, instrumentation):
+        self.Module = traciModule
+        self.Domains = {domain: TracedDomain(domain, getattr(traciModule, domain), instrumentation) for domain in TRACI_DOMAINS}
+
+    def __getattr__(self, name):
+        if name in self.Domains:
+            return self.Domains[name]
+
+        return getattr(self.Module, name)
+
+class TracedDomain:
+    def __init__(self, name, domain, instrumentation):
+        self.Name = name
+        self.Domain = domain
+        self.Instrumentation = instrumentation
+
+    # Wraps a domain function the first time it is used, the wrapper is kept as an attribute so
+    # later lookups find it without coming back here
+    def __getattr__(self, name):
+        function = getattr(self.Domain, name)
+        callName = self.Name + '.' + name
+        instrumentation = self.Instrumentation
+
+        def traced(*args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                instrumentation.addTraCICall(callName, time.perf_counter() - start)
+
+        setattr(self, name, traced)
+
+        return traced
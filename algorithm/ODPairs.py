@@ -0,0 +1,61 @@
+import sys
+import numpy as np
+
+# End edges drawn for each start edge at once, the first valid one is used
+END_CANDIDATES = 8
+
+# Further end edges drawn one at a time for a start edge whose candidates were all invalid
+MAX_REDRAWS = 1000
+
+# Random EV origin/destination edge pairs drawn a whole batch at a time
+# Edges are drawn from an index of the evehicle edges built once, as positions into arrays of
+# their from and to nodes. Each start edge gets a row of candidate end edges, and the first that
+# is not the start edge and does not lead into the start edge's from node is its end. Draws come
+# from NumPy Generators seeded through a SeedSequence, so a seed gives the same pairs in every
+# run and process, and a longer batch starts with the same pairs as a shorter one
+class ODPairGenerator:
+    def __init__(self, graph):
+        self.EdgeIDs = [edge for edge in graph.EdgeIDs if graph.allowsEV(edge)]
+
+        if len(self.EdgeIDs) < 2:
+            sys.exit('Network needs at least two evehicle edges for EV routes')
+
+        nodeIndex = {}
+        self.FromNodes = np.array([nodeIndex.setdefault(graph.getEdgeFromNode(edge), len(nodeIndex)) for edge in self.EdgeIDs], dtype=np.int64)
+        self.ToNodes = np.array([nodeIndex.setdefault(graph.getEdgeToNode(edge), len(nodeIndex)) for edge in self.EdgeIDs], dtype=np.int64)
+
+    # Count (fromEdge, toEdge) pairs for a seed
+    def generate(self, count, seed):
+        starts, ends = self.generateIndices(count, seed)
+
+        return [(self.EdgeIDs[start], self.EdgeIDs[end]) for start, end in zip(starts.tolist(), ends.tolist())]
+
+    # Start and end positions into EdgeIDs, starts and end candidates each have their own stream
+    def generateIndices(self, count, seed):
+        startStream, endStream = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(2)]
+        edgeCount = len(self.EdgeIDs)
+
+        starts = startStream.integers(edgeCount, size=count)
+        candidates = endStream.integers(edgeCount, size=(count, END_CANDIDATES))
+        valid = self.isValid(starts[:, None], candidates)
+
+        ends = candidates[np.arange(count), np.argmax(valid, axis=1)]
+
+        # Redraws come from a stream of the EV's own so they do not depend on the rest of the batch
+        for i in np.flatnonzero(~valid.any(axis=1)).tolist():
+            ends[i] = self.redrawEnd(int(starts[i]), np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(2, i))))
+
+        return starts, ends
+
+    # Whether each end position can be used with its start position
+    def isValid(self, starts, ends):
+        return (ends != starts) & (self.ToNodes[ends] != self.FromNodes[starts])
+
+    def redrawEnd(self, start, stream):
+        for draw in range(MAX_REDRAWS):
+            end = int(stream.integers(len(self.EdgeIDs)))
+
+            if self.isValid(start, end):
+                return end
+
+        sys.exit('No valid end edge found for EV start edge ' + self.EdgeIDs[start])
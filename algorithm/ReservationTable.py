@@ -0,0 +1,63 @@
+import bisect
+import threading
+
+# Planned charging stops at every charging station, recorded when an EV is given its stops
+# Each station keeps the start (ETA) and end (ETA + Duration) times of its stops in two sorted
+# lists, so the number of EVs expected to be charging at a time is the stops started by then
+# minus the stops ended by then, found with two binary searches and no TraCI calls
+class ReservationTable:
+    def __init__(self):
+        self.Starts = {}
+        self.Ends = {}
+        self.ExpiredBefore = 0
+        self.Lock = threading.Lock()
+
+        # Statistics
+        self.Reservations = 0
+        self.Expired = 0
+        self.Queries = 0
+
+    def reserve(self, csID, eta, duration):
+        with self.Lock:
+            bisect.insort(self.Starts.setdefault(csID, []), eta)
+            bisect.insort(self.Ends.setdefault(csID, []), eta + duration)
+            self.Reservations += 1
+
+    # EVs expected to be charging at the station at a time, a stop counts from its ETA up to
+    # but not including its end
+    def getOccupancy(self, csID, time):
+        with self.Lock:
+            self.Queries += 1
+            starts = self.Starts.get(csID)
+
+            if starts == None:
+                return 0
+
+            return bisect.bisect_right(starts, time) - bisect.bisect_right(self.Ends[csID], time)
+
+    # Drops stops that ended by a time, occupancy is only asked for from then on
+    # The earliest starts are dropped with them, every one of those started before the time so
+    # counts from the time on are unchanged
+    def expire(self, time):
+        with self.Lock:
+            if time <= self.ExpiredBefore:
+                return
+
+            for csID, ends in self.Ends.items():
+                ended = bisect.bisect_right(ends, time)
+
+                if ended > 0:
+                    del ends[:ended]
+                    del self.Starts[csID][:ended]
+                    self.Expired += ended
+
+            self.ExpiredBefore = time
+
+    def getStats(self):
+        return {
+            'Stations': len(self.Starts),
+            'Active': sum(len(ends) for ends in self.Ends.values()),
+            'Reservations': self.Reservations,
+            'Expired': self.Expired,
+            'Queries': self.Queries
+        }
@@ -0,0 +1,90 @@
+import sys
+import math
+import threading
+from collections import OrderedDict
+
+# LRU cache of A* search results keyed by (start node, goal node, csRouting, range bucket)
+# Entries are stamped with the refresh step of the speed snapshot they were searched on and
+# expire once the current snapshot is more than ttl steps newer
+class RouteCache:
+    def __init__(self, maxEntries=10000, maxBytes=64 * 1024 * 1024, ttl=60, rangeBucket=50):
+        self.Entries = OrderedDict()
+        self.MaxEntries = maxEntries
+        self.MaxBytes = maxBytes
+        self.TTL = ttl
+        self.RangeBucket = rangeBucket
+        self.Bytes = 0
+        self.Lock = threading.Lock()
+
+        # Statistics
+        self.Hits = 0
+        self.Misses = 0
+        self.Expired = 0
+        self.Evictions = 0
+
+    # Range is discretised so EVs with nearly the same range share entries, 0 keeps it exact
+    def getKey(self, start, end, evRange, csRouting):
+        if self.RangeBucket > 0 and not math.isinf(evRange):
+            evRange = math.floor(evRange / self.RangeBucket)
+
+        return (start, end, csRouting, evRange)
+
+    # Cached (route, length) or None on a miss, the route is a copy callers can extend
+    def get(self, key, speedStep):
+        with self.Lock:
+            entry = self.Entries.get(key)
+
+            if entry == None:
+                self.Misses += 1
+                return None
+
+            route, length, entryStep, size = entry
+
+            if speedStep - entryStep > self.TTL:
+                self.remove(key)
+                self.Expired += 1
+                self.Misses += 1
+                return None
+
+            self.Entries.move_to_end(key)
+            self.Hits += 1
+
+            return (list(route) if route != None else None), length
+
+    def put(self, key, route, length, speedStep):
+        route = tuple(route) if route != None else None
+        size = sys.getsizeof(key) + (sys.getsizeof(route) if route != None else 0) + 64
+
+        with self.Lock:
+            if key in self.Entries:
+                self.remove(key)
+
+            self.Entries[key] = (route, length, speedStep, size)
+            self.Bytes += size
+
+            # Evict least recently used entries past either cap
+            while len(self.Entries) > self.MaxEntries or self.Bytes > self.MaxBytes:
+                self.remove(next(iter(self.Entries)))
+                self.Evictions += 1
+
+    def remove(self, key):
+        self.Bytes -= self.Entries.pop(key)[3]
+
+    # Drops every entry, the statistics are kept
+    def clear(self):
+        with self.Lock:
+            self.Entries.clear()
+            self.Bytes = 0
+
+    def getStats(self):
+        lookups = self.Hits + self.Misses
+
+        return {
+            'Entries': len(self.Entries),
+            'Bytes': self.Bytes,
+            'Hits': self.Hits,
+            'Misses': self.Misses,
+            'HitRate': self.Hits / lookups if lookups > 0 else 0,
+            'Expired': self.Expired,
+            'Evictions': self.Evictions
+        }
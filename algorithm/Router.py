@@ -0,0 +1,844 @@
+import os
+import sys
+import copy
+import math
+import heapq
+import itertools
+import logging
+from random import uniform
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci
+from algorithm import scoring
+from algorithm.Instrumentation import Instrumentation, timed
+from algorithm.EnergyModel import EnergyModel, METERS_PER_WATT
+
+logger = logging.getLogger(__name__)
+
+# Battery levels in percent a charging stop can charge up to in the label setting search
+CHARGE_LEVELS = [50, 80, 100]
+
+# Labels the label setting search creates before giving up on an EV
+MAX_LABELS = 100000
+
+# Length plus min gap of the electricvehicle vType, used for how many EVs a station holds at once
+VEHICLE_SPACE = 7.5
+
+# Plans EV routes and charging stops over a graph
+# Holds the graph, the speed source, energy model and charging station counts, with an optional
+# route cache and reservation table, while the EV's battery profile comes with each request.
+# Nothing is kept between requests, so one router can plan many EVs from a thread pool, while
+# refresh and updateStations are called between steps on the thread stepping the simulation
+class Router:
+    def __init__(self, graph, speeds=None, cache=None, reservations=None, instrumentation=None, energy=None, profiles=None):
+        self.Graph = graph
+        self.Speeds = speeds
+        self.Cache = cache
+        self.Reservations = reservations
+
+        # Records phases, expansions and cache lookups when it is enabled
+        self.Instrumentation = instrumentation if instrumentation != None else Instrumentation()
+
+        # Wh each edge takes, fixed per meter unless a speed dependent model is given
+        self.Energy = energy if energy != None else EnergyModel(graph)
+        self.VehiclesCharging = None
+        self.Time = 0
+
+        # Hyper parameter profiles by name that every charging decision is also scored with, in one
+        # call over all of them, to record the station each would have picked
+        self.Profiles = profiles
+        self.ProfileWeights = scoring.buildWeightMatrix(list(profiles.values())) if profiles != None else None
+
+        # Position of each compact edge in the speed source, None when the source lacks edges
+        # and speeds are read per edge ID
+        self.SpeedIndex = graph.Compact.getEdgePositions(speeds.EdgeIndex) if speeds != None else None
+
+        # Stations with the index of their edge by the index of the node their edge leaves
+        self.StationsByNode = {}
+
+        for cs in graph.ChargingStations:
+            csEdge = graph.Compact.EdgeIndex.get(cs.Lane)
+
+            if csEdge != None:
+                self.StationsByNode.setdefault(graph.Compact.SourceList[csEdge], []).append((cs, csEdge))
+
+    # Brings the edge energies, station trees and contraction hierarchy up to the speed source's
+    # latest speeds, called after each speed update. Each swaps in its new arrays whole, so
+    # searches running on other threads need no lock
+    def refresh(self):
+        if self.Speeds == None:
+            return
+
+        self.Energy.update(self.Speeds)
+
+        if self.Graph.StationTrees != None:
+            self.Graph.StationTrees.refresh(self.Speeds)
+
+        if self.Graph.Hierarchy != None:
+            self.Graph.Hierarchy.refresh(self.Speeds)
+
+    # Reads how many EVs are charging at every station, called once a step before planning
+    # With a reservation table only the time is read, and stops that have ended are dropped
+    # With these counts and an edge speed snapshot, planning makes no TraCI calls
+    def updateStations(self):
+        if self.Reservations != None:
+            self.Time = traci.simulation.getTime()
+            self.Reservations.expire(self.Time)
+            return
+
+        self.VehiclesCharging = {cs.id: traci.chargingstation.getVehicleCount(cs.id) for cs in self.Graph.ChargingStations}
+
+    # EVs charging at a station, expected travelTime seconds after the last updateStations with a
+    # reservation table, otherwise from the last updateStations or straight from TraCI without it
+    # The forecast counts the stops already given to other EVs that will still be charging then
+    def getVehiclesCharging(self, csID, travelTime=0):
+        if self.Reservations != None:
+            return self.Reservations.getOccupancy(csID, self.Time + travelTime)
+
+        if self.VehiclesCharging != None:
+            return self.VehiclesCharging[csID]
+
+        return traci.chargingstation.getVehicleCount(csID)
+
+    # Records an EV's charging stops in the reservation table, for an EV leaving at departTime
+    # Each stop's ETA is the travel time along the route up to the station's edge, plus the
+    # stops before it
+    def reserveStops(self, route, csStops, departTime):
+        if self.Reservations == None or len(csStops) == 0:
+            return
+
+        eta = departTime
+        stop = 0
+
+        for edge in route:
+            if edge == csStops[stop].Lane:
+                self.Reservations.reserve(csStops[stop].id, eta, csStops[stop].Duration)
+                eta += csStops[stop].Duration
+                stop += 1
+
+                if stop == len(csStops):
+                    return
+
+            eta += catchZeroDivision(self.Graph.getEdgeLength(edge), self.getEdgeSpeed(edge))
+
+        logger.warning('Charging stop not on route, not reserved: %s', csStops[stop].id)
+
+    # Travel time along a route plus the duration of its charging stops
+    def getElapsedTime(self, route, csStops):
+        travelTime = sum(catchZeroDivision(self.Graph.getEdgeLength(edge), self.getEdgeSpeed(edge)) for edge in route)
+
+        return travelTime + sum(cs.Duration for cs in csStops)
+
+    # Route and charging stops for an EV from the start of one edge to the end of another
+    @timed('route')
+    def route(self, start, end, battery, hyperParams, labelSetting=False):
+        graph = self.Graph
+
+        if self.Speeds != None:
+            self.Speeds.recordUse()
+
+        startNode = graph.getEdgeFromNode(start)
+        endNode = graph.getEdgeToNode(end)
+        evRange = estimateRange(battery.BatteryCapacity)
+        evRangeAtCS = evRange
+        evRangeAtSearch = evRange
+
+        route = []
+        routeLength = 0
+        csStops = []
+        csSearchNode = startNode
+
+        logger.debug('evRange: %s', evRange)
+        logger.debug('startNode: %s', startNode)
+        logger.debug('endNode: %s', endNode)
+
+        # One search over node and range gives the whole route with its charging stops
+        if labelSetting:
+            route, csStops = self.labelSettingSearch(startNode, endNode, evRange, battery, hyperParams)
+
+        while not labelSetting:
+            tempRoute, tempLength = self.searchRoute(startNode, endNode, evRange, False, battery)
+
+            # When initial route gets something back, saves route and sets new start as last node
+            if tempRoute != []:
+                if tempRoute != None:
+                    # Range is used up by the Wh the energy model gives the route, as in the search
+                    tempEnergy = self.Energy.getRouteEnergy(tempRoute)
+                    csSearchNode = graph.getEdgeToNode(tempRoute[-1])
+                    evRangeAtSearch = evRange - estimateRange(tempEnergy)
+
+                    # End cycle for route search if reached the end
+                    if graph.getEdgeToNode(tempRoute[-1]) == endNode:
+                        evRange, csStops = calculateCSRefuel(evRangeAtCS, csStops, tempEnergy, hyperParams["GoalCapacityAtEnd"], battery)
+                        route += tempRoute
+                        routeLength += tempLength
+                        break
+
+            # Time until the EV reaches the search node, for the expected station occupancy
+            elapsed = 0
+
+            if self.Reservations != None:
+                elapsed = self.getElapsedTime(route, csStops) + (evRange - evRangeAtSearch) / graph.MaxSpeed
+
+            tempRoute, tempLength, csStop = self.routeViaCS(startNode, endNode, evRangeAtSearch, csSearchNode, evRange, hyperParams, elapsed)
+
+            if tempRoute == None:
+                # Check if can route CS from start instead when no route from search node
+                if csSearchNode != startNode:
+                    if self.Reservations != None:
+                        elapsed = self.getElapsedTime(route, csStops)
+
+                    tempRoute, tempLength, csStop = self.routeViaCS(startNode, endNode, evRange, startNode, evRange, hyperParams, elapsed)
+
+                if tempRoute == None:
+                    logger.warning('No valid route for EV with current capacity')
+                    route = []
+                    routeLength = 0
+                    break
+
+            tempEnergy = self.Energy.getRouteEnergy(tempRoute)
+
+            if tempRoute != []:
+                if graph.getEdgeToNode(tempRoute[-1]) == endNode:
+                    evRange, csStops = calculateCSRefuel(evRangeAtCS, csStops, tempEnergy, hyperParams["GoalCapacityAtEnd"], battery)
+                    break
+
+            route += tempRoute
+            routeLength += tempLength
+
+            # Set new start node from node after charging station
+            # Used to find next section route
+            startNode = graph.getEdgeToNode(route[-1])
+            csStops.append(csStop)
+
+            # Get current EV range that has just been travelled
+            evRange -= estimateRange(tempEnergy)
+            evRangeAtCS -= estimateRange(tempEnergy)
+
+            # Set ev range as 100% making as can charge full at cs
+            # Work out correct when get next route
+            evRange, csStops = calculateCSRefuel(evRange, csStops, tempEnergy, 100, battery)
+
+        if labelSetting:
+            routeLength = graph.getRouteLength(route)
+
+        logger.debug('route: %s', route)
+        logger.debug('routeLength: %s', routeLength)
+        logger.debug('evRange at end: %s', evRange)
+        logger.debug('CS Stops: %s', len(csStops))
+
+        for i, cs in enumerate(csStops):
+            logger.debug('CS %s: %s', i, cs.Duration)
+
+        return route, csStops
+
+    @timed('routeViaCS')
+    def routeViaCS(self, startNode, endNode, evRangeAtSearch, csSearchNode, evRange, hyperParams, elapsed=0):
+        closestCSs = self.getNeighbouringCS(csSearchNode, endNode, evRangeAtSearch, elapsed)
+
+        if len(closestCSs) > 0:
+            with self.Instrumentation.timer('getBestCS'):
+                rankedCSs = getRankedCS(closestCSs, hyperParams, hyperParams.get("FallbackStations", 1))
+                profilePicks = getProfilePicks(closestCSs, self.ProfileWeights) if self.Profiles != None else None
+
+            # Falls back to the next best stations when there is no route to the best one
+            for chargingStation in rankedCSs:
+                route, routeLength = self.routeToCS(startNode, chargingStation, evRange)
+
+                if route == None:
+                    logger.debug('Error, no route to CS.')
+                    continue
+
+                # Append the connecting node to the edge where the CS
+                # lies incase more than one edge coming from start node
+                routeLength += self.Graph.getEdgeLength(chargingStation.Lane)
+                route.append(chargingStation.Lane)
+
+                if profilePicks != None:
+                    chargingStation.ProfilePicks = dict(zip(self.Profiles, profilePicks))
+
+                return route, routeLength, chargingStation
+
+            return None, None, None
+
+        logger.debug('Error, no charging stations available for EV.')
+        return None, None, None
+
+    # Route from a node to the start of a charging station's edge
+    # Read off the station's shortest path tree when the graph has them, otherwise searched with A*
+    @timed('routeToCS')
+    def routeToCS(self, startNode, chargingStation, evRange):
+        graph = self.Graph
+
+        if graph.StationTrees == None:
+            return self.searchRoute(startNode, graph.getEdgeFromNode(chargingStation.Lane), evRange, True)
+
+        station = graph.StationTrees.StationIndex[chargingStation.id]
+        distances, times = graph.StationTrees.getStationCosts(startNode)
+
+        if distances[station] > evRange:
+            logger.debug('Error, cannot find valid route with current range.')
+            return None, 0
+
+        route = graph.StationTrees.getRoute(station, startNode)
+
+        if route == None:
+            return None, 0
+
+        return route, graph.getRouteLength(route)
+
+    # Runs the route search through the route cache when there is one
+    # The cache needs the speed snapshot to know how old a cached route's speeds are
+    @timed('searchRoute')
+    def searchRoute(self, start, end, evRange, csRouting, battery=None):
+        if self.Cache == None or self.Speeds == None:
+            return self.runSearch(start, end, evRange, csRouting, battery)
+
+        key = self.Cache.getKey(start, end, evRange, csRouting)
+        cached = self.Cache.get(key, self.Speeds.RefreshStep)
+
+        if cached != None:
+            self.Instrumentation.count('CacheHits')
+            return cached
+
+        self.Instrumentation.count('CacheMisses')
+        route, routeLength = self.runSearch(start, end, evRange, csRouting, battery)
+        self.Cache.put(key, route, routeLength, self.Speeds.RefreshStep)
+
+        return route, routeLength
+
+    # Puts the quickest routes of a batch of EVs in the route cache for their first search, with
+    # one search from a cost matrix for all EVs sharing a start or end node
+    # Requests are (start edge, end edge) of EVs with the same battery. EVs are grouped on the
+    # side with fewer distinct nodes and only groups of two or more are searched. Like the
+    # hierarchy's routes, only routes the EV finishes above 10% SOC are kept, the rest are left
+    # to A* to find where the SOC runs low
+    def shareSearches(self, matrix, requests, battery):
+        if self.Cache == None or self.Speeds == None:
+            return
+
+        graph = self.Graph
+        evRange = estimateRange(battery.BatteryCapacity)
+        pairs = sorted(set((graph.getEdgeFromNode(start), graph.getEdgeToNode(end)) for start, end in requests))
+        pairs = [(startNode, endNode) for startNode, endNode in pairs if startNode != endNode]
+        forward = len(set(startNode for startNode, endNode in pairs)) <= len(set(endNode for startNode, endNode in pairs))
+        grouped = {}
+
+        for startNode, endNode in pairs:
+            if forward:
+                grouped.setdefault(startNode, []).append(endNode)
+            else:
+                grouped.setdefault(endNode, []).append(startNode)
+
+        groups = [(root, nodes) for root, nodes in grouped.items() if len(nodes) > 1]
+
+        if len(groups) == 0:
+            return
+
+        matrix.refresh(self.Speeds)
+        shared = 0
+
+        for (root, nodes), routes in zip(groups, matrix.getRoutes(groups, forward)):
+            for node, route in zip(nodes, routes):
+                if route == None or estimateEnergySOC(evRange, self.Energy.getRouteEnergy(route), battery) < 10:
+                    continue
+
+                startNode, endNode = (root, node) if forward else (node, root)
+                self.Cache.put(self.Cache.getKey(startNode, endNode, evRange, False), route, graph.getRouteLength(route), self.Speeds.RefreshStep)
+                shared += 1
+
+        logger.debug('Shared %s routes from %s searches', shared, len(groups))
+
+    # Queries the graph's contraction hierarchy when it has one, otherwise searches with A*
+    # A* is still used when the EV cannot reach the end, as it finds where the SOC runs low
+    def runSearch(self, start, end, evRange, csRouting, battery=None):
+        if self.Graph.Hierarchy == None:
+            return self.aStarSearch(start, end, evRange, csRouting, battery)
+
+        with self.Instrumentation.timer('hierarchyQuery'):
+            route, routeLength, settled = self.Graph.Hierarchy.query(start, end)
+
+        self.Instrumentation.count('HierarchySettled', settled)
+
+        if route == None:
+            return None, 0
+
+        routeEnergy = self.Energy.getRouteEnergy(route)
+
+        if csRouting:
+            if estimateBatteryCapacity(evRange) < routeEnergy:
+                logger.debug('Error, cannot find valid route with current range.')
+                return None, 0
+
+            return route, routeLength
+
+        if estimateEnergySOC(evRange, routeEnergy, battery) >= 10:
+            return route, routeLength
+
+        return self.aStarSearch(start, end, evRange, csRouting, battery)
+
+    # Finds route from start to end nodes using A* searching pathfinding Algorithm
+    # Considers EV current vehicle battery and whether will suffice in making the journey
+    # Open list is a binary heap with lazy deletion, stale entries are skipped when popped
+    # The battery profile is only needed for the SOC check when not routing to a CS
+    # Energy used to reach each node is kept with it, so the SOC and range of the node being
+    # expanded are checked without going back over its route
+    @timed('aStarSearch')
+    def aStarSearch(self, start, end, evRange, csRouting, battery=None):
+        compact = self.Graph.Compact
+        start = compact.NodeIndex[start]
+        end = compact.NodeIndex[end]
+        endCoords = compact.getCoord(end)
+        heuristics = {}
+        heuristics[start] = self.cachedHeuristic(start, endCoords)
+
+        openHeap = [(heuristics[start], 0, 0, start)]
+        openList = set([start])
+        closedList = set([])
+        # Newest entry wins ties on f, matching the linear scan as closely as set order allows
+        pushCount = itertools.count(-1, -1)
+
+        offsets = compact.OffsetList
+        targets = compact.TargetList
+        lengths = compact.LengthList
+        connectionLengths = compact.ConnectionLengths
+        edgeCount = compact.EdgeCount
+        edgeEnergy = self.Energy.EdgeEnergy
+        edgeRate = self.Energy.EdgeRate
+        speedIndex, speedList = self.getSpeedLists()
+        evEnergy = estimateBatteryCapacity(evRange)
+
+        # Edge each node was reached by, the route is read back along these
+        routeEdge = {}
+        routeEdge[start] = None
+
+        routeCost = {}
+        routeCost[start] = 0
+
+        # Length of the route to each node including the junctions between its edges
+        routeLength = {}
+        routeLength[start] = 0
+
+        # Wh used on the route to each node, junctions used at the rate of the edge they lead onto
+        routeEnergy = {}
+        routeEnergy[start] = 0
+
+        # Nodes expanded, counted here as the router is shared between threads
+        expansions = 0
+
+        while len(openHeap) > 0:
+            priority, order, nodeCost, currentNode = heapq.heappop(openHeap)
+
+            # Skip entries for closed nodes or ones superseded by a cheaper route
+            if currentNode not in openList or nodeCost != routeCost[currentNode]:
+                continue
+
+            expansions += 1
+
+            if currentNode == end:
+                self.Instrumentation.count('Expansions', expansions)
+                return self.reconstructRoutePath(currentNode, routeEdge, routeLength)
+
+            # Checks whether soc under limit when getting intial route or route from CS
+            if not csRouting:
+                currentSOC = estimateEnergySOC(evRange, routeEnergy[currentNode], battery)
+
+                if currentSOC < 10:
+                    logger.debug('Refuel required, SOC: %s', currentSOC)
+                    self.Instrumentation.count('Expansions', expansions)
+                    return self.reconstructRoutePath(currentNode, routeEdge, routeLength)
+
+            # Dead end nodes have no outgoing edges to evaluate
+            currentEdge = routeEdge[currentNode]
+
+            for connectingEdge in range(offsets[currentNode], offsets[currentNode + 1]):
+                neighbourNode = targets[connectingEdge]
+                length = lengths[connectingEdge]
+
+                if speedList != None:
+                    edgeStepSpeed = speedList[speedIndex[connectingEdge]]
+                else:
+                    edgeStepSpeed = self.getEdgeSpeed(compact.EdgeIDs[connectingEdge])
+
+                # Travel time is cost of each node, length / speed of road, this gets fastest and shortest route
+                newCost = routeCost[currentNode] + (length / edgeStepSpeed if edgeStepSpeed != 0 else 0)
+
+                # Length adds the junction from the edge the current node was reached by, turns
+                # without a connection add nothing
+                newLength = routeLength[currentNode] + length
+                newEnergy = routeEnergy[currentNode] + edgeEnergy[connectingEdge]
+
+                if currentEdge != None:
+                    connectionLength = connectionLengths.get(currentEdge * edgeCount + connectingEdge, 0)
+                    newLength += connectionLength
+                    newEnergy += connectionLength * edgeRate[connectingEdge]
+
+                if neighbourNode not in openList and neighbourNode not in closedList:
+                    openList.add(neighbourNode)
+                    routeEdge[neighbourNode] = connectingEdge
+                    routeCost[neighbourNode] = newCost
+                    routeLength[neighbourNode] = newLength
+                    routeEnergy[neighbourNode] = newEnergy
+
+                elif routeCost[neighbourNode] > newCost:
+                    routeCost[neighbourNode] = newCost
+                    routeEdge[neighbourNode] = connectingEdge
+                    routeLength[neighbourNode] = newLength
+                    routeEnergy[neighbourNode] = newEnergy
+
+                    if neighbourNode in closedList:
+                        closedList.remove(neighbourNode)
+                        openList.add(neighbourNode)
+
+                else:
+                    continue
+
+                if neighbourNode not in heuristics:
+                    heuristics[neighbourNode] = self.cachedHeuristic(neighbourNode, endCoords)
+
+                heapq.heappush(openHeap, (newCost + heuristics[neighbourNode], next(pushCount), newCost, neighbourNode))
+
+            if csRouting:
+                if evEnergy < routeEnergy[currentNode]:
+                    logger.debug('Error, cannot find valid route with current range.')
+                    break
+
+            closedList.add(currentNode)
+            openList.remove(currentNode)
+
+        self.Instrumentation.count('Expansions', expansions)
+
+        return None, 0
+
+    # Single pass search over (node, energy) labels that plans the charging stops with the route
+    # Driving an edge uses its Wh from the energy model, and at the start of a charging station's
+    # edge a label can also drive the edge while charging up to each of CHARGE_LEVELS, costing the
+    # time the charge takes plus the wait for EVs already charging there. Energy is kept above
+    # MinimumSoC, unless the EV starts below it, and the end has to be reached with
+    # GoalCapacityAtEnd. Labels are expanded in order of travel time plus heuristic, and a label
+    # is dropped when a label already expanded at its node has as much energy
+    # With a reservation table the EVs charging are those expected at the label's travel time
+    # Returns the edge route and charging station copies with their durations, or [], [] if
+    # there is no route within MAX_LABELS labels
+    @timed('labelSettingSearch')
+    def labelSettingSearch(self, startNode, endNode, evRange, battery, hyperParams, maxLabels=MAX_LABELS):
+        graph = self.Graph
+        compact = graph.Compact
+        startNode = compact.NodeIndex[startNode]
+        endNode = compact.NodeIndex[endNode]
+        offsets = compact.OffsetList
+        targets = compact.TargetList
+        lengths = compact.LengthList
+        edgeEnergy = self.Energy.EdgeEnergy
+        speedIndex, speedList = self.getSpeedLists()
+        evEnergy = estimateBatteryCapacity(evRange)
+        maxEnergy = battery.MaxBatteryCapacity
+        minimumEnergy = maxEnergy * (hyperParams["MinimumSoC"] / 100)
+        goalEnergy = maxEnergy * (hyperParams["GoalCapacityAtEnd"] / 100)
+        endCoords = compact.getCoord(endNode)
+
+        if evEnergy < minimumEnergy:
+            minimumEnergy = 0
+
+        # EVs charging per space at a station are queued ahead, their charges are taken to be as
+        # long as this one
+        stationSpaces = {cs.id: max(1, math.floor((cs.EndPos - cs.StartPos) / VEHICLE_SPACE)) for cs in graph.ChargingStations}
+
+        # Label columns, a label is an index into each of them
+        labelNode = [startNode]
+        labelEnergy = [evEnergy]
+        labelCost = [0]
+        labelParent = [-1]
+        labelEdge = [None]
+        labelStop = [None]
+
+        heuristics = {startNode: self.cachedHeuristic(startNode, endCoords)}
+        openHeap = [(heuristics[startNode], 0, 0)]
+        expandedEnergy = {}
+        expansions = 0
+
+        while len(openHeap) > 0:
+            priority, cost, label = heapq.heappop(openHeap)
+            node = labelNode[label]
+            currentEnergy = labelEnergy[label]
+
+            if currentEnergy <= expandedEnergy.get(node, -1):
+                continue
+
+            expandedEnergy[node] = currentEnergy
+            expansions += 1
+
+            if node == endNode and currentEnergy >= goalEnergy:
+                self.Instrumentation.count('Expansions', expansions)
+                return self.reconstructLabelRoute(label, labelParent, labelCost, labelEdge, labelStop, currentEnergy - goalEnergy)
+
+            if len(labelNode) >= maxLabels:
+                logger.warning('Error, label limit reached before finding a route.')
+                break
+
+            moves = []
+
+            for edge in range(offsets[node], offsets[node + 1]):
+                moves.append((edge, currentEnergy - edgeEnergy[edge], 0, None))
+
+            # Charging happens on the station's edge, the charge is added after driving it
+            for cs, csEdge in self.StationsByNode.get(node, []):
+                energyAtCS = currentEnergy - edgeEnergy[csEdge]
+
+                if energyAtCS < 0:
+                    continue
+
+                stationQueue = self.getVehiclesCharging(cs.id, cost) / stationSpaces[cs.id]
+
+                for level in CHARGE_LEVELS:
+                    chargedEnergy = maxEnergy * (level / 100) - energyAtCS
+
+                    if chargedEnergy > 0:
+                        duration = math.ceil(chargedEnergy / cs.ChargePerStep)
+                        moves.append((csEdge, energyAtCS + chargedEnergy, duration * (1 + stationQueue), (cs, chargedEnergy)))
+
+            for edge, newEnergy, stopTime, stop in moves:
+                neighbourNode = targets[edge]
+
+                if newEnergy < minimumEnergy or newEnergy <= expandedEnergy.get(neighbourNode, -1):
+                    continue
+
+                if neighbourNode not in heuristics:
+                    heuristics[neighbourNode] = self.cachedHeuristic(neighbourNode, endCoords)
+
+                if speedList != None:
+                    edgeSpeed = speedList[speedIndex[edge]]
+                else:
+                    edgeSpeed = self.getEdgeSpeed(compact.EdgeIDs[edge])
+
+                newCost = cost + (lengths[edge] / edgeSpeed if edgeSpeed != 0 else 0) + stopTime
+
+                labelNode.append(neighbourNode)
+                labelEnergy.append(newEnergy)
+                labelCost.append(newCost)
+                labelParent.append(label)
+                labelEdge.append(edge)
+                labelStop.append(stop)
+
+                heapq.heappush(openHeap, (newCost + heuristics[neighbourNode], newCost, len(labelNode) - 1))
+
+        self.Instrumentation.count('Expansions', expansions)
+        logger.warning('No valid route for EV with current capacity')
+        return [], []
+
+    # Edge route and charging stops of a label from its parent labels
+    # The last stop only charges what is needed to reach the end with the goal capacity, the spare
+    # energy is taken off its charge and the stop dropped if nothing is left
+    def reconstructLabelRoute(self, label, labelParent, labelCost, labelEdge, labelStop, spareEnergy):
+        route = []
+        csStops = []
+
+        while labelParent[label] != -1:
+            route.append(self.Graph.Compact.EdgeIDs[labelEdge[label]])
+
+            if labelStop[label] != None:
+                cs, chargedEnergy = labelStop[label]
+
+                chargedEnergy -= min(spareEnergy, chargedEnergy)
+                spareEnergy = 0
+
+                if chargedEnergy > 0:
+                    cs = copy.copy(cs)
+                    cs.Duration = math.ceil(chargedEnergy / cs.ChargePerStep)
+                    cs.VehiclesCharging = self.getVehiclesCharging(cs.id, labelCost[labelParent[label]])
+                    csStops.append(cs)
+
+            label = labelParent[label]
+
+        route.reverse()
+        csStops.reverse()
+
+        return route, csStops
+
+    # Speed list of the speed source and the position of each compact edge in it, read once per
+    # search as the source swaps its list whole, or None, None when speeds are read per edge
+    def getSpeedLists(self):
+        if self.SpeedIndex == None:
+            return None, None
+
+        return self.SpeedIndex, self.Speeds.SpeedList
+
+    # Mean speed of an edge from the step snapshot, or straight from TraCI without one
+    def getEdgeSpeed(self, edge):
+        if self.Speeds != None:
+            return self.Speeds.getSpeed(edge)
+
+        return traci.edge.getLastStepMeanSpeed(edge)
+
+    # Heuristic of a compact node index against already looked up end co-ords, so each node costs
+    # one co-ord lookup
+    def cachedHeuristic(self, currentNode, endCoords):
+        return euclideanDistance(self.Graph.Compact.getCoord(currentNode), endCoords) / self.Graph.MaxSpeed
+
+    # Estimating the heristic as the euclidean distance from current to end divided
+    # by the max speed of any
+    def heuristic(self, currentNode, endNode):
+        return self.distanceBetweenNodes(currentNode, endNode) / self.Graph.MaxSpeed
+
+    # Get distance from node to end node using euclidean distance
+    # Used for heuristic in A*
+    def distanceBetweenNodes(self, currentNode, endNode):
+        currentCoords = self.Graph.getNodeCoord(currentNode)
+        endCoords = self.Graph.getNodeCoord(endNode)
+
+        return euclideanDistance(currentCoords, endCoords)
+
+    # Edge route to a node for sumo vehicle to follow, read back along the edges the search
+    # reached each node by, with the length the search already summed including junctions
+    # Nodes and edges are compact indices, the route is given back as edge IDs
+    @timed('reconstructRoutePath')
+    def reconstructRoutePath(self, current, routeEdge, routeLength):
+        compact = self.Graph.Compact
+        newRoute = []
+        length = routeLength[current]
+        edge = routeEdge[current]
+
+        while edge != None:
+            newRoute.append(compact.EdgeIDs[edge])
+            edge = routeEdge[compact.SourceList[edge]]
+
+        newRoute.reverse()
+
+        return newRoute, length
+
+    # Get all the neighboring charging stations from within the range of the EVs current battery capacity
+    # Candidates come from the station trees or the graph's spatial index and are copies, so per
+    # query attributes never leak into the shared stations or other EVs' stops
+    # The EV reaches the main node elapsed seconds from now and each station at the max speed from there
+    @timed('getNeighbouringCS')
+    def getNeighbouringCS(self, mainNode, endNode, radius, elapsed=0):
+        graph = self.Graph
+        nodeCoords = graph.getNodeCoord(mainNode)
+        endCoords = graph.getNodeCoord(endNode)
+        chargingStations = []
+
+        # With station trees the range is checked against the network distance to each station,
+        # otherwise against the straight line distance with a margin for the road layout
+        if graph.StationTrees != None:
+            candidates, distances = graph.StationTrees.reachableStations(mainNode, radius)
+        else:
+            radius = radius - (radius * 0.3)
+            candidates, distances = graph.CSIndex.radiusQuery(nodeCoords, radius)
+
+        # Distance of every candidate from the line to the end, in one query over the index
+        candidates, dividers = graph.CSIndex.corridorQuery(nodeCoords, endCoords, stations=candidates)
+
+        for i, distance, divider in zip(candidates.tolist(), distances.tolist(), dividers.tolist()):
+            cs = copy.copy(graph.ChargingStations[i])
+            cs.DistanceFromStart = distance
+            cs.DistanceFromDivider = divider
+            cs.VehiclesCharging = self.getVehiclesCharging(cs.id, elapsed + distance / graph.MaxSpeed)
+            cs.Price = uniform(0.1, 0.25)
+
+            chargingStations.append(cs)
+
+        return chargingStations
+
+# Make MCDM based on SAW technique and normalizing the data using vector normalization
+# https://hal.inria.fr/hal-01438251/document#:~:text=They%20used%20a%20ranking%20consistency,SAW%20is%20the%20vector%20normalization.
+# http://citeseerx.ist.psu.edu/viewdoc/download?doi=10.1.1.134.8891&rep=rep1&type=pdf
+def getBestCS(closestCSs, hyperParams):
+    return getRankedCS(closestCSs, hyperParams, 1)[0]
+
+# Charging stations ordered by SAW score, best first, limited to the top k
+# Scores are computed in one vectorised call over the stations' attribute matrix
+def getRankedCS(closestCSs, hyperParams, k=None):
+    scores = scoring.scoreChargingStations(scoring.buildAttributeMatrix(closestCSs), scoring.buildWeightVector(hyperParams))
+
+    for cs, score in zip(closestCSs, scores.tolist()):
+        cs.Score = score
+
+    return [closestCSs[i] for i in scoring.rankChargingStations(scores, k).tolist()]
+
+# ID of the best station for each profile of a (profiles x attributes) weight matrix, from one
+# scoring call over every profile
+def getProfilePicks(closestCSs, weights):
+    scores = scoring.scoreChargingStations(scoring.buildAttributeMatrix(closestCSs), weights)
+
+    return [closestCSs[i].id for i in scoring.rankChargingStations(scores, 1)[:, 0].tolist()]
+
+# Utility function to catch 0 value errors on division
+def catchZeroDivision(x, y):
+    try:
+        return x / y
+    except ZeroDivisionError:
+        return 0
+
+# Get the correct range and duration needed from and for EV for last charging station stop
+# The route energy is the Wh the route after the stop uses
+def calculateCSRefuel(evRange, chargingStations, routeEnergy, goalPercentage, battery):
+    if len(chargingStations) > 0:
+        # Get Wh still needed to complete journey
+        currentEstCapacity = estimateBatteryCapacity(evRange)
+        energyNeeded = routeEnergy - currentEstCapacity
+        maxBatteryCapacity = battery.MaxBatteryCapacity
+
+        capacityNeeded = energyNeeded + (maxBatteryCapacity * (goalPercentage / 100))
+
+        # Needed capacity as max battery capacity if greater
+        # Ensure no unnecessary time wasted at CS
+        if capacityNeeded > maxBatteryCapacity:
+            capacityNeeded = maxBatteryCapacity - currentEstCapacity
+
+        csChargePerStep = (chargingStations[-1].Power * chargingStations[-1].Efficiency) / 3600
+        durationToNeeded = math.ceil(capacityNeeded / csChargePerStep)
+
+        chargingStations[-1].Duration = durationToNeeded
+        newCapacity = currentEstCapacity + (chargingStations[-1].Duration * csChargePerStep)
+
+        evRange = estimateRange(newCapacity - routeEnergy)
+
+    return evRange, chargingStations
+
+# Calculates distance between to points from co-ords
+def euclideanDistance(aCoords, bCoords):
+    x = bCoords[0] - aCoords[0]
+    y = bCoords[1] - aCoords[1]
+
+    return math.sqrt((x ** 2) + (y ** 2))
+
+# Estimates range for EV from current battery capacity
+# Returns value in meters
+# https://sumo.dlr.de/docs/Models/Electric.html#calculating_the_remaining_range
+def estimateRange(batteryCapacity):
+    return batteryCapacity * getMetersPerWatt()
+
+# Estimate the battery capacity needed from refuel at charging station to get to destination
+# Returns value in Wh
+def estimateBatteryCapacity(evRange):
+    return evRange / getMetersPerWatt()
+
+# Get estimated state of charge for current spot in location
+def estimateSOC(evRange, routeLength, battery):
+    currentRange = evRange - routeLength
+    currentSOC = (estimateBatteryCapacity(currentRange) / battery.MaxBatteryCapacity) * 100
+    return currentSOC if currentSOC < 100 else 100
+
+# Get estimated state of charge after using energy Wh of the EV's range
+def estimateEnergySOC(evRange, energy, battery):
+    currentSOC = ((estimateBatteryCapacity(evRange) - energy) / battery.MaxBatteryCapacity) * 100
+    return currentSOC if currentSOC < 100 else 100
+
+# Get the meters per Watt-hour of the current EV to use in range and capacity calculations
+# Current value got from prev simulation, getting the mean from each mWh time step value
+def getMetersPerWatt():
+    # mWh = traci.vehicle.getDistance('EV_Main') / float(traci.vehicle.getParameter(vehID, "device.battery.totalEnergyConsumed"))
+    mWh = METERS_PER_WATT
+    return mWh
+
+# Distance calculation from point to a line
+# https://geomalgorithms.com/a02-_lines.html
+def distanceFromLine(lineA, lineB, csCoords, lineDistance):
+    eqTop = ((lineB[0] - lineA[0]) * (lineA[1] - csCoords[1])) - ((lineA[0] - csCoords[0]) * (lineB[1] - lineA[1]))
+
+    return abs(catchZeroDivision(eqTop, lineDistance))
@@ -0,0 +1,98 @@
+import math
+import numpy as np
+
+# Uniform grid over charging station positions
+# Queries only visit the cells overlapping the search area and return station indices into
+# Graph.ChargingStations in ascending order, so callers see stations in the same order as a
+# linear scan would
+class ChargingStationIndex:
+    def __init__(self, chargingStations, cellSize=None):
+        self.X = np.array([cs.X for cs in chargingStations], dtype=np.float64)
+        self.Y = np.array([cs.Y for cs in chargingStations], dtype=np.float64)
+        self.Count = len(chargingStations)
+        self.Cells = {}
+
+        if self.Count == 0:
+            self.CellSize = 1
+            return
+
+        # Default cell size gives roughly one station per cell over the station extent
+        if cellSize == None:
+            extent = max(self.X.max() - self.X.min(), self.Y.max() - self.Y.min())
+            cellSize = max(extent / math.ceil(math.sqrt(self.Count)), 100)
+
+        self.CellSize = cellSize
+        self.CellX = np.floor(self.X / cellSize).astype(np.int64)
+        self.CellY = np.floor(self.Y / cellSize).astype(np.int64)
+        self.MinCell = (int(self.CellX.min()), int(self.CellY.min()))
+        self.MaxCell = (int(self.CellX.max()), int(self.CellY.max()))
+
+        for i in range(self.Count):
+            self.Cells.setdefault((int(self.CellX[i]), int(self.CellY[i])), []).append(i)
+
+    # Station indices in the cells overlapping a bounding box
+    def getCandidates(self, minX, minY, maxX, maxY):
+        if self.Count == 0:
+            return np.empty(0, dtype=np.int64)
+
+        fromX = max(math.floor(minX / self.CellSize), self.MinCell[0])
+        toX = min(math.floor(maxX / self.CellSize), self.MaxCell[0])
+        fromY = max(math.floor(minY / self.CellSize), self.MinCell[1])
+        toY = min(math.floor(maxY / self.CellSize), self.MaxCell[1])
+        candidates = []
+
+        # Box reaches past the grid's bounds on every side, so every station is in it
+        if (fromX, fromY) == self.MinCell and (toX, toY) == self.MaxCell:
+            return np.arange(self.Count)
+
+        for cellX in range(fromX, toX + 1):
+            for cellY in range(fromY, toY + 1):
+                candidates += self.Cells.get((cellX, cellY), [])
+
+        return np.sort(np.array(candidates, dtype=np.int64))
+
+    # Stations within the radius of a point, with their euclidean distances
+    def radiusQuery(self, coords, radius):
+        candidates = self.getCandidates(coords[0] - radius, coords[1] - radius, coords[0] + radius, coords[1] + radius)
+        distanceSquared = (coords[0] - self.X[candidates]) ** 2 + (coords[1] - self.Y[candidates]) ** 2
+        inRadius = distanceSquared <= radius ** 2
+
+        return candidates[inRadius], np.sqrt(distanceSquared[inRadius])
+
+
+    # Stations within width of the line through lineA and lineB, limited to the stretch between
+    # them and width past either end, with their distance from the line as distanceFromLine
+    # computes it. Only the given station indices are checked when stations is given, and with
+    # the default width every one checked is kept, in the order given
+    # A line of no length gives every station a distance of 0 like distanceFromLine, and keeps
+    # the ones within width of its point
+    def corridorQuery(self, lineA, lineB, width=math.inf, stations=None):
+        # The corridor's corners reach up to width * sqrt(2) past the ends along either axis
+        if stations is None:
+            if math.isinf(width):
+                stations = np.arange(self.Count)
+            else:
+                margin = width * math.sqrt(2)
+                stations = self.getCandidates(min(lineA[0], lineB[0]) - margin, min(lineA[1], lineB[1]) - margin,
+                                              max(lineA[0], lineB[0]) + margin, max(lineA[1], lineB[1]) + margin)
+
+        lineX = lineB[0] - lineA[0]
+        lineY = lineB[1] - lineA[1]
+        lineDistance = math.sqrt((lineX ** 2) + (lineY ** 2))
+        csX = self.X[stations]
+        csY = self.Y[stations]
+
+        if lineDistance == 0:
+            distance = np.zeros(len(stations))
+            inCorridor = (csX - lineA[0]) ** 2 + (csY - lineA[1]) ** 2 <= width ** 2
+
+            return stations[inCorridor], distance[inCorridor]
+
+        eqTop = (lineX * (lineA[1] - csY)) - ((lineA[0] - csX) * lineY)
+        distance = np.abs(eqTop / lineDistance)
+
+        # Position along the line from lineA
+        along = ((csX - lineA[0]) * lineX + (csY - lineA[1]) * lineY) / lineDistance
+        inCorridor = (distance <= width) & (along >= -width) & (along <= lineDistance + width)
+
+        return stations[inCorridor], distance[inCorridor]
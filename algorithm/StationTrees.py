@@ -0,0 +1,311 @@
+import heapq
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Reverse shortest path trees from every charging station over the compact evehicle graph
+# Each tree is a Dijkstra on travel time run backwards from the from node of the station's
+# edge, holding for every node the travel time and network distance to the station and the
+# first edge to take towards it. Row s of each array belongs to Graph.ChargingStations[s]
+# Refreshes repair trees into copies of the arrays and swap them in whole, so routes read on
+# other threads always come from one set of trees
+class StationTrees:
+    def __init__(self, compactGraph, chargingStations, maxSpeed):
+        self.Compact = compactGraph
+        self.Count = len(chargingStations)
+        self.StationIndex = {cs.id: i for i, cs in enumerate(chargingStations)}
+        self.Roots = np.array([self.getStationNode(compactGraph, cs) for cs in chargingStations], dtype=np.int64)
+
+        # Incoming edges of node i are IncomingEdges[IncomingOffsets[i]:IncomingOffsets[i + 1]]
+        self.IncomingEdges = np.argsort(compactGraph.Targets, kind='stable').astype(np.int32)
+        self.IncomingOffsets = np.concatenate(([0], np.cumsum(np.bincount(compactGraph.Targets, minlength=compactGraph.NodeCount))))
+        self.IncomingEdgeList = self.IncomingEdges.tolist()
+        self.IncomingOffsetList = self.IncomingOffsets.tolist()
+
+        trees = TreeArrays(np.full((self.Count, compactGraph.NodeCount), np.inf),
+                           np.full((self.Count, compactGraph.NodeCount), np.inf),
+                           np.full((self.Count, compactGraph.NodeCount), -1, dtype=np.int32),
+                           np.zeros((self.Count, compactGraph.EdgeCount), dtype=bool))
+
+        # Free flow travel times until the first speed snapshot arrives
+        self.Weights = compactGraph.Lengths / maxSpeed
+        self.WeightList = self.Weights.tolist()
+        self.Version = None
+
+        # Statistics
+        self.Refreshes = 0
+        self.Rebuilds = 0
+        self.Repairs = 0
+        self.RepairedNodes = 0
+        self.Kept = 0
+
+        for station in range(self.Count):
+            self.build(station, trees)
+
+        self.Trees = trees
+
+    # Node index the station is routed to, the from node of the edge it lies on
+    # Stations on edges without evehicle access get no tree and are never reachable
+    def getStationNode(self, compactGraph, cs):
+        edge = compactGraph.EdgeIndex.get(cs.Lane)
+
+        if edge == None:
+            logger.warning('Charging station edge has no evehicle access: %s', cs.Lane)
+            return -1
+
+        return int(compactGraph.Sources[edge])
+
+    # Dijkstra over incoming edges from the station's node with the current weights, written to
+    # the station's rows of the given arrays
+    def build(self, station, trees):
+        offsets = self.IncomingOffsetList
+        incoming = self.IncomingEdgeList
+        sources = self.Compact.SourceList
+        lengths = self.Compact.LengthList
+        weights = self.WeightList
+
+        root = int(self.Roots[station])
+
+        if root < 0:
+            return
+
+        time = {root: 0}
+        distance = {root: 0}
+        nextEdge = {}
+        closed = set()
+        openHeap = [(0, root)]
+
+        while len(openHeap) > 0:
+            nodeTime, node = heapq.heappop(openHeap)
+
+            if node in closed:
+                continue
+
+            closed.add(node)
+
+            for edge in incoming[offsets[node]:offsets[node + 1]]:
+                source = sources[edge]
+                newTime = nodeTime + weights[edge]
+
+                if source not in closed and newTime < time.get(source, np.inf):
+                    time[source] = newTime
+                    distance[source] = distance[node] + lengths[edge]
+                    nextEdge[source] = edge
+                    heapq.heappush(openHeap, (newTime, source))
+
+        nodes = np.fromiter(time.keys(), dtype=np.int64, count=len(time))
+        trees.Time[station].fill(np.inf)
+        trees.Time[station, nodes] = np.fromiter(time.values(), dtype=np.float64, count=len(time))
+        trees.Distance[station].fill(np.inf)
+        trees.Distance[station, nodes] = np.fromiter(distance.values(), dtype=np.float64, count=len(distance))
+
+        trees.NextEdge[station].fill(-1)
+        trees.InTree[station].fill(False)
+
+        if len(nextEdge) > 0:
+            treeNodes = np.fromiter(nextEdge.keys(), dtype=np.int64, count=len(nextEdge))
+            treeEdges = np.fromiter(nextEdge.values(), dtype=np.int64, count=len(nextEdge))
+            trees.NextEdge[station, treeNodes] = treeEdges
+            trees.InTree[station, treeEdges] = True
+
+        self.Rebuilds += 1
+
+    # Repairs the station's rows of the given arrays after the weights changed, touching only the
+    # nodes whose time to the station changed. Nodes below a tree edge that got slower lose their
+    # times and are reached again from their neighbours outside, the sources of edges that got
+    # faster take the quicker way, and both are passed on up the tree by Dijkstra. The times are
+    # the ones a rebuild gives, nodes with two equally quick ways may keep the other one. Trees
+    # that lose most of their nodes are rebuilt instead
+    def repair(self, station, trees, slower, faster):
+        offsets = self.Compact.OffsetList
+        targets = self.Compact.TargetList
+        incomingOffsets = self.IncomingOffsetList
+        incoming = self.IncomingEdgeList
+        sources = self.Compact.SourceList
+        lengths = self.Compact.LengthList
+        weights = self.WeightList
+
+        # List copies of the station's rows for fast scalar reads, changed nodes are written back
+        time = trees.Time[station].tolist()
+        distance = trees.Distance[station].tolist()
+        nextEdge = trees.NextEdge[station].tolist()
+        changed = set()
+
+        # Subtrees below the slower edges, found along the incoming edges each node is the next of
+        invalid = set()
+        stack = [sources[edge] for edge in slower]
+
+        while len(stack) > 0:
+            node = stack.pop()
+
+            if node in invalid:
+                continue
+
+            invalid.add(node)
+
+            for edge in incoming[incomingOffsets[node]:incomingOffsets[node + 1]]:
+                if nextEdge[sources[edge]] == edge:
+                    stack.append(sources[edge])
+
+        # Past half the nodes a rebuild is quicker than reaching them again
+        if len(invalid) > self.Compact.NodeCount / 2:
+            self.build(station, trees)
+            return
+
+        for node in invalid:
+            nextEdge[node] = -1
+            time[node] = math.inf
+            distance[node] = math.inf
+
+        changed.update(invalid)
+        openHeap = []
+
+        for node in invalid:
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+
+                if target not in invalid and time[target] + weights[edge] < time[node]:
+                    time[node] = time[target] + weights[edge]
+                    distance[node] = distance[target] + lengths[edge]
+                    nextEdge[node] = edge
+
+            if time[node] < math.inf:
+                heapq.heappush(openHeap, (time[node], node))
+
+        for edge in faster:
+            source = sources[edge]
+            target = targets[edge]
+
+            if time[target] + weights[edge] < time[source]:
+                time[source] = time[target] + weights[edge]
+                distance[source] = distance[target] + lengths[edge]
+                nextEdge[source] = edge
+                changed.add(source)
+                heapq.heappush(openHeap, (time[source], source))
+
+        while len(openHeap) > 0:
+            nodeTime, node = heapq.heappop(openHeap)
+
+            if nodeTime > time[node]:
+                continue
+
+            for edge in incoming[incomingOffsets[node]:incomingOffsets[node + 1]]:
+                source = sources[edge]
+                newTime = nodeTime + weights[edge]
+
+                if newTime < time[source]:
+                    time[source] = newTime
+                    distance[source] = distance[node] + lengths[edge]
+                    nextEdge[source] = edge
+                    changed.add(source)
+                    heapq.heappush(openHeap, (newTime, source))
+
+        nodes = np.fromiter(changed, dtype=np.int64, count=len(changed))
+        edges = np.array([nextEdge[node] for node in nodes.tolist()], dtype=np.int32)
+        previous = trees.NextEdge[station, nodes]
+
+        trees.InTree[station, previous[previous >= 0]] = False
+        trees.InTree[station, edges[edges >= 0]] = True
+        trees.NextEdge[station, nodes] = edges
+        trees.Time[station, nodes] = [time[node] for node in nodes.tolist()]
+        trees.Distance[station, nodes] = [distance[node] for node in nodes.tolist()]
+
+        self.Repairs += 1
+        self.RepairedNodes += len(changed)
+
+    # Brings the trees up to date with a new speed snapshot
+    # A tree is only repaired when one of its own edges got slower, or an edge got faster by
+    # enough to give some node a quicker way to the station, otherwise it is still exact
+    def refresh(self, speeds):
+        if speeds.Version == self.Version:
+            return
+
+        trees = self.Trees
+        weights = self.Compact.getTravelTimes(speeds)
+        increased = weights > self.Weights
+        decreased = np.flatnonzero(weights < self.Weights)
+
+        slower = trees.InTree & increased
+        faster = np.zeros((self.Count, len(decreased)), dtype=bool)
+
+        if len(decreased) > 0:
+            sources = self.Compact.Sources[decreased]
+            targets = self.Compact.Targets[decreased]
+            faster = weights[decreased] + trees.Time[:, targets] < trees.Time[:, sources]
+
+        affected = np.any(slower, axis=1) | np.any(faster, axis=1)
+
+        self.Weights = weights
+        self.WeightList = weights.tolist()
+        self.Version = speeds.Version
+        self.Refreshes += 1
+        stations = np.flatnonzero(affected).tolist()
+
+        if len(stations) > 0:
+            trees = trees.copy()
+
+            for station in stations:
+                self.repair(station, trees, np.flatnonzero(slower[station]).tolist(), decreased[faster[station]].tolist())
+
+            self.Trees = trees
+
+        self.Kept += self.Count - len(stations)
+
+    # Network distance and travel time from a node to every station, inf where unreachable
+    def getStationCosts(self, node):
+        i = self.Compact.NodeIndex.get(node)
+        trees = self.Trees
+
+        if i == None:
+            return np.full(self.Count, np.inf), np.full(self.Count, np.inf)
+
+        return trees.Distance[:, i], trees.Time[:, i]
+
+    # Stations reachable from a node within a network distance, with their distances
+    def reachableStations(self, node, maxDistance):
+        distances, times = self.getStationCosts(node)
+        reachable = np.flatnonzero(distances <= maxDistance)
+
+        return reachable, distances[reachable]
+
+    # Edge route from a node to the station's node along its tree, None if unreachable
+    def getRoute(self, station, node):
+        i = self.Compact.NodeIndex.get(node)
+        trees = self.Trees
+
+        if i == None or np.isinf(trees.Time[station, i]):
+            return None
+
+        root = int(self.Roots[station])
+        nextEdge = trees.NextEdge[station]
+        route = []
+
+        while i != root:
+            edge = int(nextEdge[i])
+            route.append(self.Compact.EdgeIDs[edge])
+            i = int(self.Compact.Targets[edge])
+
+        return route
+
+    def getStats(self):
+        return {
+            'Stations': self.Count,
+            'Refreshes': self.Refreshes,
+            'Rebuilds': self.Rebuilds,
+            'Repairs': self.Repairs,
+            'RepairedNodes': self.RepairedNodes,
+            'Kept': self.Kept
+        }
+
+# Arrays of every station's tree, rows are only written before the set is swapped in
+class TreeArrays:
+    def __init__(self, time, distance, nextEdge, inTree):
+        self.Time = time
+        self.Distance = distance
+        self.NextEdge = nextEdge
+        self.InTree = inTree
+
+    def copy(self):
+        return TreeArrays(self.Time.copy(), self.Distance.copy(), self.NextEdge.copy(), self.InTree.copy())
@@ -0,0 +1,143 @@
+import os
+import csv
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Files of a trace directory, each binary file is a row per simulation step
+TRACE_META = 'meta.json'
+TRACE_SPEEDS = 'speeds.bin'
+TRACE_STATIONS = 'stations.bin'
+TRACE_TIMES = 'times.bin'
+TRACE_REQUESTS = 'requests.csv'
+
+SPEED_DTYPE = np.float32
+STATION_DTYPE = np.int16
+TIME_DTYPE = np.float64
+
+# Records the traffic state the router sees every simulation step into a trace directory
+# Edge speeds come from the speed snapshot and charging station counts from TraCI, written as
+# fixed width binary rows so step i is at a known offset and the files can be memory mapped.
+# The EVs the simulation plans are kept too, as the default queries to replay
+class TraceRecorder:
+    def __init__(self, traceDir, speeds, chargingStations):
+        os.makedirs(traceDir, exist_ok=True)
+
+        self.TraceDir = traceDir
+        self.Speeds = speeds
+        self.StationIDs = [cs.id for cs in chargingStations]
+        self.Steps = 0
+
+        self.SpeedFile = open(os.path.join(traceDir, TRACE_SPEEDS), 'wb')
+        self.StationFile = open(os.path.join(traceDir, TRACE_STATIONS), 'wb')
+        self.TimeFile = open(os.path.join(traceDir, TRACE_TIMES), 'wb')
+        self.RequestFile = open(os.path.join(traceDir, TRACE_REQUESTS), 'w', newline='')
+        self.Requests = csv.writer(self.RequestFile)
+        self.Requests.writerow(['Step', 'EV', 'Start Edge', 'End Edge', 'Battery (Wh)'])
+
+    # Appends the row of a step, steps have to be recorded in order starting from 0
+    def record(self, step, time, vehicleCounts):
+        if step != self.Steps:
+            logger.warning('Trace steps have to be recorded in order, expected %s got %s', self.Steps, step)
+            return
+
+        self.SpeedFile.write(self.Speeds.Speeds.astype(SPEED_DTYPE).tobytes())
+        self.StationFile.write(np.array(vehicleCounts, dtype=STATION_DTYPE).tobytes())
+        self.TimeFile.write(np.array([time], dtype=TIME_DTYPE).tobytes())
+        self.Steps += 1
+
+    def recordRequest(self, step, evName, fromEdge, toEdge, batteryCapacity):
+        self.Requests.writerow([step, evName, fromEdge, toEdge, batteryCapacity])
+
+    # Closes the files and writes the metadata the trace is read back with
+    def close(self):
+        for f in [self.SpeedFile, self.StationFile, self.TimeFile, self.RequestFile]:
+            f.close()
+
+        with open(os.path.join(self.TraceDir, TRACE_META), 'w') as f:
+            json.dump({'Steps': self.Steps, 'EdgeIDs': self.Speeds.EdgeIDs, 'StationIDs': self.StationIDs}, f)
+
+# Read only view of a recorded trace, the step arrays are memory mapped so opening a trace
+# costs the same whatever its length and processes replaying it share the pages
+class Trace:
+    def __init__(self, traceDir):
+        with open(os.path.join(traceDir, TRACE_META), 'r') as f:
+            meta = json.load(f)
+
+        self.TraceDir = traceDir
+        self.Steps = meta['Steps']
+        self.EdgeIDs = meta['EdgeIDs']
+        self.EdgeIndex = {edge: i for i, edge in enumerate(self.EdgeIDs)}
+        self.StationIDs = meta['StationIDs']
+
+        self.Speeds = np.memmap(os.path.join(traceDir, TRACE_SPEEDS), dtype=SPEED_DTYPE, mode='r', shape=(self.Steps, len(self.EdgeIDs)))
+        self.StationCounts = np.memmap(os.path.join(traceDir, TRACE_STATIONS), dtype=STATION_DTYPE, mode='r', shape=(self.Steps, len(self.StationIDs)))
+        self.Times = np.memmap(os.path.join(traceDir, TRACE_TIMES), dtype=TIME_DTYPE, mode='r', shape=(self.Steps,))
+
+    # Row of a step, steps past the end of the trace get its last row
+    def getRow(self, step):
+        return min(max(step, 0), self.Steps - 1)
+
+    def getVehicleCounts(self, step):
+        return dict(zip(self.StationIDs, self.StationCounts[self.getRow(step)].tolist()))
+
+    # The EVs planned during the recorded simulation as (step, evName, fromEdge, toEdge, batteryCapacity)
+    def getRequests(self):
+        with open(os.path.join(self.TraceDir, TRACE_REQUESTS), 'r', newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+
+            return [(int(row[0]), row[1], row[2], row[3], float(row[4])) for row in reader]
+
+# Edge speeds of one trace step in place of the live speed snapshot, with the same interface
+# Moving to another step loads its row and counts as a refresh
+class TraceSpeeds:
+    def __init__(self, trace):
+        self.Trace = trace
+        self.EdgeIDs = trace.EdgeIDs
+        self.EdgeIndex = trace.EdgeIndex
+        self.Speeds = np.zeros(len(self.EdgeIDs), dtype=np.float64)
+        self.SpeedList = self.Speeds.tolist()
+
+        self.Version = 0
+        self.Step = None
+        self.RefreshStep = None
+        self.Row = None
+        self.Refreshes = 0
+        self.Uses = 0
+
+    def update(self, step):
+        self.Step = step
+        row = self.Trace.getRow(step)
+
+        if row != self.Row:
+            self.Speeds = self.Trace.Speeds[row].astype(np.float64)
+            self.SpeedList = self.Speeds.tolist()
+            self.Row = row
+            self.RefreshStep = step
+            self.Version += 1
+            self.Refreshes += 1
+
+    # Edges outside the trace are not open to EVs, they are never searched
+    def getSpeed(self, edge):
+        i = self.EdgeIndex.get(edge)
+
+        if i == None:
+            return 0
+
+        return self.SpeedList[i]
+
+    def getAge(self):
+        return self.Step - self.RefreshStep
+
+    def recordUse(self):
+        self.Uses += 1
+
+    def getStats(self):
+        return {
+            'Edges': len(self.EdgeIDs),
+            'Refreshes': self.Refreshes,
+            'Uses': self.Uses
+        }
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Charging station attributes used in the MCDM, in the order the SAW score adds them up
+ATTRIBUTES = ['DistanceFromStart', 'DistanceFromDivider', 'Price', 'ChargePerStep', 'VehiclesCharging']
+
+# Benefit attributes add their normalised value, cost attributes add 1 - normalised value
+BENEFIT = np.array([False, False, False, True, False])
+
+# Builds the (stations x attributes) matrix from charging station objects
+def buildAttributeMatrix(chargingStations):
+    return np.array([[getattr(cs, attribute) for attribute in ATTRIBUTES] for cs in chargingStations],
+                    dtype=np.float64).reshape(len(chargingStations), len(ATTRIBUTES))
+
+# Weight vector for one hyper parameter profile
+def buildWeightVector(hyperParams):
+    return np.array([hyperParams[attribute] for attribute in ATTRIBUTES], dtype=np.float64)
+
+# Weight matrix (profiles x attributes) for scoring several profiles in one call
+def buildWeightMatrix(profiles):
+    return np.array([buildWeightVector(hyperParams) for hyperParams in profiles], dtype=np.float64).reshape(len(profiles), len(ATTRIBUTES))
+
+# Make MCDM based on SAW technique and normalizing the data using vector normalization
+# Weights can be one profile (attributes,) giving (stations,) scores, or several profiles
+# (profiles x attributes) giving (profiles x stations) scores
+def scoreChargingStations(matrix, weights):
+    norms = np.sqrt(np.sum(matrix ** 2, axis=0))
+
+    # Attributes that are all zero normalise to 0, as catchZeroDivision did
+    normalised = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+    contributions = np.where(BENEFIT, normalised, 1 - normalised)
+
+    if weights.ndim == 1:
+        return np.sum(contributions * weights, axis=-1)
+
+    return np.sum(contributions[np.newaxis, :, :] * weights[:, np.newaxis, :], axis=-1)
+
+# Station indices from best to worst score, ties keep station order so the first best
+# station wins like max() did, k limits the ranking to the top k. Scores of several profiles
+# are ranked per profile
+def rankChargingStations(scores, k=None):
+    ranking = np.argsort(-scores, axis=-1, kind='stable')
+
+    if k != None:
+        ranking = ranking[..., :k]
+
+    return ranking
@@ -0,0 +1,104 @@
+# Benchmark of the many-to-many cost matrix against one A* search per EV and station
+# Runs without SUMO on the same TraCI stand-in as routing.py. Sources are the from nodes of the
+# seeded EV start edges and targets every charging station. Checks the matrix travel times
+# against the travel time of each A* route, and times the matrix on one and on several processes
+import os, sys, inspect
+current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+import optparse
+import time
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import mocktraci
+import algorithm.Router
+import algorithm.BatteryProfile
+import algorithm.EdgeSpeeds
+from algorithm.Router import Router, catchZeroDivision
+from algorithm.Graph import Graph
+from algorithm.EdgeSpeeds import EdgeSpeedSnapshot
+from algorithm.CostMatrix import CostMatrix
+from algorithm.ODPairs import ODPairGenerator
+
+networks = [
+    ('EVGrid', os.path.join(parent_dir, 'EVGrid', 'data', 'EVGrid.net.xml'), os.path.join(parent_dir, 'EVGrid', 'data', 'EVGrid_additionals.add.xml')),
+    ('manchester', os.path.join(parent_dir, 'manchester', 'data', 'osm.net.xml'), os.path.join(parent_dir, 'manchester', 'data', 'Manchester_additionals.add.xml'))
+]
+
+def getSources(graph, count, seed):
+    return [graph.getEdgeFromNode(fromEdge) for fromEdge, toEdge in ODPairGenerator(graph).generate(count, seed)]
+
+def benchmarkNetwork(name, netFile, additionalFile, options):
+    graph = Graph(netFile, additionalFile)
+    mock = mocktraci.MockTraCI(mocktraci.syntheticSpeeds(graph, options.seed), {}, 0, 0)
+    mocktraci.install(mock, [algorithm.Router, algorithm.BatteryProfile, algorithm.EdgeSpeeds])
+
+    speeds = EdgeSpeedSnapshot(graph)
+    speeds.update(0)
+    router = Router(graph, speeds)
+    router.refresh()
+
+    sources = getSources(graph, options.sources, options.seed)
+    targets = [graph.getEdgeFromNode(cs.Lane) for cs in graph.ChargingStations]
+
+    start_time = time.perf_counter()
+    searchTimes = np.full((len(sources), len(targets)), np.inf)
+
+    for i, source in enumerate(sources):
+        for j, target in enumerate(targets):
+            route, length = router.aStarSearch(source, target, float('inf'), True)
+
+            if route != None:
+                searchTimes[i, j] = sum(catchZeroDivision(graph.getEdgeLength(edge), speeds.getSpeed(edge)) for edge in route)
+
+    searchRuntime = time.perf_counter() - start_time
+
+    results = {}
+
+    for jobs in sorted(set([1, options.jobs])):
+        matrix = CostMatrix(graph, jobs=jobs)
+        matrix.refresh(speeds)
+
+        start_time = time.perf_counter()
+        times, distances, energies = matrix.getStationMatrices(sources)
+        results[jobs] = (time.perf_counter() - start_time, times)
+
+    times = results[1][1]
+    reachable = np.isfinite(times) & np.isfinite(searchTimes)
+    equal = int(np.count_nonzero(np.isclose(times, searchTimes) | (np.isinf(times) & np.isinf(searchTimes))))
+
+    print(name + ': ' + str(len(sources)) + ' EVs to ' + str(len(targets)) + ' stations over ' + str(len(graph.NodeNeighbours)) + ' nodes')
+    print('  A* per pair   total ' + '%.3f' % searchRuntime + 's')
+
+    for jobs, (runtime, jobTimes) in results.items():
+        print('  matrix ' + str(jobs).ljust(6) + ' total ' + '%.3f' % runtime + 's, ' + '%.1f' % (searchRuntime / runtime) + 'x')
+
+    print('  equal         ' + str(equal) + ' of ' + str(times.size))
+    print('  A* slower     ' + str(int(np.count_nonzero(reachable & (searchTimes > times) & ~np.isclose(times, searchTimes)))))
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--sources", action="store", type="int",
+                         default=50, help="EV start nodes on each network")
+    optParser.add_option("--seed", action="store", type="int",
+                         default=0, help="Simulation seed the start edges are picked with")
+    optParser.add_option("--jobs", action="store", type="int",
+                         default=os.cpu_count(), help="Worker processes the matrix is also timed with")
+    options, args = optParser.parse_args()
+    return options
+
+if __name__ == "__main__":
+    options = get_options()
+
+    for name, netFile, additionalFile in networks:
+        if not os.path.exists(netFile):
+            print(name + ': ' + netFile + ' not found, skipping')
+            continue
+
+        benchmarkNetwork(name, netFile, additionalFile, options)
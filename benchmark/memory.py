@@ -0,0 +1,76 @@
+# Benchmark of the road graph memory with its node and edge dicts against compact mode
+# Loads each network from the graph cache with and without compact mode under tracemalloc, and
+# checks the estimate CompactGraph.memoryUsage gives for the arrays against the memory tracemalloc
+# sees allocated when the compact graph is built. The estimate is a little higher, as the edge and
+# junction lengths it counts are shared with the graph dicts, which are dropped in compact mode
+import os, sys, inspect
+current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+import gc
+import tracemalloc
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from algorithm.Graph import Graph
+from algorithm.CompactGraph import CompactGraph
+
+networks = [
+    ('EVGrid', os.path.join(parent_dir, 'EVGrid', 'data', 'EVGrid.net.xml'), os.path.join(parent_dir, 'EVGrid', 'data', 'EVGrid_additionals.add.xml')),
+    ('manchester', os.path.join(parent_dir, 'manchester', 'data', 'osm.net.xml'), os.path.join(parent_dir, 'manchester', 'data', 'Manchester_additionals.add.xml'))
+]
+
+# Memory still allocated once the graph is built, and the peak while building it
+def traceGraph(netFile, additionalFile, compact):
+    gc.collect()
+    tracemalloc.start()
+    graph = Graph(netFile, additionalFile, compact=compact)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return graph, current, peak
+
+def traceCompactGraph(graph):
+    gc.collect()
+    tracemalloc.start()
+    compactGraph = CompactGraph.fromGraph(graph)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return compactGraph, current
+
+def formatBytes(size):
+    return '%.2f' % (size / 1024 / 1024) + ' MB'
+
+def benchmarkNetwork(name, netFile, additionalFile):
+    # The first load parses the net file and writes the graph cache, so both modes are timed from the cache
+    Graph(netFile, additionalFile)
+
+    graph, dictMemory, dictPeak = traceGraph(netFile, additionalFile, False)
+    compactGraph, compactTraced = traceCompactGraph(graph)
+    nodes = len(graph.NodeNeighbours)
+    edges = len(graph.EdgeIDs)
+    del graph
+
+    graph, compactMemory, compactPeak = traceGraph(netFile, additionalFile, True)
+    del graph
+
+    print(name + ': ' + str(nodes) + ' nodes, ' + str(edges) + ' edges')
+    print('  dicts         ' + formatBytes(dictMemory) + ', peak ' + formatBytes(dictPeak))
+    print('  compact       ' + formatBytes(compactMemory) + ', peak ' + formatBytes(compactPeak) + ', '
+          + '%.1f' % (dictMemory / compactMemory) + 'x smaller')
+    print('  CSR estimate  ' + formatBytes(compactGraph.memoryUsage()) + ' from CompactGraph.memoryUsage, '
+          + formatBytes(compactTraced) + ' traced')
+
+if __name__ == "__main__":
+    for name, netFile, additionalFile in networks:
+        if not os.path.exists(netFile):
+            print(name + ': ' + netFile + ' not found, skipping')
+            continue
+
+        benchmarkNetwork(name, netFile, additionalFile)
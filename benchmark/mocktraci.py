@@ -0,0 +1,95 @@
+# In-process stand-in for the parts of TraCI the router reads, so routing can be benchmarked
+# without a running SUMO. Edge speeds are synthetic or read from a SUMO edgeData output, and
+# charging station counts and battery parameters are fixed up front
+import random
+import statistics
+import xml.etree.ElementTree as ET
+import traci.constants as tc
+
+class MockEdge:
+    def __init__(self, speeds):
+        self.Speeds = speeds
+        self.Subscribed = set()
+
+    def getLastStepMeanSpeed(self, edgeID):
+        return self.Speeds.get(edgeID, 0)
+
+    def subscribe(self, edgeID, varIDs):
+        self.Subscribed.add(edgeID)
+
+    def getAllSubscriptionResults(self):
+        return {edge: {tc.LAST_STEP_MEAN_SPEED: self.getLastStepMeanSpeed(edge)} for edge in self.Subscribed}
+
+class MockChargingStation:
+    def __init__(self, vehicleCounts):
+        self.VehicleCounts = vehicleCounts
+
+    def getVehicleCount(self, stopID):
+        return self.VehicleCounts.get(stopID, 0)
+
+class MockVehicle:
+    def __init__(self, batteryCapacity, maxBatteryCapacity):
+        self.Parameters = {
+            'device.battery.actualBatteryCapacity': str(batteryCapacity),
+            'device.battery.maximumBatteryCapacity': str(maxBatteryCapacity)
+        }
+
+    def getParameter(self, objID, param):
+        return self.Parameters.get(param, '')
+
+class MockVehicleType:
+    def __init__(self, maxBatteryCapacity):
+        self.Parameters = {'maximumBatteryCapacity': str(maxBatteryCapacity)}
+
+    def getParameter(self, objID, param):
+        return self.Parameters.get(param, '')
+
+class MockSimulation:
+    def __init__(self):
+        self.Time = 0
+
+    def getTime(self):
+        return self.Time
+
+# Stands in for the traci module, domains are reached the same way, e.g. traci.edge
+class MockTraCI:
+    def __init__(self, speeds, vehicleCounts, batteryCapacity, maxBatteryCapacity):
+        self.edge = MockEdge(speeds)
+        self.chargingstation = MockChargingStation(vehicleCounts)
+        self.vehicle = MockVehicle(batteryCapacity, maxBatteryCapacity)
+        self.vehicletype = MockVehicleType(maxBatteryCapacity)
+        self.simulation = MockSimulation()
+
+# Points the traci name of each module at the stand-in
+def install(mock, modules):
+    for module in modules:
+        module.traci = mock
+
+# Seeded speeds between minFactor and 1 of the network's max speed for every edge
+def syntheticSpeeds(graph, seed, minFactor=0.3):
+    rng = random.Random(seed)
+
+    return {edge: graph.MaxSpeed * rng.uniform(minFactor, 1) for edge in graph.EdgeIDs}
+
+# Mean speed of each edge over the intervals of a SUMO edgeData (meandata) output
+# Edges the output has no speed for keep the network's max speed
+def recordedSpeeds(graph, edgeDataFile):
+    samples = {}
+
+    for event, element in ET.iterparse(edgeDataFile):
+        if element.tag == 'edge' and element.get('speed') != None:
+            samples.setdefault(element.get('id'), []).append(float(element.get('speed')))
+
+        if element.tag == 'interval':
+            element.clear()
+
+    speeds = {edge: graph.MaxSpeed for edge in graph.EdgeIDs}
+    speeds.update({edge: statistics.mean(values) for edge, values in samples.items()})
+
+    return speeds
+
+# Seeded count of EVs charging at each station, up to maxVehicles
+def syntheticVehicleCounts(graph, seed, maxVehicles=3):
+    rng = random.Random(seed)
+
+    return {cs.id: rng.randint(0, maxVehicles) for cs in graph.ChargingStations}
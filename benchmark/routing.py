@@ -0,0 +1,200 @@
+# Routing benchmark that runs without SUMO
+# Plans the same seeded origin/destination pairs the simulation uses on each bundled
+# network, with TraCI swapped for an in-process stand-in giving synthetic or recorded edge speeds,
+# charging station counts and battery parameters. Reports route planning latency percentiles,
+# search expansions per second and memory, optionally appending them to a CSV to track over time
+import os, sys, inspect
+current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+import optparse
+import logging
+import csv
+import time
+import random
+import tracemalloc
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import main
+import mocktraci
+import algorithm.Router
+import algorithm.BatteryProfile
+import algorithm.EdgeSpeeds
+from algorithm.Router import Router
+from algorithm.BatteryProfile import BatteryProfile
+from algorithm.Graph import Graph
+from algorithm.EdgeSpeeds import EdgeSpeedSnapshot
+from algorithm.RouteCache import RouteCache
+from algorithm.ReservationTable import ReservationTable
+from algorithm.ODPairs import ODPairGenerator
+from algorithm.Instrumentation import Instrumentation
+
+networks = [
+    ('EVGrid', os.path.join(parent_dir, 'EVGrid', 'data', 'EVGrid.net.xml'), os.path.join(parent_dir, 'EVGrid', 'data', 'EVGrid_additionals.add.xml')),
+    ('manchester', os.path.join(parent_dir, 'manchester', 'data', 'osm.net.xml'), os.path.join(parent_dir, 'manchester', 'data', 'Manchester_additionals.add.xml'))
+]
+
+# Seconds between EVs, as they are injected every 10 steps in the simulation
+EV_INTERVAL = 10
+
+def buildRouter(graph, options, instrumentation):
+    speeds = None
+
+    if not options.nosnapshot:
+        speeds = EdgeSpeedSnapshot(graph)
+        speeds.update(0)
+
+    cache = RouteCache(options.routecache) if options.routecache > 0 and speeds != None else None
+    reservations = ReservationTable() if options.reservations else None
+    router = Router(graph, speeds, cache, reservations, instrumentation)
+    router.refresh()
+
+    return router
+
+# Plans every pair with a new router, returning the runtime of each plan
+# Station prices are drawn from the random module seeded like the simulation
+def planPairs(graph, mock, pairs, options, instrumentation=None):
+    random.seed(options.seed)
+    router = buildRouter(graph, options, instrumentation)
+    params = main.buildHyperParams(options.battery, options.weighting)
+    runtimes = []
+
+    for i, (fromEdge, toEdge) in enumerate(pairs):
+        mock.simulation.Time = i * EV_INTERVAL
+
+        start_time = time.perf_counter()
+        router.updateStations()
+        router.Instrumentation.beginEV('EV_' + str(i))
+        route, csStops = router.route(fromEdge, toEdge, BatteryProfile.fromVehicle('EV_' + str(i)), params, options.labelsearch)
+        router.Instrumentation.endEV()
+        router.reserveStops(route, csStops, mock.simulation.Time)
+        runtimes.append(time.perf_counter() - start_time)
+
+    return runtimes
+
+def benchmarkNetwork(name, netFile, additionalFile, options):
+    tracemalloc.start()
+    graph = Graph(netFile, additionalFile, compact=options.compact, stationTrees=options.stationtrees, hierarchy=options.hierarchy)
+    graphMemory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    if options.speeds != None:
+        speeds = mocktraci.recordedSpeeds(graph, options.speeds)
+    else:
+        speeds = mocktraci.syntheticSpeeds(graph, options.seed)
+
+    mock = mocktraci.MockTraCI(speeds, mocktraci.syntheticVehicleCounts(graph, options.seed), options.battery, options.maxbattery)
+    mocktraci.install(mock, [algorithm.Router, algorithm.BatteryProfile, algorithm.EdgeSpeeds])
+
+    # Origin/destination edge pairs as the simulation draws them for the seed
+    pairs = ODPairGenerator(graph).generate(options.pairs, options.seed)
+
+    # Timed without tracemalloc, which slows Python down, then run again for memory
+    runtimes = planPairs(graph, mock, pairs, options)
+
+    # Expansions are counted on the untimed run, the plans are the same
+    instrumentation = Instrumentation(True)
+    tracemalloc.start()
+    planPairs(graph, mock, pairs, options, instrumentation)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stats = instrumentation.getStats()
+    expansions = stats['Expansions'] + stats['HierarchySettled']
+
+    runtimes = np.array(runtimes)
+    p50, p95, p99 = np.percentile(runtimes, [50, 95, 99])
+
+    results = {
+        'Network': name,
+        'Pairs': len(pairs),
+        'Nodes': len(graph.NodeNeighbours),
+        'Mean': runtimes.mean(),
+        'P50': p50,
+        'P95': p95,
+        'P99': p99,
+        'Total': runtimes.sum(),
+        'Expansions': expansions,
+        'ExpansionsPerSecond': expansions / runtimes.sum() if runtimes.sum() > 0 else 0,
+        'GraphMemory': graphMemory,
+        'PeakRoutingMemory': peakMemory
+    }
+
+    print(name + ': ' + str(len(pairs)) + ' EVs planned over ' + str(len(graph.NodeNeighbours)) + ' nodes')
+    print('  latency       p50 ' + '%.6f' % p50 + 's, p95 ' + '%.6f' % p95 + 's, p99 ' + '%.6f' % p99 + 's')
+    print('  mean          ' + '%.6f' % results['Mean'] + 's, total ' + '%.3f' % results['Total'] + 's')
+    print('  expansions    ' + str(expansions) + ', ' + '%.0f' % results['ExpansionsPerSecond'] + '/s')
+    print('  graph memory  ' + '%.1f' % (graphMemory / 1024 / 1024) + ' MB')
+    print('  peak routing  ' + '%.1f' % (peakMemory / 1024 / 1024) + ' MB')
+
+    return results
+
+# Appends one row per network, with the options that change the results
+def writeResults(outputFile, results, options):
+    newFile = not os.path.exists(outputFile)
+    settings = ' '.join(option for option in ['labelsearch', 'stationtrees', 'hierarchy', 'reservations', 'routecache', 'nosnapshot', 'compact'] if getattr(options, option))
+
+    with open(outputFile, 'a', newline='') as f:
+        writer = csv.writer(f)
+
+        if newFile:
+            writer.writerow(['Time', 'Settings', 'Seed', 'Battery (Wh)'] + list(results[0].keys()))
+
+        for row in results:
+            writer.writerow([time.strftime('%Y-%m-%d %H:%M:%S'), settings, options.seed, options.battery] + list(row.values()))
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--pairs", action="store", type="int",
+                         default=100, help="EVs planned on each network")
+    optParser.add_option("--seed", action="store", type="int",
+                         default=0, help="Simulation seed the origin/destination pairs are picked with")
+    optParser.add_option("--battery", action="store", type="float",
+                         default=500, help="Starting battery capacity of every EV in Wh")
+    optParser.add_option("--maxbattery", action="store", type="float",
+                         default=10000, help="Maximum battery capacity in Wh")
+    optParser.add_option("--weighting", action="store", type="string",
+                         default="A", help="Hyper parameter weighting used to pick charging stations")
+    optParser.add_option("--speeds", action="store", type="string",
+                         default=None, help="SUMO edgeData output to take mean edge speeds from instead of synthetic speeds")
+    optParser.add_option("--nosnapshot", action="store_true",
+                         default=False, help="Read edge speeds per edge instead of from a speed snapshot")
+    optParser.add_option("--routecache", action="store", type="int",
+                         default=0, help="Share searches through a route cache of this many entries")
+    optParser.add_option("--compact", action="store_true",
+                         default=False, help="Keep the road graph only as compact arrays, dropping its node and edge dicts")
+    optParser.add_option("--stationtrees", action="store_true",
+                         default=False, help="Route to charging stations along reverse shortest path trees")
+    optParser.add_option("--hierarchy", action="store_true",
+                         default=False, help="Answer route searches from a contraction hierarchy")
+    optParser.add_option("--labelsearch", action="store_true",
+                         default=False, help="Plan route and charging stops in one label setting search")
+    optParser.add_option("--reservations", action="store_true",
+                         default=False, help="Forecast station occupancy from a reservation table")
+    optParser.add_option("--output", action="store", type="string",
+                         default=None, help="CSV file to append the results to")
+    optParser.add_option("--loglevel", action="store", type="string",
+                         default="ERROR", help="Level of the routing log messages")
+    options, args = optParser.parse_args()
+    return options
+
+if __name__ == "__main__":
+    options = get_options()
+    logging.basicConfig(level=options.loglevel.upper(), format='%(message)s')
+    results = []
+
+    for name, netFile, additionalFile in networks:
+        if not os.path.exists(netFile):
+            print(name + ': ' + netFile + ' not found, skipping')
+            continue
+
+        results.append(benchmarkNetwork(name, netFile, additionalFile, options))
+
+    if options.output != None and len(results) > 0:
+        writeResults(options.output, results, options)
@@ -0,0 +1,153 @@
+# Calibrates the router's energy model from SUMO battery outputs
+# Streams each battery.out.xml given once and adds the Wh every EV consumed and the meters it
+# drove to the evehicle edge it was on, in the speed band of its speed. Junction internal lanes
+# count towards the edge the EV leaves them onto, as the router uses junctions at that edge's
+# rate. The consumption of each edge and band is written to an npz keyed by the energy model's
+# edge index, ready for main.py and replay.py to load with --energycalibration
+import os
+import sys
+import optparse
+import numpy as np
+from main import iterElements
+from algorithm.Graph import Graph
+from algorithm.EnergyModel import EnergyModel, SPEED_BAND_WIDTH, SPEED_BANDS, METERS_PER_WATT
+
+# Samples buffered before they are added into the totals
+FLUSH_SAMPLES = 100000
+
+# Totals of Wh consumed and meters driven per edge and speed band over battery outputs
+class Calibration:
+    def __init__(self, energyModel):
+        self.EnergyModel = energyModel
+        self.EdgeIndex = energyModel.EdgeIndex
+        self.Energy = np.zeros((len(energyModel.EdgeIDs), SPEED_BANDS), dtype=np.float64)
+        self.Distance = np.zeros((len(energyModel.EdgeIDs), SPEED_BANDS), dtype=np.float64)
+        self.Samples = 0
+        self.Skipped = 0
+        self.clearBuffer()
+
+    def clearBuffer(self):
+        self.Edges = []
+        self.Speeds = []
+        self.Energies = []
+        self.Distances = []
+
+    # Adds one battery output, memory is bounded by the EVs driving at once, not the size of the file
+    def addFile(self, batteryFile):
+        previousTime = None
+
+        # Internal lane samples of each EV waiting for the edge it leaves the junction onto
+        junctions = {}
+
+        for timestep in iterElements(batteryFile, 'timestep'):
+            time = float(timestep.get('time'))
+            stepLength = time - previousTime if previousTime != None else 1
+            previousTime = time
+
+            for vehicle in timestep.iter('vehicle'):
+                self.addSample(vehicle, stepLength, junctions)
+
+            if len(self.Edges) >= FLUSH_SAMPLES:
+                self.flush()
+
+        self.flush()
+
+    def addSample(self, vehicle, stepLength, junctions):
+        id = vehicle.get('id')
+        lane = vehicle.get('lane')
+
+        # Charging stops are not driving
+        if lane == None or vehicle.get('chargingStationId', 'NULL') != 'NULL':
+            self.Skipped += 1
+            return
+
+        speed = float(vehicle.get('speed'))
+        energy = float(vehicle.get('energyConsumed'))
+        distance = speed * stepLength
+
+        if lane.startswith(':'):
+            junctions.setdefault(id, []).append((speed, energy, distance))
+            return
+
+        edge = self.EdgeIndex.get(lane.rsplit('_', 1)[0])
+
+        if edge == None:
+            junctions.pop(id, None)
+            self.Skipped += 1
+            return
+
+        for sample in junctions.pop(id, []) + [(speed, energy, distance)]:
+            self.Edges.append(edge)
+            self.Speeds.append(sample[0])
+            self.Energies.append(sample[1])
+            self.Distances.append(sample[2])
+
+    def flush(self):
+        if len(self.Edges) == 0:
+            return
+
+        edges = np.array(self.Edges, dtype=np.intp)
+        bands = self.EnergyModel.getBands(self.Speeds)
+
+        np.add.at(self.Energy, (edges, bands), self.Energies)
+        np.add.at(self.Distance, (edges, bands), self.Distances)
+
+        self.Samples += len(self.Edges)
+        self.clearBuffer()
+
+    # Wh per meter of every edge and band, edge bands driven less than minDistance meters take
+    # the band's consumption over the whole network, then the consumption of all driving, then
+    # the fixed METERS_PER_WATT
+    def getConsumption(self, minDistance):
+        fallback = 1 / METERS_PER_WATT
+
+        if self.Distance.sum() >= minDistance:
+            fallback = self.Energy.sum() / self.Distance.sum()
+
+        bandDistance = self.Distance.sum(axis=0)
+        bandConsumption = np.full(SPEED_BANDS, fallback)
+        driven = bandDistance >= minDistance
+        bandConsumption[driven] = self.Energy.sum(axis=0)[driven] / bandDistance[driven]
+
+        consumption = np.tile(bandConsumption, (len(self.Energy), 1))
+        driven = self.Distance >= minDistance
+        consumption[driven] = self.Energy[driven] / self.Distance[driven]
+
+        return consumption
+
+    # The totals are written with the consumption to show how much driving each value comes from
+    def write(self, outputFile, minDistance):
+        np.savez_compressed(outputFile, EdgeIDs=np.array(self.EnergyModel.EdgeIDs), BandWidth=SPEED_BAND_WIDTH,
+                            Consumption=self.getConsumption(minDistance), Energy=self.Energy, Distance=self.Distance)
+
+def get_options():
+    optParser = optparse.OptionParser(usage="%prog [options] battery.out.xml [battery.out.xml ...]")
+    optParser.add_option("--net", action="store", type="string",
+                         default=os.path.join('EVGrid', 'data', 'EVGrid.net.xml'), help="Net file the battery outputs were recorded on")
+    optParser.add_option("--additional", action="store", type="string",
+                         default=os.path.join('EVGrid', 'data', 'EVGrid_additionals.add.xml'), help="Additional file with the charging stations")
+    optParser.add_option("--output", action="store", type="string",
+                         default="energy.npz", help="npz file the consumption per edge and speed band is written to")
+    optParser.add_option("--mindistance", action="store", type="float",
+                         default=100, help="Meters an edge has to be driven in a speed band for its own consumption to be used")
+    options, args = optParser.parse_args()
+    return options, args
+
+if __name__ == "__main__":
+    options, batteryFiles = get_options()
+
+    if len(batteryFiles) == 0:
+        sys.exit('No battery outputs given')
+
+    calibration = Calibration(EnergyModel(Graph(options.net, options.additional)))
+
+    for batteryFile in batteryFiles:
+        calibration.addFile(batteryFile)
+        print(batteryFile + ': ' + str(calibration.Samples) + ' samples so far')
+
+    calibration.write(options.output, options.mindistance)
+
+    distance = calibration.Distance.sum()
+    print('Calibrated ' + str(np.count_nonzero(calibration.Distance >= options.mindistance)) + ' edge speed bands from '
+          + '%.0f' % distance + ' m driven, ' + '%.3f' % (distance / calibration.Energy.sum() if calibration.Energy.sum() > 0 else 0)
+          + ' m/Wh overall, written to ' + options.output)
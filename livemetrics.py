@@ -0,0 +1,98 @@
+import os
+import sys
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci
+import traci.constants as tc
+
+batteryKey = 'device.battery.actualBatteryCapacity'
+
+# Collects EV end of trip metrics while the simulation runs through TraCI subscriptions,
+# so the battery and trip info XML outputs do not have to be written and parsed afterwards
+# Values are held in preallocated columns, one row per tracked EV
+class LiveMetrics:
+    def __init__(self, capacity, graph):
+        self.Graph = graph
+        self.Index = {}
+        self.VehicleIDs = []
+        self.Remaining = {}
+        self.allocate(max(1, capacity))
+
+        traci.simulation.subscribe([tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS])
+
+    def allocate(self, capacity):
+        self.DepartTime = self.resize(getattr(self, 'DepartTime', None), capacity, np.nan)
+        self.ArrivalTime = self.resize(getattr(self, 'ArrivalTime', None), capacity, np.nan)
+        self.Distance = self.resize(getattr(self, 'Distance', None), capacity, 0)
+        self.BatteryCapacity = self.resize(getattr(self, 'BatteryCapacity', None), capacity, np.nan)
+        self.Capacity = capacity
+
+    # Copies a column into a new one of the given size, padding with the fill value
+    def resize(self, column, capacity, fill):
+        newColumn = np.full(capacity, fill, dtype=np.float64)
+
+        if column is not None:
+            newColumn[:len(column)] = column
+
+        return newColumn
+
+    # Starts recording an EV, called when it is added to the simulation
+    def track(self, vehicleID):
+        if len(self.VehicleIDs) == self.Capacity:
+            self.allocate(self.Capacity * 2)
+
+        self.Index[vehicleID] = len(self.VehicleIDs)
+        self.VehicleIDs.append(vehicleID)
+
+        traci.vehicle.subscribe(vehicleID, [tc.VAR_DISTANCE, tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION, tc.VAR_PARAMETER_WITH_KEY],
+                                parameters={tc.VAR_PARAMETER_WITH_KEY: ("s", batteryKey)})
+
+    # Reads this step's subscription results, called after every simulation step
+    # Arrived EVs keep the values from their last step in the network, plus the rest of the
+    # edge they were on as trip info counts the route length up to the end of the last edge
+    def update(self, time):
+        simulation = traci.simulation.getSubscriptionResults()
+
+        for vehicleID in simulation.get(tc.VAR_DEPARTED_VEHICLES_IDS, []):
+            row = self.Index.get(vehicleID)
+
+            if row != None:
+                self.DepartTime[row] = time
+
+        for vehicleID in simulation.get(tc.VAR_ARRIVED_VEHICLES_IDS, []):
+            row = self.Index.get(vehicleID)
+
+            if row != None:
+                self.ArrivalTime[row] = time
+                self.Distance[row] += self.Remaining.pop(vehicleID, 0)
+
+        for vehicleID, results in traci.vehicle.getAllSubscriptionResults().items():
+            row = self.Index.get(vehicleID)
+
+            if row != None:
+                self.Distance[row] = results[tc.VAR_DISTANCE]
+                self.Remaining[vehicleID] = self.Graph.EdgeLengths.get(results[tc.VAR_ROAD_ID], 0) - results[tc.VAR_LANEPOSITION]
+                self.BatteryCapacity[row] = float(results[tc.VAR_PARAMETER_WITH_KEY][1])
+
+    # Trip and battery values in the same form as main.collectVehicleEndInfo reads from the XML outputs
+    def getVehicleEndInfo(self):
+        trips = {}
+        batteryCaps = {}
+
+        for vehicleID, row in self.Index.items():
+            if not np.isnan(self.ArrivalTime[row]):
+                trips[vehicleID] = {
+                    'routeLength': '%.2f' % self.Distance[row],
+                    'duration': '%.2f' % (self.ArrivalTime[row] - self.DepartTime[row])
+                }
+
+            if not np.isnan(self.BatteryCapacity[row]):
+                batteryCaps[vehicleID] = '%.2f' % self.BatteryCapacity[row]
+
+        return trips, batteryCaps
@@ -2,11 +2,27 @@ import os
 import sys
 import optparse
 import random
-from algorithm.reroute import rerouter, estimateRange
+import logging
+import algorithm.Router
+import algorithm.BatteryProfile
+import algorithm.EdgeSpeeds
+from algorithm.Router import Router, estimateRange
+from algorithm.BatteryProfile import BatteryProfile
 from algorithm.Graph import Graph
+from algorithm.EdgeSpeeds import EdgeSpeedSnapshot
+from algorithm.RouteCache import RouteCache
+from algorithm.ReservationTable import ReservationTable
+from algorithm.Instrumentation import Instrumentation
+from algorithm.EnergyModel import EnergyModel
+from algorithm.CostMatrix import CostMatrix
+from algorithm.ODPairs import ODPairGenerator
+from algorithm.Trace import TraceRecorder
+from livemetrics import LiveMetrics
+from profiling import startProfiler, stopProfiler
 import time
+from concurrent.futures import ThreadPoolExecutor
 import statistics
-from bs4 import BeautifulSoup
+import xml.etree.ElementTree as ET
 
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
@@ -17,78 +33,257 @@ else:
 import traci
 import sumolib
 
-globalSeed = 0
+logger = logging.getLogger(__name__)
 
-def run(netFile, additionalFile, options=None, batteryCapacity=None, paramType=None, seed=None):
+def run(netFile, additionalFile, options=None, batteryCapacity=None, paramType=None, seed=None, outputDir='data'):
     """execute the TraCI control loop"""
+    profiler = startProfiler(options.profile) if options.profile != None else None
+
     step = 0
-    graph = Graph(netFile, additionalFile)
+    graph = Graph(netFile, additionalFile, compact=options.compact, stationTrees=options.stationtrees, hierarchy=options.hierarchy,
+                  hierarchyInterval=options.hierarchyinterval)
+    speeds = EdgeSpeedSnapshot(graph, options.speedrefresh) if options.speedrefresh > 0 else None
+    metrics = LiveMetrics(options.v * options.rate, graph) if options.livemetrics else None
+    cache = RouteCache(options.routecache, ttl=options.routecachettl) if options.routecache > 0 and speeds != None else None
+    reservations = ReservationTable() if options.reservations else None
+    energy = None
+
+    if options.energycalibration != None:
+        energy = EnergyModel.fromCalibration(graph, options.energycalibration)
+    elif options.energymodel:
+        energy = EnergyModel.fromVehicleType(graph, 'electricvehicle')
+
+    # Counts and times the TraCI calls made while routing, and nothing at all when disabled
+    instrumentation = Instrumentation(options.instrument)
+    instrumentation.traceTraCI([algorithm.Router, algorithm.BatteryProfile, algorithm.EdgeSpeeds])
+
+    # Every charging decision is also scored with the compared profiles to record their picks
+    profileNames = [name for name in options.compareprofiles.split(',') if name != '']
+    profiles = {name: buildHyperParams(batteryCapacity, name) for name in profileNames} if len(profileNames) > 0 else None
+
+    router = Router(graph, speeds, cache, reservations, instrumentation, energy, profiles)
     mWhList = []
+
+    # Pipeline batches share searches between EVs with the same start or end through a cost matrix
+    matrix = CostMatrix(graph, router.Energy) if options.pipeline and speeds != None else None
+
+    # Planning needs the speed snapshot to stay off TraCI, so async mode only runs with one
+    executor = None
+
+    if options.asyncrouting:
+        if speeds != None:
+            executor = ThreadPoolExecutor(max_workers=options.workers)
+        else:
+            logger.warning('Async rerouting needs --speedrefresh above 0, planning in the simulation loop instead')
+
+    # The trace takes its edge speeds from the snapshot
+    recorder = None
+
+    if options.trace:
+        if speeds != None:
+            recorder = TraceRecorder(os.path.join(outputDir, 'trace'), speeds, graph.ChargingStations)
+        else:
+            logger.warning('Recording a trace needs --speedrefresh above 0, no trace written')
+
     evMainErrorCount = 0
 
-    global globalSeed
-    globalSeed = seed * 10000
+    # Every EV's start and end edges are drawn up front, charging station prices are drawn as
+    # routes are planned from the random module seeded here
+    odPairs = iter(ODPairGenerator(graph).generate(options.v * options.rate, seed))
+    random.seed(seed)
 
     # EV outputs
     params = {}
     outputs = {}
     evs = []
 
-    while traci.simulation.getMinExpectedNumber() > 0:
+    # EVs waiting for the end of the admission window in pipeline mode
+    pending = []
+    pendingStep = 0
+
+    # EVs being planned by the async workers, by name
+    planning = {}
+    fallbacks = 0
+
+    while traci.simulation.getMinExpectedNumber() > 0 or len(pending) > 0 or len(planning) > 0:
         traci.simulationStep()
 
+        # Energies, station trees and the hierarchy are swapped in whole, async workers planning
+        # meanwhile finish on the ones they started with
+        if speeds != None:
+            speeds.update(step)
+            router.refresh()
+
+        if recorder != None:
+            recorder.record(step, traci.simulation.getTime(), [traci.chargingstation.getVehicleCount(cs.id) for cs in graph.ChargingStations])
+
+        if metrics != None:
+            metrics.update(traci.simulation.getTime())
+
+        # EVs whose routes the workers have finished are added with them, EVs over the latency
+        # budget or whose planning failed are added with SUMO's route instead
+        for evName in list(planning):
+            future, fromEdge, toEdge, submitStep = planning[evName]
+            planned = None
+
+            if future.done():
+                try:
+                    planned = future.result()
+                except Exception:
+                    logger.exception('Planning failed, using SUMO route for %s', evName)
+
+            elif step - submitStep >= options.latency:
+                future.cancel()
+                logger.info('Planning over latency budget, using SUMO route for %s', evName)
+
+            else:
+                continue
+
+            insert_ev(fromEdge, evName, batteryCapacity, metrics)
+
+            if planned != None:
+                algRuntime, route, csStops = planned
+                router.reserveStops(route, csStops, traci.simulation.getTime())
+                applyRoute(evName, route, csStops)
+                updateEV(outputs, evName, algRuntime, csStops, step - submitStep)
+            else:
+                applyRoute(evName, list(traci.simulation.findRoute(fromEdge, toEdge, vType='electricvehicle').edges), [])
+                updateEV(outputs, evName, "", [], step - submitStep)
+                fallbacks += 1
+
+            del planning[evName]
+
         upperVehicleLimit = (options.v * 10) + 199
 
-        # Add random EV routes
+        # Add random EV routes, options.rate of them each time
         if step >= 200 and step <= upperVehicleLimit and step % 10 == 0:
-            fromEdge = getEVEdges(graph, "")
-            toEdge = getEVEdges(graph, fromEdge)
-            evName = 'EV_' + str(step)
+            for i in range(options.rate):
+                fromEdge, toEdge = next(odPairs)
+                evName = 'EV_' + str(step) if options.rate == 1 else 'EV_' + str(step) + '_' + str(i)
 
-            algRuntime, csStops = add_ev(graph, fromEdge, toEdge, evName, options, batteryCapacity, paramType)
-            evs.append(evName)
-            outputs[evName] = {}
+                if recorder != None:
+                    recorder.recordRequest(step, evName, fromEdge, toEdge, batteryCapacity)
 
-            outputs[evName]["algRuntime"] = algRuntime
-            outputs[evName]["paramType"] = paramType
-            outputs[evName]["startingBatteryCapacity"] = batteryCapacity
-            outputs[evName]["csStops"] = csStops
-            outputs[evName]["Start"] = fromEdge
-            outputs[evName]["End"] = toEdge
+                if executor != None and not options.noalg:
+                    planning[evName] = (submit_ev(fromEdge, toEdge, evName, options, batteryCapacity, paramType, router, executor),
+                                        fromEdge, toEdge, step)
+                    recordEV(outputs, evs, evName, "", [], paramType, batteryCapacity, fromEdge, toEdge)
+                    continue
+
+                if options.pipeline:
+                    if len(pending) == 0:
+                        pendingStep = step
+
+                    pending.append((fromEdge, toEdge, evName))
+                    continue
+
+                algRuntime, csStops = add_ev(graph, fromEdge, toEdge, evName, options, batteryCapacity, paramType, router, metrics)
+                recordEV(outputs, evs, evName, algRuntime, csStops, paramType, batteryCapacity, fromEdge, toEdge)
+
+        # Queued EVs are added and planned together once the admission window has passed
+        if len(pending) > 0 and (step - pendingStep + 1 >= options.window or step >= upperVehicleLimit):
+            results = add_evs(graph, pending, options, batteryCapacity, paramType, router, metrics, matrix)
+
+            for fromEdge, toEdge, evName in pending:
+                algRuntime, csStops = results[evName]
+                recordEV(outputs, evs, evName, algRuntime, csStops, paramType, batteryCapacity, fromEdge, toEdge)
+
+            pending = []
 
         step += 1
 
-    outputVehicleEndInfo(outputs, evs)
+    if recorder != None:
+        recorder.close()
 
+    if executor != None:
+        executor.shutdown()
+        logger.info('Async rerouting fell back to SUMO routes for %s EVs', fallbacks)
+
+    # Close first so SUMO has finished writing the output files being streamed
     traci.close()
+
+    outputVehicleEndInfo(outputs, evs, outputDir, metrics)
+
+    if profiles != None:
+        outputProfilePicks(outputs, evs, profileNames, outputDir)
+
+    if speeds != None:
+        logger.info('Edge speed snapshot: %s', speeds.getStats())
+
+    if cache != None:
+        logger.info('Route cache: %s', cache.getStats())
+
+    if graph.StationTrees != None:
+        logger.info('Station trees: %s', graph.StationTrees.getStats())
+
+    if graph.Hierarchy != None:
+        logger.info('Contraction hierarchy: %s', graph.Hierarchy.getStats())
+
+    if reservations != None:
+        logger.info('Reservation table: %s', reservations.getStats())
+
+    if energy != None:
+        logger.info('Energy model: %s', energy.getStats())
+
+    if instrumentation.Enabled:
+        instrumentation.write(os.path.join(outputDir, 'EV_Metrics.csv'))
+        logger.info('Instrumentation: %s', instrumentation.getStats())
+
+    if profiler != None:
+        logger.info('Profile written to %s', stopProfiler(profiler, outputDir))
     sys.stdout.flush()
 
+# Keeps the values written to the EV outputs for one EV
+def recordEV(outputs, evs, evName, algRuntime, csStops, paramType, batteryCapacity, fromEdge, toEdge):
+    evs.append(evName)
+    outputs[evName] = {}
+
+    outputs[evName]["algRuntime"] = algRuntime
+    outputs[evName]["paramType"] = paramType
+    outputs[evName]["startingBatteryCapacity"] = batteryCapacity
+    outputs[evName]["csStops"] = csStops
+    outputs[evName]["Start"] = fromEdge
+    outputs[evName]["End"] = toEdge
+    outputs[evName]["latency"] = 0
+
+# Fills in the planning results of an EV recorded before its route was planned
+def updateEV(outputs, evName, algRuntime, csStops, latency):
+    outputs[evName]["algRuntime"] = algRuntime
+    outputs[evName]["csStops"] = csStops
+    outputs[evName]["latency"] = latency
+
 # Adds electric vehicle wish to route
-def add_ev(graph, fromEdge, toEdge, evName, options, startingCapacity, paramType):
+def add_ev(graph, fromEdge, toEdge, evName, options, startingCapacity, paramType, router=None, metrics=None):
     vehicleID = evName
     params = buildHyperParams(startingCapacity, paramType)
     algRuntime = ""
     csStops = []
 
-    print('params: ', params)
+    logger.debug('params: %s', params)
 
     # Generate vehicle
     traci.route.add('placeholder_trip_' + evName, [fromEdge])
     traci.vehicle.add(vehicleID, 'placeholder_trip_' + evName, typeID='electricvehicle')
     traci.vehicle.setParameter(vehicleID, 'device.battery.actualBatteryCapacity', params["batteryCapacity"])
 
+    if metrics != None:
+        metrics.track(vehicleID)
+
     # Run detour algorithm on EV or not
     if not options.noalg:
         start_time = time.time()
-        route, csStops = rerouter(fromEdge, toEdge, vehicleID, graph, params)
-        algRuntime = str(time.time() - start_time)
-        print("Reroute algorithm runtime ", vehicleID, ": ", algRuntime)
+        if router == None:
+            router = Router(graph)
 
-        if len(route) > 0:
-            traci.vehicle.setRoute(vehicleID, route)
+        router.Instrumentation.beginEV(vehicleID)
+        router.updateStations()
+        route, csStops = router.route(fromEdge, toEdge, BatteryProfile.fromVehicle(vehicleID), params, options.labelsearch)
+        router.Instrumentation.endEV()
+        algRuntime = str(time.time() - start_time)
+        logger.info('Reroute algorithm runtime %s: %s', vehicleID, algRuntime)
 
-            for chargingStation in csStops:
-                traci.vehicle.setChargingStationStop(vehicleID, chargingStation.id, duration=chargingStation.Duration)
+        router.reserveStops(route, csStops, traci.simulation.getTime())
+        applyRoute(vehicleID, route, csStops)
 
     else:
         start_time = time.time()
@@ -97,10 +292,120 @@ def add_ev(graph, fromEdge, toEdge, evName, options, startingCapacity, paramType
         traci.vehicle.setRoute(vehicleID, route.edges)
         algRuntime = str(time.time() - start_time)
 
-        print("No algorithm runtime ", vehicleID, ": ", algRuntime)
+        logger.info('No algorithm runtime %s: %s', vehicleID, algRuntime)
 
     return algRuntime, csStops
 
+# Hands an EV's planning to the async workers, returning the future of its
+# (algRuntime, route, csStops). The EV is only added once its route is ready, as the planned
+# route does not have to start on the EV's first edge
+def submit_ev(fromEdge, toEdge, evName, options, startingCapacity, paramType, router, executor):
+    params = buildHyperParams(startingCapacity, paramType)
+
+    # Everything TraCI is read here on the main thread, the worker only searches
+    battery = BatteryProfile.fromVehicleType('electricvehicle', params["batteryCapacity"])
+    router.updateStations()
+
+    return executor.submit(planRoute, router, evName, fromEdge, toEdge, battery, params, options.labelsearch)
+
+# Adds an async planned EV on its first edge, its route is set straight after
+def insert_ev(fromEdge, evName, startingCapacity, metrics):
+    traci.route.add('placeholder_trip_' + evName, [fromEdge])
+    traci.vehicle.add(evName, 'placeholder_trip_' + evName, typeID='electricvehicle')
+    traci.vehicle.setParameter(evName, 'device.battery.actualBatteryCapacity', startingCapacity)
+
+    if metrics != None:
+        metrics.track(evName)
+
+# Worker side of async rerouting, only reads the router's shared state
+def planRoute(router, evName, fromEdge, toEdge, battery, params, labelSetting):
+    start_time = time.time()
+    router.Instrumentation.beginEV(evName)
+
+    try:
+        route, csStops = router.route(fromEdge, toEdge, battery, params, labelSetting)
+    finally:
+        router.Instrumentation.endEV()
+
+    return str(time.time() - start_time), route, csStops
+
+# Gives an EV its planned route and charging stops
+def applyRoute(evName, route, csStops):
+    if len(route) > 0:
+        traci.vehicle.setRoute(evName, route)
+
+        for chargingStation in csStops:
+            traci.vehicle.setChargingStationStop(evName, chargingStation.id, duration=chargingStation.Duration)
+
+# Adds a batch of EVs and plans them together, requests are (fromEdge, toEdge, evName)
+# Vehicles are all added first, then planned against the same speed snapshot and station
+# counts, then given their routes and stops. Searches are shared through the route cache, a
+# batch only cache is used when none is configured. With a cost matrix, the first search of
+# EVs sharing a start or end node comes from one search per shared node, other searches, such
+# as those to charging stations, are only shared when they repeat exactly
+# TraCI has no bulk calls, EVs leaving from the same edge are added on one placeholder route
+# Returns the algorithm runtime and charging stops of each EV by name
+def add_evs(graph, requests, options, startingCapacity, paramType, router=None, metrics=None, matrix=None):
+    params = buildHyperParams(startingCapacity, paramType)
+    results = {}
+
+    logger.debug('params: %s', params)
+    logger.info('Planning batch of %s EVs', len(requests))
+
+    placeholders = {}
+
+    for fromEdge, toEdge, evName in requests:
+        if fromEdge not in placeholders:
+            placeholders[fromEdge] = 'placeholder_trip_' + evName
+            traci.route.add(placeholders[fromEdge], [fromEdge])
+
+        traci.vehicle.add(evName, placeholders[fromEdge], typeID='electricvehicle')
+        traci.vehicle.setParameter(evName, 'device.battery.actualBatteryCapacity', params["batteryCapacity"])
+
+        if metrics != None:
+            metrics.track(evName)
+
+    if options.noalg:
+        for fromEdge, toEdge, evName in requests:
+            start_time = time.time()
+            traci.vehicle.setRoute(evName, traci.simulation.findRoute(fromEdge, toEdge).edges)
+            results[evName] = (str(time.time() - start_time), [])
+
+        return results
+
+    if router == None:
+        router = Router(graph)
+
+    # Every EV in the batch starts with the same battery, so read it once
+    battery = BatteryProfile.fromVehicle(requests[0][2])
+    cache = router.Cache
+
+    if cache == None and router.Speeds != None:
+        cache = RouteCache(len(requests) * 10, rangeBucket=0)
+
+    batchRouter = Router(graph, router.Speeds, cache, router.Reservations, router.Instrumentation, router.Energy, router.Profiles)
+    batchRouter.updateStations()
+    departTime = traci.simulation.getTime()
+
+    if matrix != None:
+        batchRouter.shareSearches(matrix, [(fromEdge, toEdge) for fromEdge, toEdge, evName in requests], battery)
+    plans = []
+
+    # Stops are reserved as each EV is planned so the rest of the batch sees them
+    for fromEdge, toEdge, evName in requests:
+        start_time = time.time()
+        batchRouter.Instrumentation.beginEV(evName)
+        route, csStops = batchRouter.route(fromEdge, toEdge, battery, params, options.labelsearch)
+        batchRouter.Instrumentation.endEV()
+        results[evName] = (str(time.time() - start_time), csStops)
+        batchRouter.reserveStops(route, csStops, departTime)
+        plans.append((evName, route, csStops))
+
+    for evName, route, csStops in plans:
+        applyRoute(evName, route, csStops)
+
+    return results
+
 # Adds vehicle type electric vehicle
 def add_ev_vtype():
     original_stdout = sys.stdout
@@ -133,15 +438,25 @@ def add_ev_vtype():
 
 # Get hyper parameters used in the simualation
 def buildHyperParams(startingCapacity, paramType):
+    return buildAllHyperParams(startingCapacity)[paramType]
+
+# Get every hyper parameter profile, used to score several weightings at once
+# FallbackStations is how many of the best scored stations are tried in turn when there is no
+# route to the better ones
+def buildAllHyperParams(startingCapacity):
     hyperParams = {}
 
-    hyperParams["A"] = {"DistanceFromStart": 0.35, "DistanceFromDivider": 0.35, "Price": 0.10, "VehiclesCharging": 0.10, "ChargePerStep": 0.10, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "batteryCapacity": startingCapacity}
-    hyperParams["B"] = {"DistanceFromStart": 0.10, "DistanceFromDivider": 0.10, "Price": 0.6, "VehiclesCharging": 0.10, "ChargePerStep": 0.10, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "batteryCapacity": startingCapacity}
-    hyperParams["C"] = {"DistanceFromStart": 0.10, "DistanceFromDivider": 0.10, "Price": 0.10, "VehiclesCharging": 0.6, "ChargePerStep": 0.10, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "batteryCapacity": startingCapacity}
-    hyperParams["D"] = {"DistanceFromStart": 0.10, "DistanceFromDivider": 0.10, "Price": 0.10, "VehiclesCharging": 0.10, "ChargePerStep": 0.6, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "batteryCapacity": startingCapacity}
-    hyperParams["E"] = {"DistanceFromStart": 0.2, "DistanceFromDivider": 0.2, "Price": 0.2, "VehiclesCharging": 0.2, "ChargePerStep": 0.2, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "batteryCapacity": startingCapacity}
+    hyperParams["A"] = {"DistanceFromStart": 0.35, "DistanceFromDivider": 0.35, "Price": 0.10, "VehiclesCharging": 0.10, "ChargePerStep": 0.10, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "FallbackStations": 3, "batteryCapacity": startingCapacity}
+    hyperParams["B"] = {"DistanceFromStart": 0.10, "DistanceFromDivider": 0.10, "Price": 0.6, "VehiclesCharging": 0.10, "ChargePerStep": 0.10, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "FallbackStations": 3, "batteryCapacity": startingCapacity}
+    hyperParams["C"] = {"DistanceFromStart": 0.10, "DistanceFromDivider": 0.10, "Price": 0.10, "VehiclesCharging": 0.6, "ChargePerStep": 0.10, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "FallbackStations": 3, "batteryCapacity": startingCapacity}
+    hyperParams["D"] = {"DistanceFromStart": 0.10, "DistanceFromDivider": 0.10, "Price": 0.10, "VehiclesCharging": 0.10, "ChargePerStep": 0.6, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "FallbackStations": 3, "batteryCapacity": startingCapacity}
+    hyperParams["E"] = {"DistanceFromStart": 0.2, "DistanceFromDivider": 0.2, "Price": 0.2, "VehiclesCharging": 0.2, "ChargePerStep": 0.2, "MinimumSoC": 10, "GoalCapacityAtEnd": 10, "FallbackStations": 3, "batteryCapacity": startingCapacity}
+
+    return hyperParams
 
-    return hyperParams[paramType]
+# Logs routing messages at the level of the run options, called once by the script entry point
+def configureLogging(options):
+    logging.basicConfig(level=options.loglevel.upper(), format='%(message)s')
 
 # Get run parameters
 def get_options():
@@ -154,83 +469,172 @@ def get_options():
                          default=1, help="Simulation run cycles")
     optParser.add_option("--v", action="store", type="int",
                          default=50, help="EVs injected into simualation")
+    optParser.add_option("--rate", action="store", type="int",
+                         default=1, help="EVs injected each time, so --v times --rate EVs in total")
+    optParser.add_option("--compareprofiles", action="store", type="string",
+                         default="", help="Comma separated weightings every charging decision is also scored with, their picks are written to Profile_Picks.csv")
+    optParser.add_option("--pipeline", action="store_true",
+                         default=False, help="Add and plan the EVs of each admission window as one batch")
+    optParser.add_option("--window", action="store", type="int",
+                         default=1, help="Steps EVs are collected for before a pipeline batch is planned")
+    optParser.add_option("--async", action="store_true", dest="asyncrouting",
+                         default=False, help="Plan routes on worker threads while the simulation keeps stepping")
+    optParser.add_option("--workers", action="store", type="int",
+                         default=2, help="Worker threads planning routes in async mode")
+    optParser.add_option("--latency", action="store", type="int",
+                         default=5, help="Steps an async route may take before the EV gets SUMO's route instead")
+    optParser.add_option("--speedrefresh", action="store", type="int",
+                         default=1, help="Steps between edge speed snapshot refreshes, 0 queries TraCI per edge")
+    optParser.add_option("--jobs", action="store", type="int",
+                         default=1, help="Simulations of the parameter sweep run in parallel")
+    optParser.add_option("--resume", action="store_true",
+                         default=False, help="Keep finished sweep simulations and only run the rest")
+    optParser.add_option("--routecache", action="store", type="int",
+                         default=0, help="Searches kept in the route cache, 0 turns the cache off")
+    optParser.add_option("--routecachettl", action="store", type="int",
+                         default=60, help="Steps of speed snapshot age before a cached route is searched again")
+    optParser.add_option("--compact", action="store_true",
+                         default=False, help="Keep the road graph only as compact arrays, dropping its node and edge dicts")
+    optParser.add_option("--stationtrees", action="store_true",
+                         default=False, help="Route to charging stations along shortest path trees kept from each station")
+    optParser.add_option("--hierarchy", action="store_true",
+                         default=False, help="Answer route searches from a contraction hierarchy customized with the edge speeds")
+    optParser.add_option("--hierarchyinterval", action="store", type="int",
+                         default=10, help="Least steps between customizations of the contraction hierarchy with new edge speeds")
+    optParser.add_option("--labelsearch", action="store_true",
+                         default=False, help="Plan each EV's route and charging stops in one search over node and battery range")
+    optParser.add_option("--reservations", action="store_true",
+                         default=False, help="Forecast EVs charging at each station from the stops already planned instead of reading TraCI")
+    optParser.add_option("--energymodel", action="store_true",
+                         default=False, help="Estimate the energy of each edge from its mean speed with the EV vType's consumption instead of a fixed 3.31 m/Wh")
+    optParser.add_option("--energycalibration", action="store", type="string",
+                         default=None, help="Energy model npz written by calibrate.py to estimate each edge's energy with")
+    optParser.add_option("--instrument", action="store_true",
+                         default=False, help="Record per EV routing phase times, counters and TraCI calls to EV_Metrics.csv")
+    optParser.add_option("--profile", action="store", type="choice", choices=["cprofile", "sample"],
+                         default=None, help="Profile each simulation with cProfile or a stack sampler")
+    optParser.add_option("--trace", action="store_true",
+                         default=False, help="Record the edge speeds and charging station counts of every step for replay.py")
+    optParser.add_option("--loglevel", action="store", type="string",
+                         default="WARNING", help="Level of the routing log messages, DEBUG shows every route planned")
+    optParser.add_option("--livemetrics", action="store_true",
+                         default=False, help="Collect EV outputs through TraCI subscriptions and turn off SUMO battery output")
     options, args = optParser.parse_args()
     return options
 
-# Utility function to get random edges on network that allows EV vehicles
-def getEVEdges(graph, otherEdge):
-    while True:
-        global globalSeed
-        globalSeed += 1
-        random.seed(globalSeed)
+# Outputs data for all EVs in simulation
+# Uses the live metrics when collected, otherwise the SUMO trip info and battery outputs
+def outputVehicleEndInfo(outputs, evs, outputDir='data', metrics=None):
+    if metrics != None:
+        trips, batteryCaps = metrics.getVehicleEndInfo()
+    else:
+        trips, batteryCaps = collectVehicleEndInfo(os.path.join(outputDir, "tripinfo.xml"), os.path.join(outputDir, "battery.out.xml"), evs)
 
-        edge = random.choice(graph.Edges).getID()
-        startNode = graph.Net.getEdge(edge).getToNode().getID()
+    outputFile = os.path.join(outputDir, "EV_Outputs.csv")
+    rows = []
 
-        try:
-            endNode = graph.Net.getEdge(otherEdge).getFromNode().getID()
-        except:
-            endNode = ""
+    # Check if CSV headers should be added
+    if not os.path.exists(outputFile) or os.path.getsize(outputFile) == 0:
+        rows.append('Weightings,Starting Battery Capacity (Wh),Route Distance (m),Travel Time (s),CS stops,CS Stop Duration (s),Algorithm Runtime (s),Remaining Battery Capacity At End (Wh),Number of EVs Charging,Start Edge,End Edge,Planning Latency (steps)\n')
 
-        if graph.Net.getEdge(edge).allows('evehicle') and otherEdge != edge \
-            and startNode != endNode:
-            break
-        else:
-            globalSeed += 1
+    for e in evs:
+        duration = [cs.Duration for cs in outputs[e]["csStops"]]
+        evCharging = [cs.VehiclesCharging for cs in outputs[e]["csStops"]]
 
-    return edge
+        trip_EV = trips.get(e)
 
-# Outputs data for all EVs in simulation
-def outputVehicleEndInfo(outputs, evs):
-    trip_content = getXmlContent("data/tripinfo.xml")
-    battery_content = getXmlContent("data/battery.out.xml")
+        if trip_EV == None:
+            logger.warning('No trip info for %s', e)
+            continue
 
-    with open('data/EV_Outputs.csv', 'a+') as csv:
-        # Get contents of the file to check if CSV headers should be added
-        f = open("data/EV_Outputs.csv", "r+")
-        contents = f.read()
-        f.close()
+        csvRow = str(outputs[e]["paramType"]) + "," + str(outputs[e]["startingBatteryCapacity"]) + "," + str(trip_EV["routeLength"]) + ',' + \
+                 str(trip_EV["duration"]) + ',' + str(len(outputs[e]["csStops"])) + ','+ \
+                 str(duration) + ','+ str(outputs[e]["algRuntime"]) + ','+ \
+                 str(batteryCaps.get(e, 0)) + ',' + str(evCharging) + ',' + str(outputs[e]["Start"]) + ',' + str(outputs[e]["End"]) + ',' + str(outputs[e]["latency"])
 
-        if len(contents) == 0:
-            csv.write('Weightings,Starting Battery Capacity (Wh),Route Distance (m),Travel Time (s),CS stops,CS Stop Duration (s),Algorithm Runtime (s),Remaining Battery Capacity At End (Wh),Number of EVs Charging,Start Edge,End Edge\n')
+        rows.append(csvRow + '\n')
 
-        for e in evs:
-            duration = [cs.Duration for cs in outputs[e]["csStops"]]
-            evCharging = [cs.VehiclesCharging for cs in outputs[e]["csStops"]]
+    with open(outputFile, 'a') as csv:
+        csv.writelines(rows)
 
-            trip_EV = trip_content.find(id=e)
-            battery_EV = battery_content.findAll(id=e)
+# Writes the station every compared profile would have picked at each charging stop chosen by
+# scoring, one row per stop with the EV's own weighting and pick. Stops planned by the label
+# setting search are not scored and have no row
+def outputProfilePicks(outputs, evs, profileNames, outputDir='data'):
+    outputFile = os.path.join(outputDir, "Profile_Picks.csv")
+    rows = []
 
-            try:
-                batteryCap = battery_EV[-1]["actualbatterycapacity"]
-            except:
-                try:
-                    batteryCap = battery_EV[-2]["actualbatterycapacity"]
-                except:
-                    batteryCap = 0
+    if not os.path.exists(outputFile) or os.path.getsize(outputFile) == 0:
+        rows.append(','.join(['EV', 'Weightings', 'CS Stop', 'Charging Station'] + profileNames) + '\n')
+
+    for e in evs:
+        for stop, cs in enumerate(outputs[e]["csStops"]):
+            if cs.ProfilePicks == None:
+                continue
+
+            rows.append(','.join([e, str(outputs[e]["paramType"]), str(stop), cs.id] + [cs.ProfilePicks[name] for name in profileNames]) + '\n')
+
+    with open(outputFile, 'a') as csv:
+        csv.writelines(rows)
+
+# Streams the trip info and battery outputs once, keeping only the tracked EVs
+# Memory is bounded by the number of EVs, not the size of the files
+def collectVehicleEndInfo(tripFile, batteryFile, evs):
+    tracked = set(evs)
+    trips = {}
+    lastCaps = {}
+    prevCaps = {}
+
+    for element in iterElements(tripFile, 'tripinfo'):
+        if element.get('id') in tracked:
+            trips[element.get('id')] = {'routeLength': element.get('routeLength'), 'duration': element.get('duration')}
+
+    # Last battery sample for each EV, falling back to the one before if it has no capacity
+    for element in iterElements(batteryFile, 'vehicle'):
+        id = element.get('id')
+
+        if id in tracked:
+            if id in lastCaps:
+                prevCaps[id] = lastCaps[id]
+
+            lastCaps[id] = element.get('actualBatteryCapacity')
+
+    batteryCaps = {}
+
+    for id in lastCaps:
+        if lastCaps[id] != None:
+            batteryCaps[id] = lastCaps[id]
+        elif prevCaps.get(id) != None:
+            batteryCaps[id] = prevCaps[id]
+
+    return trips, batteryCaps
+
+# Yields each element with the given tag, clearing finished elements so the tree never builds up
+def iterElements(file, tag):
+    depth = 0
+    root = None
+
+    for event, element in ET.iterparse(file, events=('start', 'end')):
+        if event == 'start':
+            if root == None:
+                root = element
+
+            depth += 1
+            continue
+
+        depth -= 1
 
-            csvRow = str(outputs[e]["paramType"]) + "," + str(outputs[e]["startingBatteryCapacity"]) + "," + str(trip_EV["routelength"]) + ',' + \
-                     str(trip_EV["duration"]) + ',' + str(len(outputs[e]["csStops"])) + ','+ \
-                     str(duration) + ','+ str(outputs[e]["algRuntime"]) + ','+ \
-                     str(batteryCap) + ',' + str(evCharging) + ',' + str(outputs[e]["Start"]) + ',' + str(outputs[e]["End"])
+        if element.tag == tag:
+            yield element
 
-            csv.write(csvRow + '\n')
+        if depth == 1:
+            root.clear()
 
-# Clear the EV output file
+# Clear the EV output file, and the profile picks when there are any
 def clearOutput():
     f = open("data/EV_Outputs.csv", "r+")
     f.truncate(0)
     f.close()
 
-# Get contents of an XML file
-def getXmlContent(file):
-    content = []
-    # Read the XML file
-    with open(file, "r") as file:
-        # Read each line in the file, readlines() returns a list of lines
-        content = file.readlines()
-        # Combine the lines in the list into a string
-        content = "".join(content)
-        out_content = BeautifulSoup(content, "lxml")
-
-    return out_content
+    if os.path.exists("data/Profile_Picks.csv"):
+        os.remove("data/Profile_Picks.csv")
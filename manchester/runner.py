@@ -4,6 +4,7 @@ current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentfra
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 import main
+import sweep
 import optparse
 import random
 
@@ -32,6 +33,7 @@ def generate_trips():
 # Script entry point
 if __name__ == "__main__":
     options = main.get_options()
+    main.configureLogging(options)
 
     # Define starting batterys wish EVs to have in simulation
     batterys = [500, 1250, 2250]
@@ -44,20 +46,14 @@ if __name__ == "__main__":
     else:
         sumoBinary = checkBinary('sumo-gui')
 
-    main.clearOutput()
     main.add_ev_vtype()
 
-    for p in paramTypes:
-        for b in batterys:
-            print('Evaluating for starting battery capacity: ', str(b))
-            for x in range(options.c):
-                # this is the normal way of using traci. sumo is started as a
-                # subprocess and then the python script connects and runs
-                traci.start([sumoBinary, "-c", "data/osm.sumocfg",
-                                         "--tripinfo-output", "data/tripinfo.xml", "--additional-files", "data/Manchester_additionals.add.xml",
-                                         "--chargingstations-output", "data/Manchester_chargingstations.xml", "--no-warnings",
-                                         "--seed", str(x)])
-
-                main.run(netFile='data/osm.net.xml',
-                         additionalFile='data/Manchester_additionals.add.xml',
-                         options=options, batteryCapacity=b, paramType=p, seed=x)
+    # Each weighting, battery and seed combination runs as its own simulation, options.jobs at a time
+    config = {
+        'sumoBinary': sumoBinary,
+        'sumocfg': 'data/osm.sumocfg',
+        'netFile': 'data/osm.net.xml',
+        'additionalFile': 'data/Manchester_additionals.add.xml'
+    }
+
+    sweep.runSweep(config, options, paramTypes, batterys)
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+
+# Samples the call stack of the thread that started it every interval seconds
+# Stacks are counted in the collapsed format flamegraph.pl and speedscope read, one
+# 'outer;...;inner count' line per stack
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.Interval = interval
+        self.ThreadID = threading.get_ident()
+        self.Stacks = Counter()
+        self.Running = False
+        self.Thread = None
+
+    def start(self):
+        self.Running = True
+        self.Thread = threading.Thread(target=self.sample, daemon=True)
+        self.Thread.start()
+
+    def sample(self):
+        while self.Running:
+            frame = sys._current_frames().get(self.ThreadID)
+            stack = []
+
+            while frame != None:
+                code = frame.f_code
+                stack.append(code.co_name + ' (' + os.path.basename(code.co_filename) + ':' + str(code.co_firstlineno) + ')')
+                frame = frame.f_back
+
+            if len(stack) > 0:
+                stack.reverse()
+                self.Stacks[';'.join(stack)] += 1
+
+            time.sleep(self.Interval)
+
+    def stop(self):
+        self.Running = False
+        self.Thread.join()
+
+    def write(self, outputFile):
+        with open(outputFile, 'w') as f:
+            for stack, count in self.Stacks.most_common():
+                f.write(stack + ' ' + str(count) + '\n')
+
+# Starts profiling a run, 'cprofile' traces every call and 'sample' samples the stack
+def startProfiler(kind):
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = SamplingProfiler()
+        profiler.start()
+
+    return profiler
+
+# Stops a profiler and writes its output into the run's output folder, pstats data to
+# 'profile.prof' or collapsed stacks to 'profile.folded', returning the file written
+def stopProfiler(profiler, outputDir):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        outputFile = os.path.join(outputDir, 'profile.prof')
+        profiler.dump_stats(outputFile)
+    else:
+        profiler.stop()
+        outputFile = os.path.join(outputDir, 'profile.folded')
+        profiler.write(outputFile)
+
+    return outputFile
@@ -0,0 +1,197 @@
+# Replays recorded traffic into the router without SUMO
+# Each query is planned against the edge speeds and charging station counts a trace recorded at
+# its step, so hyper parameter profiles can be compared on exactly the traffic SUMO produced.
+# Queries are the EVs of the recorded simulation unless a queries CSV is given, crossed with
+# every weighting and battery asked for, and split over worker processes in step order. The
+# queries of one recorded EV are never split between workers, and the route cache only shares
+# searches between them, so the routes planned do not depend on the number of jobs
+import os
+import sys
+import csv
+import time
+import random
+import logging
+import itertools
+import optparse
+from multiprocessing import Pool
+import main
+from algorithm.Graph import Graph
+from algorithm.Router import Router, catchZeroDivision
+from algorithm.BatteryProfile import BatteryProfile
+from algorithm.RouteCache import RouteCache
+from algorithm.EnergyModel import EnergyModel
+from algorithm.Trace import Trace, TraceSpeeds
+
+logger = logging.getLogger(__name__)
+
+# Chunks each worker process gets on average, more balance the load at a little overhead
+CHUNKS_PER_JOB = 4
+
+# Router of a worker process, set up once by initReplay
+worker = {}
+
+def initReplay(options):
+    logging.basicConfig(level=options.loglevel.upper(), format='%(message)s')
+
+    # The hierarchy is customized at every traced step the worker moves to, as skipping steps
+    # would make its weights depend on the queries the worker planned before
+    graph = Graph(options.net, options.additional, compact=options.compact, stationTrees=options.stationtrees, hierarchy=options.hierarchy, hierarchyInterval=1)
+    trace = Trace(options.trace)
+    speeds = TraceSpeeds(trace)
+    cache = RouteCache(options.routecache) if options.routecache > 0 else None
+    energy = EnergyModel.fromCalibration(graph, options.energycalibration) if options.energycalibration != None else None
+
+    worker['Graph'] = graph
+    worker['Trace'] = trace
+    worker['Speeds'] = speeds
+    worker['Router'] = Router(graph, speeds, cache, energy=energy)
+    worker['Options'] = options
+
+# Plans a chunk of query groups, each the (step, evName, fromEdge, toEdge, batteryCapacity,
+# weighting) queries of one EV, moving the speeds and station counts to each query's step, and
+# returns their output rows
+# The router draws charging station prices at random, seeded by EV so every weighting sees the
+# same prices and results do not depend on how the queries were split between workers
+def replayChunk(groups):
+    rows = []
+
+    for group in groups:
+        rows += replayGroup(group)
+
+    return rows
+
+# The route cache starts empty for each EV so cache hits never depend on the EVs planned before it
+def replayGroup(queries):
+    graph = worker['Graph']
+    trace = worker['Trace']
+    speeds = worker['Speeds']
+    router = worker['Router']
+    options = worker['Options']
+    rows = []
+
+    if router.Cache != None:
+        router.Cache.clear()
+
+    for step, evName, fromEdge, toEdge, batteryCapacity, weighting in queries:
+        speeds.update(step)
+        router.refresh()
+
+        router.VehiclesCharging = trace.getVehicleCounts(step)
+        random.seed(evName)
+
+        start_time = time.perf_counter()
+        route, csStops = router.route(fromEdge, toEdge, BatteryProfile(batteryCapacity, options.maxbattery),
+                                      main.buildHyperParams(batteryCapacity, weighting), options.labelsearch)
+        algRuntime = time.perf_counter() - start_time
+
+        rows.append([step, evName, weighting, batteryCapacity, fromEdge, toEdge, graph.getRouteLength(route),
+                     getTravelTime(graph, speeds, route, csStops), len(csStops), [cs.Duration for cs in csStops],
+                     [cs.VehiclesCharging for cs in csStops], algRuntime])
+
+    return rows
+
+# Travel time of a route at the speeds of its step plus the time spent charging
+def getTravelTime(graph, speeds, route, csStops):
+    travelTime = sum(catchZeroDivision(graph.getEdgeLength(edge), speeds.getSpeed(edge)) for edge in route)
+
+    return travelTime + sum(cs.Duration for cs in csStops)
+
+# Queries from a CSV with the columns of the trace's requests.csv, or the recorded EVs
+def loadQueries(trace, queryFile):
+    if queryFile == None:
+        return trace.getRequests()
+
+    with open(queryFile, 'r', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+
+        return [(int(row[0]), row[1], row[2], row[3], float(row[4])) for row in reader]
+
+# Every query with every weighting, and every battery when batteries are given, in step order
+def buildQueries(requests, weightings, batteries):
+    queries = []
+
+    for step, evName, fromEdge, toEdge, batteryCapacity in requests:
+        for battery in (batteries if len(batteries) > 0 else [batteryCapacity]):
+            for weighting in weightings:
+                queries.append((step, evName, fromEdge, toEdge, battery, weighting))
+
+    queries.sort(key=lambda query: query[0])
+
+    return queries
+
+# Consecutive queries of the same recorded EV, which buildQueries keeps together
+def groupQueries(queries):
+    return [list(group) for key, group in itertools.groupby(queries, key=lambda query: query[:4])]
+
+def splitChunks(groups, chunks):
+    size = max(1, -(-len(groups) // chunks))
+
+    return [groups[i:i + size] for i in range(0, len(groups), size)]
+
+def writeRows(outputFile, rows):
+    with open(outputFile, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Step', 'EV', 'Weightings', 'Starting Battery Capacity (Wh)', 'Start Edge', 'End Edge', 'Route Distance (m)',
+                         'Estimated Travel Time (s)', 'CS stops', 'CS Stop Duration (s)', 'Number of EVs Charging', 'Algorithm Runtime (s)'])
+        writer.writerows(rows)
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--net", action="store", type="string",
+                         default=os.path.join('EVGrid', 'data', 'EVGrid.net.xml'), help="Net file the trace was recorded on")
+    optParser.add_option("--additional", action="store", type="string",
+                         default=os.path.join('EVGrid', 'data', 'EVGrid_additionals.add.xml'), help="Additional file with the charging stations")
+    optParser.add_option("--trace", action="store", type="string",
+                         default=os.path.join('EVGrid', 'data', 'trace'), help="Trace directory written by main.py --trace")
+    optParser.add_option("--queries", action="store", type="string",
+                         default=None, help="CSV of Step, EV, Start Edge, End Edge, Battery (Wh) to plan instead of the recorded EVs")
+    optParser.add_option("--weightings", action="store", type="string",
+                         default="A,B,C,D,E", help="Comma separated hyper parameter weightings to plan every query with")
+    optParser.add_option("--batteries", action="store", type="string",
+                         default="", help="Comma separated starting batteries in Wh to plan every query with instead of its own")
+    optParser.add_option("--maxbattery", action="store", type="float",
+                         default=10000, help="Maximum battery capacity in Wh")
+    optParser.add_option("--jobs", action="store", type="int",
+                         default=os.cpu_count(), help="Worker processes")
+    optParser.add_option("--output", action="store", type="string",
+                         default="replay.csv", help="CSV the planned routes are written to")
+    optParser.add_option("--routecache", action="store", type="int",
+                         default=0, help="Share searches between the weightings and batteries of each EV through a route cache of this many entries")
+    optParser.add_option("--compact", action="store_true",
+                         default=False, help="Keep the road graph only as compact arrays, dropping its node and edge dicts")
+    optParser.add_option("--stationtrees", action="store_true",
+                         default=False, help="Route to charging stations along reverse shortest path trees")
+    optParser.add_option("--hierarchy", action="store_true",
+                         default=False, help="Answer route searches from a contraction hierarchy")
+    optParser.add_option("--labelsearch", action="store_true",
+                         default=False, help="Plan route and charging stops in one label setting search")
+    optParser.add_option("--energycalibration", action="store", type="string",
+                         default=None, help="Energy model npz written by calibrate.py to estimate each edge's energy with")
+    optParser.add_option("--loglevel", action="store", type="string",
+                         default="ERROR", help="Level of the routing log messages")
+    options, args = optParser.parse_args()
+    return options
+
+if __name__ == "__main__":
+    options = get_options()
+    logging.basicConfig(level=options.loglevel.upper(), format='%(message)s')
+    trace = Trace(options.trace)
+
+    if trace.Steps == 0:
+        sys.exit('Trace has no steps: ' + options.trace)
+
+    weightings = [weighting for weighting in options.weightings.split(',') if weighting != '']
+    batteries = [float(battery) for battery in options.batteries.split(',') if battery != '']
+    queries = buildQueries(loadQueries(trace, options.queries), weightings, batteries)
+
+    logger.info('Replaying %s queries over %s steps with %s jobs', len(queries), trace.Steps, options.jobs)
+    start_time = time.perf_counter()
+
+    # Chunks are consecutive in step order so each worker moves through the trace forwards
+    with Pool(options.jobs, initializer=initReplay, initargs=(options,)) as pool:
+        rows = [row for chunk in pool.map(replayChunk, splitChunks(groupQueries(queries), options.jobs * CHUNKS_PER_JOB)) for row in chunk]
+
+    writeRows(options.output, rows)
+
+    logger.info('Planned %s routes in %.2fs, written to %s', len(rows), time.perf_counter() - start_time, options.output)
@@ -0,0 +1,135 @@
+import os
+import sys
+import shutil
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import main
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci
+
+logger = logging.getLogger(__name__)
+
+# Each scenario writes its SUMO and EV outputs in its own folder under here
+sweepDir = os.path.join('data', 'sweep')
+
+# Scenarios in the order the runner loops used, so the merged output keeps the same row order
+def buildScenarios(paramTypes, batterys, cycles):
+    return [{'paramType': p, 'batteryCapacity': b, 'seed': x} for p in paramTypes for b in batterys for x in range(cycles)]
+
+def getScenarioName(scenario):
+    return scenario['paramType'] + '_' + str(scenario['batteryCapacity']) + '_' + str(scenario['seed'])
+
+def getScenarioDir(scenario):
+    return os.path.join(sweepDir, getScenarioName(scenario))
+
+# Finished scenarios leave a marker once their outputs are written
+def isComplete(scenario):
+    return os.path.exists(os.path.join(getScenarioDir(scenario), 'done'))
+
+# Runs one simulation with its own SUMO instance and output files
+def runScenario(scenario, config, options):
+    outputDir = getScenarioDir(scenario)
+    seed = scenario['seed']
+
+    # Clear anything left by a run that crashed part way through
+    shutil.rmtree(outputDir, ignore_errors=True)
+    os.makedirs(outputDir)
+
+    # Battery output is not needed when EV outputs are collected live, it goes to the null device
+    # as the scenario configs already turn it on
+    sumoCmd = [config['sumoBinary'], "-c", config['sumocfg'],
+               "--tripinfo-output", os.path.join(outputDir, "tripinfo.xml"),
+               "--battery-output", os.devnull if options.livemetrics else os.path.join(outputDir, "battery.out.xml"),
+               "--summary-output", os.path.join(outputDir, "summary.xml"),
+               "--additional-files", config['additionalFile'],
+               "--chargingstations-output", os.path.join(outputDir, "chargingstations.xml"),
+               "--no-warnings", "--seed", str(seed)]
+
+    if config.get('generateTrips') != None:
+        sumoCmd += ["--route-files", config['generateTrips'](seed, outputDir)]
+
+    logger.info('Evaluating %s', getScenarioName(scenario))
+    traci.start(sumoCmd, label=getScenarioName(scenario))
+
+    main.run(netFile=config['netFile'], additionalFile=config['additionalFile'], options=options,
+             batteryCapacity=scenario['batteryCapacity'], paramType=scenario['paramType'], seed=seed,
+             outputDir=outputDir)
+
+    open(os.path.join(outputDir, 'done'), 'w').close()
+
+    return scenario
+
+# Runs every scenario not yet complete over options.jobs worker processes then merges the outputs
+def runSweep(config, options, paramTypes, batterys):
+    scenarios = buildScenarios(paramTypes, batterys, options.c)
+
+    # Every scenario also scores its charging decisions with all the swept weightings at once, so
+    # they can be compared on the same decisions even though their simulations drift apart
+    if options.compareprofiles == '':
+        options.compareprofiles = ','.join(paramTypes)
+
+    if not options.resume:
+        shutil.rmtree(sweepDir, ignore_errors=True)
+
+    pending = [scenario for scenario in scenarios if not isComplete(scenario)]
+    failed = []
+
+    logger.info('Sweep: %s of %s scenarios already complete', len(scenarios) - len(pending), len(scenarios))
+
+    if options.jobs <= 1:
+        for scenario in pending:
+            try:
+                runScenario(scenario, config, options)
+            except Exception:
+                traceback.print_exc()
+                failed.append(scenario)
+    else:
+        with ProcessPoolExecutor(max_workers=options.jobs, initializer=main.configureLogging, initargs=(options,)) as executor:
+            futures = {executor.submit(runScenario, scenario, config, options): scenario for scenario in pending}
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    traceback.print_exc()
+                    failed.append(futures[future])
+
+    for scenario in failed:
+        logger.error('Scenario failed, rerun with --resume to retry: %s', getScenarioName(scenario))
+
+    mergeOutputs(scenarios)
+
+# Writes the EV outputs and profile picks of every complete scenario into data/EV_Outputs.csv
+# and data/Profile_Picks.csv in scenario order
+def mergeOutputs(scenarios):
+    mergeOutput(scenarios, 'EV_Outputs.csv')
+    mergeOutput(scenarios, 'Profile_Picks.csv')
+
+def mergeOutput(scenarios, fileName):
+    header = None
+    rows = []
+
+    for scenario in scenarios:
+        scenarioFile = os.path.join(getScenarioDir(scenario), fileName)
+
+        if not isComplete(scenario) or not os.path.exists(scenarioFile):
+            continue
+
+        with open(scenarioFile, 'r') as f:
+            lines = f.readlines()
+
+        if len(lines) > 0:
+            header = lines[0]
+            rows += lines[1:]
+
+    with open(os.path.join('data', fileName), 'w') as csv:
+        if header != None:
+            csv.write(header)
+            csv.writelines(rows)
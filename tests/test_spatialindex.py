@@ -0,0 +1,91 @@
+# Checks the charging station grid index against the per station distance functions the router
+# used before it, on random stations and lines. Run from the repository root with
+# python -m unittest discover tests
+import os
+import sys
+import math
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if 'SUMO_HOME' not in os.environ:
+    raise unittest.SkipTest("please declare environment variable 'SUMO_HOME'")
+
+import numpy as np
+from algorithm.SpatialIndex import ChargingStationIndex
+from algorithm.Router import distanceFromLine, euclideanDistance
+
+class Station:
+    def __init__(self, x, y):
+        self.X = x
+        self.Y = y
+
+class ChargingStationIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.Stations = [Station(rng.uniform(0, 5000), rng.uniform(0, 5000)) for i in range(300)]
+        self.Index = ChargingStationIndex(self.Stations)
+        self.Lines = [((rng.uniform(-500, 5500), rng.uniform(-500, 5500)), (rng.uniform(-500, 5500), rng.uniform(-500, 5500))) for i in range(50)]
+
+        # Lines of no length and along the axes
+        self.Lines += [((1000.0, 1000.0), (1000.0, 1000.0)), ((0.0, 2500.0), (5000.0, 2500.0)), ((2500.0, 0.0), (2500.0, 5000.0))]
+
+    def corridor(self, lineA, lineB, width):
+        lineDistance = euclideanDistance(lineA, lineB)
+        stations = []
+
+        for i, cs in enumerate(self.Stations):
+            distance = distanceFromLine(lineA, lineB, [cs.X, cs.Y], lineDistance)
+
+            if lineDistance == 0:
+                inCorridor = euclideanDistance(lineA, [cs.X, cs.Y]) <= width
+            else:
+                along = ((cs.X - lineA[0]) * (lineB[0] - lineA[0]) + (cs.Y - lineA[1]) * (lineB[1] - lineA[1])) / lineDistance
+                inCorridor = distance <= width and -width <= along <= lineDistance + width
+
+            if inCorridor:
+                stations.append((i, distance))
+
+        return stations
+
+    def test_distances_match_distance_from_line(self):
+        for lineA, lineB in self.Lines:
+            stations, distances = self.Index.corridorQuery(lineA, lineB)
+            lineDistance = euclideanDistance(lineA, lineB)
+
+            self.assertEqual(stations.tolist(), list(range(len(self.Stations))))
+            self.assertEqual(distances.tolist(), [distanceFromLine(lineA, lineB, [cs.X, cs.Y], lineDistance) for cs in self.Stations])
+
+    def test_corridor_matches_linear_scan(self):
+        for lineA, lineB in self.Lines:
+            for width in [0, 50, 400, 2000]:
+                stations, distances = self.Index.corridorQuery(lineA, lineB, width)
+                expected = self.corridor(lineA, lineB, width)
+
+                self.assertEqual(stations.tolist(), [i for i, distance in expected])
+                np.testing.assert_allclose(distances, [distance for i, distance in expected], rtol=1e-12)
+
+    def test_given_stations_keep_their_order(self):
+        lineA, lineB = self.Lines[0]
+        given = np.array([250, 3, 17, 120], dtype=np.int64)
+        stations, distances = self.Index.corridorQuery(lineA, lineB, stations=given)
+        lineDistance = euclideanDistance(lineA, lineB)
+
+        self.assertEqual(stations.tolist(), given.tolist())
+        self.assertEqual(distances.tolist(), [distanceFromLine(lineA, lineB, [self.Stations[i].X, self.Stations[i].Y], lineDistance) for i in given])
+
+    def test_radius_matches_linear_scan(self):
+        rng = random.Random(1)
+
+        for i in range(50):
+            coords = (rng.uniform(-500, 5500), rng.uniform(-500, 5500))
+            radius = rng.uniform(0, 3000)
+            stations, distances = self.Index.radiusQuery(coords, radius)
+            expected = [j for j, cs in enumerate(self.Stations) if (cs.X - coords[0]) ** 2 + (cs.Y - coords[1]) ** 2 <= radius ** 2]
+
+            self.assertEqual(stations.tolist(), expected)
+            np.testing.assert_allclose(distances, [euclideanDistance(coords, [self.Stations[j].X, self.Stations[j].Y]) for j in expected])
+
+if __name__ == '__main__':
+    unittest.main()
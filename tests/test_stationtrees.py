@@ -0,0 +1,113 @@
+# Checks the station trees repaired on each speed refresh against trees built from scratch with
+# the same speeds, on a random grid. Run from the repository root with
+# python -m unittest discover tests
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if 'SUMO_HOME' not in os.environ:
+    raise unittest.SkipTest("please declare environment variable 'SUMO_HOME'")
+
+import numpy as np
+from algorithm.CompactGraph import CompactGraph
+from algorithm.StationTrees import StationTrees
+
+MAX_SPEED = 13.89
+
+class Station:
+    def __init__(self, id, lane):
+        self.id = id
+        self.Lane = lane
+
+# Stands in for EdgeSpeedSnapshot, with the speeds of every edge and a version per change
+class Speeds:
+    def __init__(self, edgeIDs):
+        self.EdgeIndex = {edge: i for i, edge in enumerate(edgeIDs)}
+        self.Speeds = np.full(len(edgeIDs), MAX_SPEED)
+        self.Version = 0
+
+class StationTreesTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        size = 15
+        nodeIDs = [str(x) + '_' + str(y) for x in range(size) for y in range(size)]
+        nodeCoords = [(x * 100.0, y * 100.0) for x in range(size) for y in range(size)]
+        nodeNeighbours = {}
+
+        for x in range(size):
+            for y in range(size):
+                for nx, ny in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]:
+                    if 0 <= nx < size and 0 <= ny < size and rng.random() < 0.9:
+                        nodeNeighbours.setdefault(str(x) + '_' + str(y), []).append({
+                            'Neighbour': str(nx) + '_' + str(ny),
+                            'ConnectingEdge': 'e' + str(x) + '_' + str(y) + '_' + str(nx) + '_' + str(ny),
+                            'Length': rng.uniform(50, 100)
+                        })
+
+        self.Compact = CompactGraph(nodeIDs, nodeCoords, nodeNeighbours, {})
+        self.Stations = [Station('cs' + str(i), edge) for i, edge in enumerate(rng.sample(self.Compact.EdgeIDs, 8))]
+        self.Random = rng
+
+    def rebuild(self, speeds):
+        trees = StationTrees(self.Compact, self.Stations, MAX_SPEED)
+        trees.refresh(speeds)
+
+        for station in range(trees.Count):
+            trees.build(station, trees.Trees)
+
+        return trees.Trees
+
+    def assertTreesMatch(self, trees, expected):
+        np.testing.assert_array_equal(trees.Time, expected.Time)
+        reachable = np.isfinite(expected.Time)
+
+        for station in range(len(self.Stations)):
+            nextEdge = trees.NextEdge[station]
+            tree = nextEdge[nextEdge >= 0]
+
+            # Every reachable node but the root has a next edge, and only those edges are in the tree
+            self.assertEqual(len(tree), np.count_nonzero(reachable[station]) - 1)
+            self.assertEqual(sorted(np.flatnonzero(trees.InTree[station]).tolist()), sorted(tree.tolist()))
+
+            # Distances are those of the route along the tree. They can differ from the rebuild's, as
+            # stopped edges cost no time and give nodes several equally quick ways
+            for node in np.flatnonzero(nextEdge >= 0).tolist():
+                edge = int(nextEdge[node])
+                target = self.Compact.TargetList[edge]
+                self.assertEqual(trees.Distance[station, node], trees.Distance[station, target] + self.Compact.LengthList[edge])
+
+    def test_repairs_match_rebuilds(self):
+        speeds = Speeds(self.Compact.EdgeIDs)
+        trees = StationTrees(self.Compact, self.Stations, MAX_SPEED)
+
+        for version in range(1, 40):
+            # A few edges change speed at a time, some stopping altogether
+            for edge in self.Random.sample(range(self.Compact.EdgeCount), 20):
+                speeds.Speeds[edge] = self.Random.choice([0, self.Random.uniform(1, MAX_SPEED)])
+
+            speeds.Version = version
+            trees.refresh(speeds)
+
+            self.assertTreesMatch(trees.Trees, self.rebuild(speeds))
+
+        self.assertGreater(trees.Repairs, 0)
+
+    def test_refresh_keeps_older_trees(self):
+        speeds = Speeds(self.Compact.EdgeIDs)
+        trees = StationTrees(self.Compact, self.Stations, MAX_SPEED)
+        before = trees.Trees
+        times = before.Time.copy()
+
+        speeds.Speeds[:] = MAX_SPEED / 2
+        speeds.Version = 1
+        trees.refresh(speeds)
+
+        self.assertIsNot(trees.Trees, before)
+        np.testing.assert_array_equal(before.Time, times)
+        np.testing.assert_array_equal(trees.Trees.Time, self.rebuild(speeds).Time)
+
+if __name__ == '__main__':
+    unittest.main()